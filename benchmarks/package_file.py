@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""Benchmarks loading and writing a large package file.
+
+Compares the pure Python YAML loader/dumper with libyaml, and loading the
+cached parse of the package file.
+
+Usage:
+    python benchmarks/package_file.py [<number of packages>]
+"""
+
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from os import path, chdir
+import sys
+import yaml
+from loguru import logger
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+from gitget.commands._base import Base, SafeLoader, SafeDumper  # noqa: E402
+
+
+def generate_package_document(number_of_packages):
+    """Returns a package document with synthetic packages."""
+    packages = {}
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    for i in range(number_of_packages):
+        name = f"owner{i % 97}_repo{i}"
+        packages[name] = {
+            "name": name,
+            "path": f"/home/user/src/{name}",
+            "owner": f"owner{i % 97}",
+            "repo": f"repo{i}",
+            "url": f"https://github.com/owner{i % 97}/repo{i}",
+            "description": f"Synthetic repository number {i} used for benchmarking",
+            "homepage": None if i % 3 else f"https://repo{i}.example.com",
+            "languages": ["Python"] if i % 2 else ["Rust"],
+            "size_kb": i * 13 % 100000,
+            "stars": i * 7 % 5000,
+            "watchers": i % 50,
+            "forks": i % 300,
+            "topics": ["cli", "git"] if i % 4 else [],
+            "license": {"name": "MIT License", "key": "MIT", "url": "https://api.github.com/licenses/mit"} if i % 5 else None,
+            "created_at": start + timedelta(hours=i),
+            "updated_at": start + timedelta(hours=2 * i),
+            "last_commit_at": start + timedelta(hours=3 * i),
+        }
+    return {"packages": packages, "configuration": {"version": "4.0.7", "options": {}}}
+
+
+def measure(function, repeat=3):
+    """Returns the best time of a few runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    logger.remove()
+    number_of_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    package_document = generate_package_document(number_of_packages)
+
+    with TemporaryDirectory() as directory:
+        chdir(directory)
+        filepath = path.join(directory, ".gitget.yaml")
+
+        def dump_pure():
+            with open(filepath, "w") as file:
+                yaml.dump(package_document, file, sort_keys=True, default_flow_style=False)
+
+        def dump_libyaml():
+            with open(filepath, "w") as file:
+                yaml.dump(package_document, file, Dumper=SafeDumper, sort_keys=True, default_flow_style=False)
+
+        def load_pure():
+            with open(filepath) as file:
+                return yaml.safe_load(file)
+
+        def load_libyaml():
+            with open(filepath) as file:
+                return yaml.load(file, Loader=SafeLoader)
+
+        dump_pure()
+        with open(filepath) as file:
+            pure_output = file.read()
+        dump_libyaml()
+        with open(filepath) as file:
+            libyaml_output = file.read()
+        assert pure_output == libyaml_output, "libyaml output differs from the pure Python output"
+        assert load_pure() == load_libyaml() == package_document
+
+        Base.write_package_document_cache(filepath, package_document)
+        assert Base.load_package_document(filepath) == package_document
+
+        results = [
+            ("write (pure Python yaml.dump)", measure(dump_pure)),
+            (f"write ({SafeDumper.__name__})", measure(dump_libyaml)),
+            ("load (pure Python yaml.safe_load)", measure(load_pure)),
+            (f"load ({SafeLoader.__name__})", measure(load_libyaml)),
+            ("load (cached parse)", measure(lambda: Base.load_package_document(filepath))),
+        ]
+
+    print(f"{number_of_packages} packages ({len(pure_output) / 1024 / 1024:.1f} MiB package file)")
+    for description, seconds in results:
+        print(f"  {description:<36} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""Checks how long gitget takes to start up for commands that don't use the APIs.
+
+Runs `python -X importtime` for the imports of `gitget list` and
+`gitget config`, and fails (exit status 1) if either of them imports one of
+the API client libraries or takes longer than the budget.
+
+Usage:
+    python benchmarks/startup.py [<budget in milliseconds>]
+"""
+
+from os import path, environ
+import subprocess
+import sys
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+# modules that must only be imported by commands that talk to GitHub/GitLab or run git
+HEAVY_MODULES = ("github", "gitlab", "git", "requests", "semver")
+
+
+def measure_imports(command_name):
+    """Returns the import times (in microseconds) of the modules imported to run a command, by module name."""
+    code = f"import gitget.cli; from gitget.commands import get_command_class; get_command_class({command_name!r})"
+    environment = dict(environ, PYTHONPATH=ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = (int(cumulative), not name.startswith("  "))
+    return imports
+
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    failed = False
+    for command_name in ("list", "config"):
+        # take the best of a few runs, the first one also pays for writing bytecode
+        best_ms = None
+        for _ in range(3):
+            imports = measure_imports(command_name)
+            total_ms = sum(cumulative for cumulative, top_level in imports.values() if top_level) / 1000
+            best_ms = total_ms if best_ms is None else min(best_ms, total_ms)
+
+        heavy_modules = [name for name in HEAVY_MODULES if name in imports]
+        print(f"gitget {command_name}: {best_ms:.1f} ms of imports (budget: {budget_ms:.0f} ms)")
+        if heavy_modules:
+            print(f"  imports {', '.join(heavy_modules)}, which should only be loaded on first use")
+            failed = True
+        if best_ms > budget_ms:
+            print("  over budget, the slowest imports:")
+            slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)
+            for name, (cumulative, top_level) in [item for item in slowest if item[1][1]][:5]:
+                print(f"    {name:<30} {cumulative / 1000:8.1f} ms")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
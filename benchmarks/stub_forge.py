@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+"""A local stand-in for the GitHub and GitLab APIs, so gitget can be benchmarked offline.
+
+Serves the endpoints gitget uses: GitHub's REST repository and gist
+lookups and its GraphQL API, GitLab's project, languages and user
+lookups and its GraphQL API, and HEAD requests for the reachability probe. Every repository
+exists (except ones named `missing`), responses carry ETags and rate limit
+headers, and conditional requests get a 304.
+
+Point gitget at it with `--github-api-url=<url> --gitlab-url=<url>`; packages
+with URLs on the same host and port are then looked up there. Run two
+servers to have both GitHub and GitLab packages.
+
+`check` verifies that gitget gets the same information for a GitLab project
+through the GraphQL API as through the REST API, license included.
+
+Usage:
+    python benchmarks/stub_forge.py [<port>]
+    python benchmarks/stub_forge.py check
+"""
+
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from urllib.parse import unquote, urlparse
+import json
+import re
+import sys
+import time
+import zlib
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+TIMESTAMPS = {
+    "created": "2020-01-01T00:00:00Z",
+    "updated": "2021-01-01T00:00:00Z",
+    "pushed": "2022-01-01T00:00:00Z",
+}
+
+
+class StubForgeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, code, document, headers=None):
+        body = json.dumps(document).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_not_modified(self, etag):
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def rate_limit_headers(self, prefix):
+        return {
+            f"{prefix}Remaining": "4999",
+            f"{prefix}Limit": "5000",
+            f"{prefix}Reset": str(int(time.time()) + 3600),
+        }
+
+    def do_HEAD(self):
+        self.server.count("head")
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        url_path = urlparse(self.path).path
+
+        match = re.fullmatch(r"/api/v4/projects/([^/]+)(/languages)?", url_path)
+        if match:
+            project = unquote(match.group(1))
+            if match.group(2):
+                self.server.count("gitlab-languages")
+                return self.send_json(200, {"Python": 80.0, "C": 20.0}, self.rate_limit_headers("RateLimit-"))
+            self.server.count("gitlab-project")
+            if project.endswith("/missing"):
+                return self.send_json(404, {"message": "404 Project Not Found"})
+            etag = f'W/"{project}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self.send_not_modified(etag)
+            return self.send_json(200, {
+                "id": zlib.crc32(project.encode()),
+                "path_with_namespace": project,
+                "description": f"Description of {project}",
+                "star_count": 4,
+                "forks_count": 1,
+                "topics": ["benchmark"],
+                "license": {"key": "mit", "name": "MIT License", "html_url": "http://choosealicense.com/licenses/mit/"},
+                "created_at": TIMESTAMPS["created"],
+                "updated_at": TIMESTAMPS["updated"],
+                "last_activity_at": TIMESTAMPS["pushed"],
+            }, dict(self.rate_limit_headers("RateLimit-"), ETag=etag))
+        if url_path == "/api/v4/user":
+            self.server.count("gitlab-user")
+            return self.send_json(200, {"id": 1, "username": "benchmark"})
+
+        match = re.fullmatch(r"/repos/([^/]+)/([^/]+)", url_path)
+        if match:
+            self.server.count("github-repo")
+            owner, repo = match.groups()
+            if repo == "missing":
+                return self.send_json(404, {"message": "Not Found"})
+            etag = f'"{owner}/{repo}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self.send_not_modified(etag)
+            return self.send_json(200, {
+                "name": repo,
+                "full_name": f"{owner}/{repo}",
+                "description": f"Description of {owner}/{repo}",
+                "homepage": "https://example.com",
+                "language": "Python",
+                "size": 123,
+                "stargazers_count": 5,
+                "subscribers_count": 2,
+                "forks_count": 3,
+                "topics": ["benchmark"],
+                "license": {"key": "mit", "name": "MIT License", "spdx_id": "MIT", "url": f"{self.server.url}/licenses/mit"},
+                "created_at": TIMESTAMPS["created"],
+                "updated_at": TIMESTAMPS["updated"],
+                "pushed_at": TIMESTAMPS["pushed"],
+            }, dict(self.rate_limit_headers("X-RateLimit-"), ETag=etag))
+
+        match = re.fullmatch(r"/gists/([^/]+)", url_path)
+        if match:
+            self.server.count("github-gist")
+            return self.send_json(200, {
+                "description": f"Gist {match.group(1)}",
+                "forks": [],
+                "created_at": TIMESTAMPS["created"],
+                "updated_at": TIMESTAMPS["updated"],
+            }, self.rate_limit_headers("X-RateLimit-"))
+
+        self.server.count("not-found")
+        self.send_json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        document = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        url_path = urlparse(self.path).path
+        if url_path == "/api/graphql":
+            return self.send_gitlab_graphql(document)
+        if url_path != "/graphql":
+            self.server.count("not-found")
+            return self.send_json(404, {"message": "Not Found"})
+        self.server.count("github-graphql")
+        variables = document.get("variables", {})
+        data = {}
+        errors = []
+        index = 0
+        while f"o{index}" in variables:
+            owner, repo = variables[f"o{index}"], variables[f"n{index}"]
+            if repo == "missing":
+                data[f"r{index}"] = None
+                errors.append({"message": f"Could not resolve to a Repository with the name '{owner}/{repo}'.", "path": [f"r{index}"]})
+            else:
+                data[f"r{index}"] = {
+                    "nameWithOwner": f"{owner}/{repo}",
+                    "description": f"Description of {owner}/{repo}",
+                    "homepageUrl": "https://example.com",
+                    "primaryLanguage": {"name": "Python"},
+                    "diskUsage": 123,
+                    "stargazerCount": 5,
+                    "watchers": {"totalCount": 2},
+                    "forkCount": 3,
+                    "repositoryTopics": {"nodes": [{"topic": {"name": "benchmark"}}]},
+                    "licenseInfo": {"key": "mit", "name": "MIT License", "spdxId": "MIT"},
+                    "createdAt": TIMESTAMPS["created"],
+                    "updatedAt": TIMESTAMPS["updated"],
+                    "pushedAt": TIMESTAMPS["pushed"],
+                }
+            index += 1
+        response = {"data": data}
+        if errors:
+            response["errors"] = errors
+        self.send_json(200, response, self.rate_limit_headers("X-RateLimit-"))
+
+    def send_gitlab_graphql(self, document):
+        """Answers a `projects(fullPaths:)` query with the same projects as the REST API; missing ones are left out."""
+        self.server.count("gitlab-graphql")
+        nodes = [
+            {
+                "fullPath": project,
+                "description": f"Description of {project}",
+                "starCount": 4,
+                "forksCount": 1,
+                "topics": ["benchmark"],
+                "languages": [{"name": "C", "share": 20.0}, {"name": "Python", "share": 80.0}],
+                "createdAt": TIMESTAMPS["created"],
+                "updatedAt": TIMESTAMPS["updated"],
+                "lastActivityAt": TIMESTAMPS["pushed"],
+            }
+            for project in document.get("variables", {}).get("fullPaths") or []
+            if not project.endswith("/missing")
+        ]
+        self.send_json(200, {"data": {"projects": {"nodes": nodes}}}, self.rate_limit_headers("RateLimit-"))
+
+
+class StubForge(ThreadingHTTPServer):
+    """The stub API server. Counts the requests it gets by endpoint."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), StubForgeHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.requests = Counter()
+        self.lock = Lock()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] += 1
+
+    def take_counts(self):
+        """Returns the requests counted so far and starts counting again."""
+        with self.lock:
+            requests = dict(self.requests)
+            self.requests.clear()
+        return requests
+
+    def start(self):
+        """Serves requests on a background thread."""
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def check_gitlab_graphql():
+    """Compares the information for a GitLab project fetched with the REST API and then with the GraphQL API.
+
+    The GraphQL API has no licenses, so the license has to come from the
+    information the REST API cached. Returns whether they're the same.
+    """
+    sys.path.insert(0, ROOT)
+    from gitget.commands._base import Base
+
+    server = StubForge().start()
+    options = {"--gitlab-url": server.url, "--gitlab-auth-token": None, "--metadata-ttl": None, "--rate-limit": None}
+    url = f"{server.url}/benchmark/project"
+    with TemporaryDirectory() as directory:
+        command = Base(options)
+        command.package_list_filepath = path.join(directory, ".gitget.yaml")
+        rest_metadata = command.get_gitlab_repo_metadata(url)
+        rest_requests = server.take_counts()
+        # fetched before, so its information is refreshed through GraphQL
+        command.prefetch_packages_for_urls([url])
+        graphql_metadata = command.get_gitlab_repo_metadata(url)
+        graphql_requests = server.take_counts()
+        command.close_clients()
+    print(f"REST requests: {rest_requests}, GraphQL requests: {graphql_requests}")
+    if graphql_requests != {"gitlab-graphql": 1}:
+        print("The project wasn't fetched with a single GraphQL request")
+        return False
+    if graphql_metadata != rest_metadata:
+        for field in sorted(set(rest_metadata) | set(graphql_metadata)):
+            if rest_metadata.get(field) != graphql_metadata.get(field):
+                print(f"{field}: {rest_metadata.get(field)!r} (REST) != {graphql_metadata.get(field)!r} (GraphQL)")
+        return False
+    print("The GraphQL and REST APIs give the same package information")
+    return True
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["check"]:
+        sys.exit(0 if check_gitlab_graphql() else 1)
+    server = StubForge(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    print(f"Serving the stub GitHub/GitLab API at {server.url}")
+    server.serve_forever()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""Times gitget commands end to end and by phase, without touching the network.
+
+Synthetic package files of each size are listed. Local bare repositories
+with a history of `--commits` commits stand in for `--repos` remote
+repositories, which are installed in a batch, updated (with and without
+new commits), listed and tracked again. Package information comes from
+two stub API servers (one GitHub, one GitLab, see stub_forge.py); git is
+pointed at the local repositories through `url.<base>.insteadOf` in a
+throwaway git configuration.
+
+Every command runs in its own process, with `--trace`. The report holds
+the time of each run, the time spent in each phase of the fastest run
+(added up over every span of the trace with the same name) and the number
+of API requests made, and can be compared with a report made on another
+commit. Run it from the root of the repository with `python benchmarks/suite.py`.
+
+Usage:
+    suite.py [--sizes=<sizes>] [--repos=<n>] [--commits=<n>] [--jobs=<n>] [--repeat=<n>] [--output=<file>]
+    suite.py compare <old_report> <new_report>
+
+Options:
+    --sizes=<sizes>   Sizes of the synthetic package files, comma separated [default: 100,1000,10000]
+    --repos=<n>       Number of local repositories to install and update [default: 50]
+    --commits=<n>     Number of commits in each repository's history [default: 20]
+    --jobs=<n>        Value of `--jobs` for install and update [default: 8]
+    --repeat=<n>      Runs of each command that doesn't change anything [default: 3]
+    --output=<file>   Where to write the report [default: benchmark-report.json]
+"""
+
+from datetime import datetime, timezone
+from statistics import median
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from os import path, environ, makedirs, remove
+from shutil import rmtree
+import json
+import platform
+import subprocess
+import sys
+import yaml
+from docopt import docopt
+
+BENCHMARKS_DIR = path.dirname(path.abspath(__file__))
+ROOT = path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, ROOT)
+from gitget.version import __version__  # noqa: E402
+from package_file import generate_package_document  # noqa: E402
+from stub_forge import StubForge  # noqa: E402
+
+class Benchmark(object):
+    def __init__(self, arguments, directory):
+        self.sizes = [int(size) for size in arguments["--sizes"].split(",") if size]
+        self.repos = int(arguments["--repos"])
+        self.commits = int(arguments["--commits"])
+        self.jobs = int(arguments["--jobs"])
+        self.repeat = int(arguments["--repeat"])
+        self.directory = directory
+        self.github = StubForge().start()
+        self.gitlab = StubForge().start()
+        self.results = []
+        self.environment = dict(
+            environ,
+            PYTHONPATH=ROOT,
+            GIT_CONFIG_GLOBAL=path.join(directory, "gitconfig"),
+            GIT_CONFIG_NOSYSTEM="1",
+            GIT_TERMINAL_PROMPT="0",
+        )
+
+    def git(self, *arguments, cwd=None, input=None):
+        return subprocess.run(["git", *arguments], cwd=cwd, env=self.environment, input=input, capture_output=True, check=True).stdout
+
+    def gitget(self, name, command, arguments, cwd, packages, repeat=1):
+        """Runs a gitget command `repeat` times and records the results.
+
+        The phases of each run are read from the trace gitget writes with `--trace`.
+        """
+        trace_filepath = path.join(self.directory, "trace.json")
+        options = [
+            "--nocolor",
+            f"--github-api-url={self.github.url}",
+            f"--gitlab-url={self.gitlab.url}",
+            # the stub accepts any token, GitHub's GraphQL API needs one
+            "--github-auth-token=benchmark",
+            f"--trace={trace_filepath}",
+        ]
+        runs = []
+        for _ in range(repeat):
+            self.github.take_counts()
+            self.gitlab.take_counts()
+            started = perf_counter()
+            process = subprocess.run(
+                [sys.executable, "-m", "gitget.cli", *options, *arguments],
+                cwd=cwd,
+                env=self.environment,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            seconds = perf_counter() - started
+            phases = {}
+            with open(trace_filepath) as file:
+                for event in json.load(file)["traceEvents"]:
+                    if event["ph"] == "X":
+                        phase = phases.setdefault(event["name"], {"calls": 0, "seconds": 0.0})
+                        phase["calls"] += 1
+                        phase["seconds"] += event["dur"] / 1e6
+            requests = {f"github {endpoint}": count for endpoint, count in self.github.take_counts().items()}
+            requests.update({f"gitlab {endpoint}": count for endpoint, count in self.gitlab.take_counts().items()})
+            runs.append({"seconds": seconds, "phases": phases, "api_requests": requests, "exit_code": process.returncode})
+            if process.returncode != 0:
+                print(f"  {name} exited with {process.returncode}:\n{process.stderr[-2000:]}")
+
+        fastest = min(runs, key=lambda run: run["seconds"])
+        result = {
+            "name": name,
+            "command": command,
+            "packages": packages,
+            "seconds": fastest["seconds"],
+            "median_seconds": median(run["seconds"] for run in runs),
+            "runs": [run["seconds"] for run in runs],
+            "phases": fastest["phases"],
+            "api_requests": fastest["api_requests"],
+            "exit_code": max(run["exit_code"] for run in runs),
+        }
+        self.results.append(result)
+        slowest_phases = sorted(fastest["phases"].items(), key=lambda item: -item[1]["seconds"])[1:5]
+        phase_summary = ", ".join(f"{phase} {values['seconds']:.2f}s" for phase, values in slowest_phases)
+        print(f"{name:<32} {result['seconds']:8.2f}s  ({phase_summary})")
+        return result
+
+    def make_synthetic_workspace(self, size):
+        workspace = path.join(self.directory, f"synthetic-{size}")
+        makedirs(workspace)
+        package_document = generate_package_document(size)
+        package_document["configuration"]["version"] = __version__
+        with open(path.join(workspace, ".gitget.yaml"), "w") as file:
+            yaml.dump(package_document, file, sort_keys=True, default_flow_style=False)
+        return workspace
+
+    def make_remotes(self):
+        """Creates the bare repositories, all with the same history, and the git configuration pointing at them."""
+        remotes = path.join(self.directory, "remotes")
+        seed = path.join(remotes, "seed.git")
+        makedirs(remotes)
+        self.git("init", "--quiet", "--bare", "--initial-branch=main", seed)
+        stream = []
+        for commit in range(1, self.commits + 1):
+            content = f"Commit {commit}\n".encode()
+            stream.append(
+                f"commit refs/heads/main\ncommitter Benchmark <benchmark@example.com> {1600000000 + commit} +0000\n"
+                f"data {len(f'Commit {commit}')}\nCommit {commit}\n"
+                f"M 644 inline file{commit % 10}.txt\ndata {len(content)}\n"
+            )
+            stream.append(content.decode() + "\n")
+        self.git("fast-import", "--quiet", cwd=seed, input="".join(stream).encode())
+
+        urls = []
+        for number in range(self.repos):
+            provider, forge = ("github", self.github) if number % 2 == 0 else ("gitlab", self.gitlab)
+            remote = path.join(remotes, provider, "bench", f"repo{number}")
+            self.git("clone", "--quiet", "--bare", seed, remote)
+            urls.append((f"repo{number}", f"{forge.url}/bench/repo{number}", remote))
+
+        with open(self.environment["GIT_CONFIG_GLOBAL"], "w") as file:
+            file.write("[user]\n\tname = Benchmark\n\temail = benchmark@example.com\n")
+            file.write(f'[url "file://{remotes}/github/"]\n\tinsteadOf = {self.github.url}/\n')
+            file.write(f'[url "file://{remotes}/gitlab/"]\n\tinsteadOf = {self.gitlab.url}/\n')
+            file.write("[init]\n\tdefaultBranch = main\n")
+        return urls
+
+    def add_commit(self, remote):
+        """Adds a commit on top of a bare repository's main branch."""
+        tree = self.git("rev-parse", "main^{tree}", cwd=remote).decode().strip()
+        commit = self.git("commit-tree", tree, "-p", "main", "-m", "New commit", cwd=remote).decode().strip()
+        self.git("update-ref", "refs/heads/main", commit, cwd=remote)
+
+    def run(self):
+        for size in self.sizes:
+            workspace = self.make_synthetic_workspace(size)
+            self.gitget(f"list ({size} packages)", "list", ["--format=plain", "list"], workspace, size, self.repeat)
+            self.gitget(f"list jsonl ({size} packages)", "list", ["--format=jsonl", "list"], workspace, size, self.repeat)
+            self.gitget(f"list top 20 ({size} packages)", "list", ["--format=tsv-stream", "--filter=topics=cli", "--sort=-stars", "--limit=20", "list"], workspace, size, self.repeat)
+            self.gitget(f"config get ({size} packages)", "config", ["config", "get", "options"], workspace, size, self.repeat)
+            self.gitget(f"search index ({size} packages)", "search", ["--format=tsv-stream", "search", "benchmarking"], workspace, size)
+            self.gitget(f"search ({size} packages)", "search", ["--format=tsv-stream", "search", "topic:cli", "synth*"], workspace, size, self.repeat)
+
+        if self.repos:
+            print(f"Creating {self.repos} repositories with {self.commits} commits")
+            urls = self.make_remotes()
+            workspace = path.join(self.directory, "workspace")
+            makedirs(workspace)
+            subprocess.run([sys.executable, "-m", "gitget.cli", "setup"], cwd=workspace, env=self.environment, capture_output=True)
+            with open(path.join(workspace, "packages.txt"), "w") as file:
+                file.write("".join(f"{name}={url}\n" for name, url, _ in urls))
+
+            jobs = f"--jobs={self.jobs}"
+            self.gitget("install batch", "install", [jobs, "install", "batch", "packages.txt"], workspace, self.repos)
+            self.gitget("update (up to date)", "update", [jobs, "update"], workspace, self.repos, self.repeat)
+            for _, _, remote in urls[::2]:
+                self.add_commit(remote)
+            self.gitget("update (half changed)", "update", [jobs, "update"], workspace, self.repos)
+            self.gitget("update (always pull)", "update", [jobs, "--always-pull", "update"], workspace, self.repos)
+            self.gitget("list (workspace)", "list", ["--format=plain", "list"], workspace, self.repos, self.repeat)
+
+            for filename in (".gitget.yaml", ".gitget.yaml.journal"):
+                if path.exists(path.join(workspace, filename)):
+                    remove(path.join(workspace, filename))
+            rmtree(path.join(workspace, ".gitget-cache"), ignore_errors=True)
+            subprocess.run([sys.executable, "-m", "gitget.cli", "setup"], cwd=workspace, env=self.environment, capture_output=True)
+            self.gitget("track", "track", [jobs, "track", "repo*"], workspace, self.repos)
+
+        self.github.shutdown()
+        self.gitlab.shutdown()
+
+    def report(self):
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except Exception:
+            commit = None
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "gitget_version": __version__,
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parameters": {"sizes": self.sizes, "repos": self.repos, "commits": self.commits, "jobs": self.jobs, "repeat": self.repeat},
+            "results": self.results,
+        }
+
+
+def compare(old_filepath, new_filepath):
+    """Prints how the time of each benchmark changed between two reports."""
+    with open(old_filepath) as file:
+        old_report = json.load(file)
+    with open(new_filepath) as file:
+        new_report = json.load(file)
+    print(f"{'':<32} {(old_report['commit'] or 'old')[:10]:>10} {(new_report['commit'] or 'new')[:10]:>10}")
+    old_results = {result["name"]: result for result in old_report["results"]}
+    for result in new_report["results"]:
+        old_result = old_results.get(result["name"])
+        if old_result is None:
+            print(f"{result['name']:<32} {'-':>10} {result['seconds']:9.2f}s")
+            continue
+        change = result["seconds"] / old_result["seconds"] - 1
+        print(f"{result['name']:<32} {old_result['seconds']:9.2f}s {result['seconds']:9.2f}s {change:+8.1%}")
+
+
+def main():
+    arguments = docopt(__doc__)
+    if arguments["compare"]:
+        compare(arguments["<old_report>"], arguments["<new_report>"])
+        return
+    with TemporaryDirectory() as directory:
+        benchmark = Benchmark(arguments, directory)
+        benchmark.run()
+        report = benchmark.report()
+    with open(arguments["--output"], "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {arguments['--output']}")
+
+
+if __name__ == "__main__":
+    main()
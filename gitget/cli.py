@@ -5,16 +5,20 @@
 Package manager for git repositories.
 
 Usage:
-    gitget [options] install (batch <file_name> | <package_url> [<package_name>])
-    gitget [options] track <package_path>
+    gitget [options] [--all-workspaces] install batch <file_name>
+    gitget [options] install <package_url> [<package_name>]
+    gitget [options] [--recursive] [--exclude=<pattern>]... track <package_path>
     gitget [options] untrack <package_name>
+    gitget [options] [--all] dissociate [<package_names>...]
+    gitget [options] [--interval=<hours>] maintain [<package_names>...]
     gitget [options] [--soft] remove <package_name>
-    gitget [options] update
+    gitget [options] [--all-workspaces] [--always-pull] [--metadata=<policy>] [--metadata-max-age=<hours>] update
     gitget [options] move <package_name> <location>
     gitget [options] rename <package_name> <new_name>
-    gitget [options] [--format=<tabulate-format>] [--no-wrap] [--width=<table width>] list
+    gitget [options] [--all-workspaces] [--format=<tabulate-format>] [--no-wrap] [--width=<table width>] [--filter=<expression>]... [--sort=<field>] [--limit=<n>] list
+    gitget [options] [--format=<tabulate-format>] [--limit=<n>] search <query>...
     gitget [options] edit
-    gitget [options] doctor
+    gitget [options] [--all-workspaces] [--deep] doctor
     gitget [options] setup
     gitget [options] config (list | get <key> | set <key> <value> | unset <key>)
     gitget help <command>
@@ -30,18 +34,81 @@ Options:
                Additional arguments to pass to git pull commands
     --github-auth-token=<auth-token>
                Auth token to use for authenticating with the GitHub API
+    --github-api-url=<url>
+               Base URL of the GitHub API (default: https://api.github.com)
     --gitlab-auth-token=<auth-token>
                Auth token to use for authenticating with the GitLab API
+    --gitlab-url=<url>
+               Base URL of the GitLab instance (default: https://gitlab.com)
+    --jobs=<n>  Number of packages to process concurrently (default: 1)
+    --probe-jobs=<n>
+               Number of repository hosts to check at the same time when
+               installing a batch (default: 4)
+    --metadata-jobs=<n>
+               Number of packages to get information about at the same time
+               when installing a batch or updating (default: 4)
+    --rate-limit=<policy>
+               What to do when an API rate limit is used up: `wait` until it
+               resets, or `defer` refreshing package information (default: wait)
+    --metadata-ttl=<seconds>
+               Reuse cached package information fetched less than this long ago
+               without contacting the API (default: 0, always revalidate)
+    --recursive
+               Tracks every repository found under the path given to `track`
+    --exclude=<pattern>
+               Directories to skip when tracking recursively, matched against
+               their name or their path relative to the root (can be repeated)
+    --defer-metadata
+               Tracks packages (or migrates an old package file) without
+               fetching their information from the API, it is then fetched
+               by the next `update`
+    --deep     Also checks the repositories of the packages with `doctor`
+    --object-cache=<directory>
+               Clones (and pulls) through bare mirrors in a shared directory,
+               borrowing their objects instead of downloading them again
+    --all      Dissociates every package borrowing objects with `dissociate`
+    --interval=<hours>
+               Skips packages maintained less than this long ago with
+               `maintain`, 0 maintains every package (default: 24)
+    --always-pull
+               Pull every package, even if `git ls-remote` shows it is up to date
+    --metadata=<policy>
+               When `update` refreshes package information from the API:
+               `never`, `stale` or `always` (default: stale)
+    --metadata-max-age=<hours>
+               How old package information is before it is stale and
+               refreshed by `update` (default: 24)
+    --all-workspaces
+               Runs `update`, `list`, `doctor` or `install batch` on every
+               workspace gitget has used (see ~/.gitget-workspaces.yaml) at once
+    --timings  Prints how long each phase of the command took when it ends
+    --trace=<file>
+               Writes the timings of each phase (and package) to a trace file,
+               which can be opened in chrome://tracing or Perfetto
+    --profile=<file>
+               Profiles the command (on the main thread) with cProfile and
+               writes the stats to a file, see `python -m pstats <file>`
     --format=<tabluate-format>
-               Table format to pass to tabulate (default: mixed_grid)
+               Table format to pass to tabulate (default: mixed_grid), or
+               jsonl, tsv-stream or csv to stream one package per line
     --no-wrap  Do not wrap lines in the table
     --width=<table width>
                Width of the table (default: 188)
+    --filter=<expression>
+               Only lists packages matching an expression like `topics=cli`,
+               `license~mit` or `stars>=100` (can be repeated)
+    --sort=<field>
+               Field to sort the listed packages by, prefixed with `-` for
+               descending order, e.g. `-stars` or `last_commit_at`
+    --limit=<n>
+               Maximum number of packages to list, or of search results
+               (default: 20 for search)
 
 Examples:
     gitget setup
     gitget config set editor vim
     gitget config set "--git-clone-args" "--recurse-submodules --jobs 8"
+    gitget config set "--jobs" 8
     gitget install awesmubarak/git-get
     gitget remove awesmubarak_git-get
     gitget install awesmubarak/git-get
@@ -53,10 +120,20 @@ Examples:
     gitget track dev/my-git-get
     gitget remove dev/my-git-get
     gitget track dev/*
+    gitget --recursive --exclude=node_modules --exclude='archive/*' track ~/src
     gitget list
     gitget untrack dev/my-git-get
     gitget --format tsv list
+    gitget --filter topics=cli --sort=-stars --limit 20 list
+    gitget search topic:rust parser
     gitget update
+    gitget --metadata never update
+    gitget config set "--object-cache" ~/.cache/gitget-objects
+    gitget --all dissociate
+    gitget maintain
+    gitget --deep doctor
+    gitget --all-workspaces --jobs 16 update
+    gitget --timings --trace=update.json update
 
 Help:
     For help using this tool, please open an issue on the GitHub repository:
@@ -64,22 +141,25 @@ Help:
 
 """
 
-from . import commands
+from .commands import COMMANDS, get_command_class
+from .commands._progress import write_log
+from .commands._timings import timings
 from .version import __version__
 from docopt import docopt
-from inspect import getmembers, isclass
 from loguru import logger
-from sys import stderr
 
 
 def setup_logging(debug_level, colorize):
-    """Sets up the format for logging, based on the debug level (info/dbug)."""
+    """Sets up the format for logging, based on the debug level (info/dbug).
+
+    Logs go to standard error, above the progress of git commands while it's shown.
+    """
     logger.remove()
 
     if debug_level == "info":
         logger_format = "<green>{time:HH:mm:ss}</green> <level>{message}</level>"
         logger.add(
-            stderr,
+            write_log,
             colorize=colorize,
             format=logger_format,
             level="INFO",
@@ -89,7 +169,7 @@ def setup_logging(debug_level, colorize):
     else:
         logger_format = "<green>{time:HH:mm:ss}</green> {file: <12} <level>{level: <8} {message}</level>"
         logger.add(
-            stderr,
+            write_log,
             colorize=colorize,
             format=logger_format,
             level="DEBUG",
@@ -108,32 +188,41 @@ def main():
     colorize = False if arguments["--nocolor"] else True
     setup_logging(debug_level, colorize)
 
+    if arguments["--timings"] or arguments["--trace"]:
+        timings.enable()
+    profiler = None
+    if arguments["--profile"]:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     # call the right command, based on the argument
     logger.debug("Calling the function based on the command sent")
-    if arguments["doctor"]:
-        commands.doctor.Doctor(arguments).run()
-    elif arguments["config"]:
-        commands.config.Config(arguments).run()
-    elif arguments["edit"]:
-        commands.edit.Edit(arguments).run()
-    elif arguments["install"]:
-        commands.install.Install(arguments).run()
-    elif arguments["track"]:
-        commands.track.Track(arguments).run()
-    elif arguments["untrack"]:
-        commands.untrack.Untrack(arguments).run()
-    elif arguments["list"]:
-        commands.list.List(arguments).run()
-    elif arguments["move"]:
-        commands.move.Move(arguments).run()
-    elif arguments["remove"]:
-        commands.remove.Remove(arguments).run()
-    elif arguments["setup"]:
-        commands.setup.Setup(arguments).run()
-    elif arguments["update"]:
-        commands.update.Update(arguments).run()
-    elif arguments["help"]:
-        commands.help.Help(arguments).run()
+    command = None
+    try:
+        for command_name in COMMANDS:
+            if arguments[command_name]:
+                with timings.span(f"gitget {command_name}"):
+                    # only the selected command's module (and its dependencies) is imported
+                    with timings.span("import command"):
+                        command_class = get_command_class(command_name)
+                    command = command_class(arguments)
+                    command.run()
+                break
+    finally:
+        # commands exit() when they're done, so this also runs then
+        if command is not None:
+            command.close_clients()
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(arguments["--profile"])
+            logger.info(f"Profile written to {arguments['--profile']}")
+        if arguments["--trace"]:
+            timings.write_trace(arguments["--trace"])
+            logger.info(f"Trace written to {arguments['--trace']}")
+        if arguments["--timings"]:
+            logger.info("Timings:\n" + "\n".join(timings.get_summary()))
 
 
 if __name__ == "__main__":
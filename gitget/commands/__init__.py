@@ -1,12 +1,42 @@
-from .doctor import *
-from .edit import *
-from .help import *
-from .install import *
-from .track import *
-from .untrack import *
-from .update import *
-from .list import *
-from .move import *
-from .remove import *
-from .setup import *
-from .config import *
+from importlib import import_module
+
+# Command modules and the class implementing each command. They're imported on
+# first use so running one command doesn't pay for importing every other one
+# (and the API clients they depend on). Commands are listed in the order
+# they're matched: `config list` must be dispatched to config, not list.
+COMMANDS = {
+    "doctor": "Doctor",
+    "config": "Config",
+    "edit": "Edit",
+    "install": "Install",
+    "track": "Track",
+    "untrack": "Untrack",
+    "dissociate": "Dissociate",
+    "maintain": "Maintain",
+    "list": "List",
+    "search": "Search",
+    "move": "Move",
+    "remove": "Remove",
+    "setup": "Setup",
+    "update": "Update",
+    "help": "Help",
+}
+
+
+def get_command_class(command_name):
+    """Imports the module of a command and returns the class implementing it."""
+    module = import_module(f"{__name__}.{command_name}")
+    return getattr(module, COMMANDS[command_name])
+
+
+def __getattr__(name):
+    if name in COMMANDS:
+        return import_module(f"{__name__}.{name}")
+    for command_name, class_name in COMMANDS.items():
+        if name == class_name:
+            return get_command_class(command_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(COMMANDS) + list(COMMANDS.values()))
@@ -1,52 +1,148 @@
-from os import path, getcwd
-from datetime import datetime
-from urllib.parse import urlparse
+from os import path, getcwd, makedirs, replace, stat
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from copy import deepcopy
+from datetime import datetime, timezone
+from pprint import pformat
+from threading import local
+import shlex
+from urllib.parse import urlparse, quote
+from email.utils import parsedate_to_datetime
 from loguru import logger
 import yaml
-import semver
-from github import Github
-from github import Auth
-from gitlab import Gitlab
-from git import Repo
+import json
 from gitget.version import __version__
+from ._metadatacache import MetadataCache
+from ._migration import MigrationCheckpoint
+from ._packagefile import PackageFileLock, PackageJournal, write_file_atomically
+from ._packagestore import SqlitePackageStore, SqlitePackageList, encode_package, decode_package
+from ._ratelimiter import RateLimiter, RateLimitDeferred
+from ._reachability import ReachabilityChecker
+from ._timings import timings, timed
+from ._workspaces import SharedClients, WorkspaceRegistry, shared
+
+# Use libyaml when it's available, it's much faster than the pure Python implementation
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 class Base(object):
     """A base command."""
 
+    # shared with the commands run on other workspaces (see get_workspace_commands)
+    github = shared("github")
+    github_graphql = shared("github_graphql")
+    gitlab = shared("gitlab")
+    gitlab_graphql = shared("gitlab_graphql")
+    prefetched_metadata = shared("prefetched_metadata")
+    rate_limiter = shared("rate_limiter")
+    reachability_checker = shared("reachability_checker")
+    object_cache = shared("object_cache")
+    workspace_registry = shared("workspace_registry")
+    metadata_caches = shared("metadata_caches")
+    client_lock = shared("lock")
+    # the last response of the GitLab client on each thread, see keep_gitlab_response
+    gitlab_responses = local()
+
     def __init__(self, options, *args, **kwargs):
         self.options = options
+        # the options as given on the command line, before the configuration's defaults
+        self.cli_options = dict(options)
         self.args = args
         self.kwargs = kwargs
+        self.shared_clients = SharedClients()
         self.configuration = None
-        self.github = None
-        self.github_rate_limit = None
-        self.github_rate_limit_core = None
-        self.github_rate_limit_graphql = None
-        self.gitlab = None
+        self.package_list_filepath = None
+        # how the workspace is shown in messages, when the command runs on several
+        self.workspace = None
+        self.metadata_cache = None
+        self.package_store = None
+        self.package_file_lock = None
+        self.package_snapshot = None
+        self.configuration_snapshot = None
 
     def run(self):
         pass
 
     @staticmethod
     def find_in_dir_tree(curr_dir, filename):
-        filepath = path.join(curr_dir, filename)
-        if path.isfile(filepath):
-            return filepath
-        parent_dir = path.dirname(curr_dir)
-        if parent_dir == "" or parent_dir == curr_dir:
-            return None
-        return Base.find_in_dir_tree(parent_dir, filename)
+        while True:
+            filepath = path.join(curr_dir, filename)
+            if path.isfile(filepath):
+                return filepath
+            parent_dir = path.dirname(curr_dir)
+            if parent_dir == "" or parent_dir == curr_dir:
+                return None
+            curr_dir = parent_dir
 
     @staticmethod
-    def get_package_list_filepath():
-        """Returns the filepath of the file containing the package info."""
+    @lru_cache(maxsize=None)
+    def find_package_list_filepath(directory):
+        """Returns the package file used in a directory: the nearest `.gitget.yaml` above it, or `~/.gitget.yaml`.
+
+        Directories are only searched once per process.
+        """
         logger.debug("Getting the package file filepath")
-        filepath = Base.find_in_dir_tree(getcwd(), ".gitget.yaml")
+        filepath = Base.find_in_dir_tree(directory, ".gitget.yaml")
         if filepath is None:
             filepath = path.expanduser(path.join("~", ".gitget.yaml"))
         logger.debug(f"Package file: {filepath}")
         return filepath
 
+    def get_package_list_filepath(self):
+        """Returns the filepath of the file containing the package info.
+
+        That's the package file of the workspace the command was given (see
+        get_workspace_commands), or else the one used in the current directory.
+        """
+        if self.package_list_filepath is None:
+            self.package_list_filepath = Base.find_package_list_filepath(getcwd())
+        return self.package_list_filepath
+
+    @staticmethod
+    def get_workspace_registry_filepath():
+        """Returns the path of the registry of workspaces, in the home directory."""
+        return path.expanduser(path.join("~", ".gitget-workspaces.yaml"))
+
+    def get_workspace_registry(self):
+        """Returns the registry of the package files gitget knows about, loading it on first use."""
+        if self.workspace_registry is None:
+            with self.client_lock:
+                if self.workspace_registry is None:
+                    self.workspace_registry = WorkspaceRegistry(Base.get_workspace_registry_filepath())
+        return self.workspace_registry
+
+    def get_workspace_commands(self):
+        """Returns a command like this one for each registered workspace (`--all-workspaces`).
+
+        Each one loads its own package file, with the options given on the
+        command line, and they all share this command's API clients, rate
+        limits and prefetched package information. The clients are created
+        with the options of the first workspace that uses them.
+        """
+        package_list_filepaths = self.get_workspace_registry().get_package_list_filepaths()
+        if not package_list_filepaths:
+            logger.error("No workspaces registered yet, run gitget in a workspace (or `gitget setup`) first")
+            exit(1)
+        commands = []
+        home = path.expanduser("~")
+        for package_list_filepath in package_list_filepaths:
+            command = type(self)(dict(self.cli_options), *self.args, **self.kwargs)
+            command.shared_clients = self.shared_clients
+            command.package_list_filepath = package_list_filepath
+            workspace = path.dirname(package_list_filepath)
+            command.workspace = "~" + workspace[len(home):] if workspace == home or workspace.startswith(home + path.sep) else workspace
+            commands.append(command)
+        logger.debug(f"Running on {len(commands)} workspaces")
+        return commands
+
+    def get_package_label(self, package_name):
+        """Returns how a package is called in messages: its name, with its workspace when the command runs on several."""
+        if self.workspace is None:
+            return package_name
+        return f"{self.workspace}:{package_name}"
+
     @staticmethod
     def get_new_package_list_filepath():
         """Returns the filepath of the file containing the package info."""
@@ -55,6 +151,11 @@ class Base(object):
         logger.debug(f"Package file: {filepath}")
         return filepath
 
+    @staticmethod
+    def get_cache_dirpath(package_list_filepath):
+        """Returns the path of the directory gitget keeps its caches in, next to a package file."""
+        return path.join(path.dirname(package_list_filepath), ".gitget-cache")
+
     @staticmethod
     def check_package_list_file(package_list_path):
         """Verifies the package list file exists.
@@ -75,6 +176,48 @@ class Base(object):
             return 2
         return 0
 
+    def get_jobs(self, option="--jobs", default=1):
+        """Returns the number of packages to process concurrently (`--jobs`, or another jobs option)."""
+        jobs = self.options.get(option)
+        if not jobs:
+            return default
+        try:
+            jobs = int(jobs)
+        except ValueError:
+            logger.error(f"Invalid number of jobs for {option}: {jobs}")
+            exit(1)
+        return max(1, jobs)
+
+    @staticmethod
+    def parse_git_args(git_args_string):
+        """Converts a string of git command line arguments into GitPython keyword arguments."""
+        git_args = {}
+        if git_args_string is None:
+            return git_args
+        args = shlex.split(git_args_string)
+        for i, arg in enumerate(args):
+            if arg.startswith("-"):
+                if arg.startswith("--"):
+                    arg = arg[2:]
+                elif arg.startswith("-"):
+                    arg = arg[1:]
+                if "=" in arg:
+                    # --foo=bar
+                    git_arg = arg.split("=")
+                    git_args[git_arg[0]] = git_arg[1]
+                else:
+                    if i+1 < len(args) and not args[i+1].startswith("-"):
+                        # --foo bar
+                        git_args[arg] = args[i+1]
+                    else:
+                        # --foo
+                        git_args[arg] = True
+            else:
+                # item is a parameter to the previous argument, not an argument itself
+                pass
+        logger.debug(f"Git arguments: {pformat(git_args)}")
+        return git_args
+
     @staticmethod
     def merge(dict_1, dict_2):
         """Merge two dictionaries.
@@ -86,10 +229,11 @@ class Base(object):
         return dict((str(key), dict_1.get(key) or dict_2.get(key))
                     for key in set(dict_2) | set(dict_1))
 
+    @timed("load package file")
     def get_package_list(self):
         """Returns the list of packages from the package file and updates self.options with any defaults."""
         logger.debug("Loading package list")
-        package_list_filepath = Base.get_package_list_filepath()
+        package_list_filepath = self.get_package_list_filepath()
 
         # check package list file is valid
         logger.debug("Checking filepath")
@@ -104,12 +248,13 @@ class Base(object):
             exit(1)
         elif package_list_file_valid == 0:
             logger.debug(f"Package file found: {package_list_filepath}")
+        self.get_workspace_registry().add(package_list_filepath)
 
         # try loading the file
         logger.debug("Attempting to load file")
         try:
-            with open(package_list_filepath) as file:
-                package_document = yaml.safe_load(file)
+            with self.get_package_file_lock():
+                package_document = Base.load_package_document(package_list_filepath)
         except Exception as ex:
             logger.error("Could not load package list due to the following error:")
             logger.error(ex)
@@ -118,6 +263,7 @@ class Base(object):
 
         # if the list is NONE, set to an empty dictionary to prevent iteration errors
         logger.debug("Checking if package list is None")
+        current_format = False
         if package_document is None:
             package_list = {}
             self.configuration = { "version": __version__, "options": {} }
@@ -125,165 +271,768 @@ class Base(object):
         else:
             if "packages" in package_document and "configuration" in package_document and "version" in package_document["configuration"]:
                 package_list = package_document["packages"]
+                current_format = True
                 self.configuration = package_document["configuration"]
                 logger.debug(f"Configuration: {yaml.dump(self.configuration, default_flow_style=True)}")
 
+                if self.configuration.get("storage") == "sqlite":
+                    logger.debug("Using the SQLite package store")
+                    package_list = SqlitePackageList(self.get_package_store())
+
                 # Apply the options from the configuration, if any
                 default_options = self.configuration.get("options", {})
                 # Specified options will take precedence over the default options
                 self.options = Base.merge(self.options, default_options)
 
-                if semver.compare(self.configuration["version"], __version__) < 0:
+                # semver is only needed (and imported) when the versions differ
+                if self.configuration["version"] != __version__ and Base.compare_versions(self.configuration["version"], __version__) < 0:
                     logger.debug(f"Old package list version loaded: {self.configuration['version']} < {__version__}")
 
-                    # Perform any necessary updates here
-                    if semver.compare(self.configuration["version"], "4.0.0") < 0:
-                        new_package_list = {}
-                        for package_name, package_path in package_list.items():
-                            logger.debug(f"Updating package {package_name} ({package_path})")
-                            new_package_list[package_name] = self.get_package_for_path(package_name, package_path)
-                        package_list = new_package_list
+                    with self.get_package_file_lock():
+                        # Perform any necessary updates here
+                        if Base.compare_versions(self.configuration["version"], "4.0.0") < 0:
+                            package_list = self.migrate_package_list(package_list, self.configuration["version"])
 
-                    self.configuration["version"] = __version__
-                    self.write_package_list(package_list)
+                        self.configuration["version"] = __version__
+                        self.write_package_list(package_list)
             else:
                 logger.debug("Old package list format detected")
                 # Old format
-                package_list = package_document
                 self.configuration = { "version": __version__, "options": {} }
-                
-                # Perform any necessary updates here
 
-                self.write_package_list(package_list)
+                # Perform any necessary updates here
+                with self.get_package_file_lock():
+                    # the old format only had the paths of the packages, like versions before 4.0.0
+                    package_list = self.migrate_package_list(package_document, "0.0.0")
+                    self.write_package_list(package_list)
 
+        # remember what was loaded, so only what changed is written back (empty
+        # and old format package files are written in full the first time)
+        if current_format and not isinstance(package_list, SqlitePackageList):
+            self.package_snapshot = PackageJournal.snapshot(package_list)
+        self.configuration_snapshot = deepcopy(self.configuration)
         return package_list
 
+    @timed("migrate package file")
+    def migrate_package_list(self, package_list, from_version):
+        """Returns the packages of a package file from before 4.0.0, which only had their paths, with their full information.
+
+        Packages are migrated `--jobs` at a time (8 by default): their remote
+        URLs are read, then their information is fetched from the API, after
+        prefetching it in batches. With `--defer-metadata`, the API isn't
+        contacted and the information is fetched by the next `update`.
+        Migrated packages are checkpointed in `.gitget-cache`, so a migration
+        that fails or is interrupted resumes where it stopped. Exits if any
+        package couldn't be migrated, once the others are checkpointed.
+        """
+        checkpoint = MigrationCheckpoint(path.join(Base.get_cache_dirpath(self.get_package_list_filepath()), "migration.json"), from_version)
+        fetch_metadata = not self.options.get("--defer-metadata")
+        new_package_list = {}
+        package_paths = {}
+        for package_name, package_path in package_list.items():
+            if isinstance(package_path, dict):
+                # already has the full information
+                new_package_list[package_name] = package_path
+                continue
+            package = checkpoint.get(package_name, package_path)
+            if package is not None:
+                new_package_list[package_name] = package
+            else:
+                package_paths[package_name] = package_path
+        logger.info(
+            f"Migrating the package file from version {from_version}: {len(package_paths)} packages to migrate"
+            + (f", {len(new_package_list)} already migrated" if new_package_list else "")
+        )
+
+        failed = []
+        executor = ThreadPoolExecutor(max_workers=self.get_jobs(default=8))
+        try:
+            urls = dict(zip(package_paths, executor.map(lambda package_name: self.get_remote_url_for_migration(package_name, package_paths[package_name]), package_paths)))
+            failed.extend(package_name for package_name, url in urls.items() if url is None)
+            urls = {package_name: url for package_name, url in urls.items() if url is not None}
+            if fetch_metadata:
+                self.prefetch_packages_for_urls(urls.values())
+            futures = {
+                executor.submit(self.get_package_for_migration, package_name, package_paths[package_name], url, fetch_metadata): package_name
+                for package_name, url in urls.items()
+            }
+            for number, future in enumerate(as_completed(futures), 1):
+                package_name = futures[future]
+                package = future.result()
+                if package is None:
+                    failed.append(package_name)
+                    continue
+                new_package_list[package_name] = package
+                checkpoint.put(package_name, package_paths[package_name], package)
+                if number % 100 == 0:
+                    logger.info(f"Migrated {number}/{len(urls)} packages")
+        finally:
+            # on an interrupt, packages that haven't started are dropped and the finished ones kept
+            executor.shutdown(cancel_futures=True)
+            checkpoint.save()
+        if failed:
+            logger.error(
+                f"{len(failed)} package{'s' if len(failed) > 1 else ''} could not be migrated ({', '.join(sorted(failed)[:10])}"
+                f"{', ...' if len(failed) > 10 else ''}), fix or remove them from {self.get_package_list_filepath()} and run gitget again,"
+                f" the {len(new_package_list)} migrated packages are kept in {checkpoint.filepath}"
+            )
+            exit(1)
+        if self.metadata_cache is not None:
+            self.metadata_cache.save()
+        checkpoint.remove()
+        return new_package_list
+
+    def get_remote_url_for_migration(self, package_name, package_path):
+        """Returns the remote URL of a package being migrated, or None (with an error) if it can't be read."""
+        try:
+            return self.get_remote_url(package_path)
+        except SystemExit:
+            # Base reports the error itself before exiting
+            logger.error(f"Package {package_name} ({package_path}) could not be migrated")
+            return None
+
+    def get_package_for_migration(self, package_name, package_path, url, fetch_metadata):
+        """Returns the package information of a package being migrated, or None (with an error) if it can't be fetched."""
+        try:
+            return self.get_package_for_url(url, package_name, package_path, fetch_metadata=fetch_metadata)
+        except SystemExit:
+            # Base reports the error itself before exiting
+            logger.error(f"Package {package_name} ({package_path}) could not be migrated")
+        except Exception:
+            logger.exception(f"Package {package_name} ({package_path}) could not be migrated")
+        return None
+
+    @staticmethod
+    def compare_versions(version_1, version_2):
+        """Compares two semantic versions, returning -1, 0 or 1."""
+        import semver
+
+        return semver.compare(version_1, version_2)
+
+    @staticmethod
+    def get_package_document_cache_filepath(package_list_filepath):
+        """Returns the path of the cache of a parsed package file."""
+        return path.join(Base.get_cache_dirpath(package_list_filepath), "package-file.json")
+
+    @staticmethod
+    def get_file_signature(filepath):
+        """Returns the size, modification time and inode of a file, which change whenever it is written."""
+        file_stat = stat(filepath)
+        return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino)
+
+    @staticmethod
+    def load_package_document(package_list_filepath):
+        """Loads the package file and replays its journal.
+
+        The cached parse of the package file is used if the file hasn't changed since.
+        """
+        package_document = Base.parse_package_document(package_list_filepath)
+        if isinstance(package_document, dict) and isinstance(package_document.get("packages"), dict):
+            with timings.span("replay journal"):
+                PackageJournal(Base.get_package_journal_filepath(package_list_filepath)).replay(package_document["packages"])
+        return package_document
+
+    @staticmethod
+    @timed("parse package file")
+    def parse_package_document(package_list_filepath):
+        """Parses the package file, using the cached parse of it if the file hasn't changed since.
+
+        The cache's first line has the signature of the package file it was
+        made from, which is checked before the rest is decoded.
+        """
+        signature = Base.get_file_signature(package_list_filepath)
+        cache_filepath = Base.get_package_document_cache_filepath(package_list_filepath)
+        try:
+            with open(cache_filepath) as file:
+                cached_signature = json.loads(file.readline()).get("signature")
+                if cached_signature == list(signature):
+                    package_document = Base.decode_package_document(json.load(file))
+                    logger.debug(f"Using the cached package file: {cache_filepath}")
+                    return package_document
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            logger.debug(f"Ignoring the cached package file: {ex}")
+
+        with open(package_list_filepath) as file:
+            package_document = yaml.load(file, Loader=SafeLoader)
+        Base.write_package_document_cache(package_list_filepath, package_document, signature)
+        return package_document
+
+    @staticmethod
+    def write_package_document_cache(package_list_filepath, package_document, signature=None):
+        """Caches the parsed package file, so it only needs to be parsed again once it changes."""
+        cache_filepath = Base.get_package_document_cache_filepath(package_list_filepath)
+        try:
+            if signature is None:
+                signature = Base.get_file_signature(package_list_filepath)
+            data = json.dumps(Base.encode_package_document(package_document), default=Base.refuse_json_value)
+            makedirs(path.dirname(cache_filepath), exist_ok=True)
+            temp_filepath = f"{cache_filepath}.tmp"
+            with open(temp_filepath, "w") as file:
+                file.write(json.dumps({"signature": list(signature)}) + "\n")
+                file.write(data)
+            replace(temp_filepath, cache_filepath)
+        except Exception as ex:
+            logger.debug(f"Could not cache the package file: {ex}")
+
+    @staticmethod
+    def encode_package_document(package_document):
+        """Returns a JSON-serialisable copy of a parsed package file (see encode_package).
+
+        Raises TypeError for documents JSON can't reproduce exactly (e.g. with
+        dates outside of the packages' date fields, or names that aren't strings).
+        """
+        if not isinstance(package_document, dict) or not all(isinstance(key, str) for key in package_document):
+            raise TypeError("the package file isn't a mapping of names")
+        packages = package_document.get("packages")
+        if isinstance(packages, dict):
+            if not all(isinstance(package_name, str) and isinstance(package, dict) for package_name, package in packages.items()):
+                raise TypeError("the packages aren't a mapping of names to packages")
+            package_document = dict(package_document, packages={package_name: encode_package(package) for package_name, package in packages.items()})
+        return package_document
+
+    @staticmethod
+    def decode_package_document(package_document):
+        """Reverses encode_package_document."""
+        packages = package_document.get("packages")
+        if isinstance(packages, dict):
+            for package in packages.values():
+                decode_package(package)
+        return package_document
+
+    @staticmethod
+    def refuse_json_value(value):
+        raise TypeError(f"{type(value).__name__} values can't be cached")
+
+    @staticmethod
+    def get_package_journal_filepath(package_list_filepath):
+        """Returns the path of the journal of changes to a package file."""
+        return f"{package_list_filepath}.journal"
+
+    def get_package_file_lock(self):
+        """Returns the lock on the package file, held while reading or writing it."""
+        with self.client_lock:
+            if self.package_file_lock is None:
+                self.package_file_lock = PackageFileLock(f"{self.get_package_list_filepath()}.lock")
+        return self.package_file_lock
+
+    @staticmethod
+    def write_package_document(package_list_filepath, package_document):
+        """Replaces the package file with a complete document and empties its journal."""
+        write_file_atomically(
+            package_list_filepath,
+            lambda file: yaml.dump(package_document, file, Dumper=SafeDumper, sort_keys=True, default_flow_style=False),
+        )
+        # the journal's changes are all in the new file now (replaying it again would do no harm)
+        PackageJournal(Base.get_package_journal_filepath(package_list_filepath)).clear()
+        Base.write_package_document_cache(package_list_filepath, package_document)
+
+    @timed("compact package file")
+    def compact_package_file(self):
+        """Folds the journal into the package file.
+
+        Changes made by other gitget processes since the package list was
+        loaded are kept, as they are read back from the package file.
+        """
+        package_list_filepath = self.get_package_list_filepath()
+        with self.get_package_file_lock():
+            package_document = Base.load_package_document(package_list_filepath)
+            package_document["configuration"] = self.configuration
+            logger.debug(f"Compacting the journal into {package_list_filepath}")
+            Base.write_package_document(package_list_filepath, package_document)
+
+    @timed("write package file")
     def write_package_list(self, package_list):
-        """Writes the package information to the package file."""
+        """Writes the package information to the package file.
+
+        When only packages changed, the changes are appended to the journal
+        of the package file instead of rewriting it; the journal is
+        compacted into the package file once it grows large enough.
+        """
         logger.debug("Attempting to write package list")
+        package_list_filepath = self.get_package_list_filepath()
         try:
-            package_document = { "packages": package_list, "configuration": self.configuration }
-            with open(Base.get_package_list_filepath(), "w") as file:
-                yaml.dump(package_document, file, sort_keys=True, default_flow_style=False)
+            with self.get_package_file_lock():
+                # what changed, for the search index (None if every package was written)
+                changes = None
+                previous_signature = Base.get_package_files_signature(package_list_filepath) if path.exists(Base.get_search_index_filepath(package_list_filepath)) else None
+                if self.configuration.get("storage") == "sqlite":
+                    # only the configuration stays in the package file
+                    if isinstance(package_list, SqlitePackageList):
+                        upserted, deleted = package_list.save()
+                        changes = ({ package_name: package_list[package_name] for package_name in upserted }, deleted)
+                        logger.debug(f"Package store updated: {len(upserted)} written, {len(deleted)} removed")
+                    else:
+                        store = self.get_package_store()
+                        logger.info(f"Importing {len(package_list)} packages into {store.filepath}")
+                        SqlitePackageList.replace_store(store, package_list)
+                    if not isinstance(package_list, SqlitePackageList) or self.configuration != self.configuration_snapshot:
+                        Base.write_package_document(package_list_filepath, { "packages": {}, "configuration": self.configuration })
+                elif isinstance(package_list, SqlitePackageList):
+                    logger.info(f"Exporting {len(package_list)} packages to {package_list_filepath}")
+                    Base.write_package_document(package_list_filepath, { "packages": dict(package_list), "configuration": self.configuration })
+                elif self.package_snapshot is None:
+                    # nothing to compare with (a new or migrated package file), write all of it
+                    Base.write_package_document(package_list_filepath, { "packages": package_list, "configuration": self.configuration })
+                else:
+                    journal = PackageJournal(Base.get_package_journal_filepath(package_list_filepath))
+                    changes = PackageJournal.diff(self.package_snapshot, package_list)
+                    journal.append(*changes)
+                    if self.configuration != self.configuration_snapshot or journal.needs_compaction(package_list_filepath):
+                        self.compact_package_file()
+                if not isinstance(package_list, SqlitePackageList):
+                    self.package_snapshot = PackageJournal.snapshot(package_list)
+                self.configuration_snapshot = deepcopy(self.configuration)
+                if previous_signature is not None:
+                    self.update_search_index(package_list, changes, previous_signature)
         except:
             logger.exception("Could not write package list")
             exit(1)
-        logger.debug(f"Packages written to file: {Base.get_package_list_filepath()}")
+        logger.debug(f"Packages written to file: {package_list_filepath}")
+        if self.metadata_cache is not None:
+            self.metadata_cache.save()
+
+    @staticmethod
+    def get_search_index_filepath(package_list_filepath):
+        """Returns the path of the search index (see `gitget search`) of a package file."""
+        return path.join(Base.get_cache_dirpath(package_list_filepath), "search.sqlite")
+
+    @staticmethod
+    def get_package_files_signature(package_list_filepath):
+        """Returns the signatures of the files packages are stored in, which change whenever packages are written."""
+        store_filepath = f"{path.splitext(package_list_filepath)[0]}.sqlite"
+        signature = []
+        for filepath in (package_list_filepath, Base.get_package_journal_filepath(package_list_filepath), store_filepath, f"{store_filepath}-wal"):
+            try:
+                signature.append(list(Base.get_file_signature(filepath)))
+            except OSError:
+                signature.append(None)
+        return signature
+
+    @timed("update search index")
+    def update_search_index(self, package_list, changes=None, previous_signature=None):
+        """Applies changes to the packages to the search index (which is created by `gitget search`).
+
+        `changes` are the packages that were added or changed and the names
+        of the removed ones; without them, the whole package list is
+        compared with the index. The index is only marked as up to date if
+        it was before the changes (`previous_signature` is the signature of
+        the package files before they were written), otherwise the next
+        search compares it with the package list.
+        """
+        package_list_filepath = self.get_package_list_filepath()
+        filepath = Base.get_search_index_filepath(package_list_filepath)
+        if not path.exists(filepath):
+            return
+        from ._searchindex import SearchIndex
+
+        try:
+            index = SearchIndex(filepath)
+            try:
+                if changes is None:
+                    indexed = index.sync(package_list)
+                    in_sync = True
+                else:
+                    in_sync = index.get_signature() == previous_signature
+                    indexed = index.update(*changes)
+                if in_sync:
+                    index.set_signature(Base.get_package_files_signature(package_list_filepath))
+            finally:
+                index.close()
+            logger.debug(f"Search index updated: {indexed} packages")
+        except Exception as ex:
+            logger.warning(f"Could not update the search index {filepath}: {ex}")
 
-    def get_package_for_path(self, package_name, package_path):
+    def get_package_store(self):
+        """Returns the SQLite package store, which lives next to the package file."""
+        if self.package_store is None:
+            filepath = f"{path.splitext(self.get_package_list_filepath())[0]}.sqlite"
+            try:
+                self.package_store = SqlitePackageStore(filepath)
+            except Exception as ex:
+                logger.error(f"Could not open the package store {filepath}:")
+                logger.error(ex)
+                exit(1)
+        return self.package_store
+
+    @staticmethod
+    def find_package_names_by_paths(package_list, package_paths):
+        """Returns a dict of path -> package name for the paths that belong to a package in the list."""
+        if isinstance(package_list, SqlitePackageList):
+            return package_list.find_names_by_paths(package_paths)
+        package_paths = set(package_paths)
+        return { package["path"]: package_name for package_name, package in package_list.items() if package["path"] in package_paths }
+
+    def get_package_for_path(self, package_name, package_path, previous_package=None):
         """Returns the package information from the path. package_path must be an existing git repo."""
         logger.debug(f"Getting package information for {package_name} ({package_path})")
         url = self.get_remote_url(package_path)
 
-        return self.get_package_for_url(url, package_name, package_path)
+        return self.get_package_for_url(url, package_name, package_path, previous_package)
 
-    def get_package_for_url(self, url, package_name, package_path):
-        """Returns the package information for the url. package_path may not exist yet."""
+    def get_provider(self, url):
+        """Returns where the information about a repository comes from: `github`, `github-gist`, `gitlab` or None.
+
+        Besides github.com and gitlab.com, repositories on the hosts of
+        `--github-api-url` (GitHub Enterprise) and `--gitlab-url` are recognised.
+        """
+        netloc = urlparse(url).netloc
+        if "gist.github.com" in netloc:
+            return "github-gist"
+        if "github.com" in netloc or (self.options.get("--github-api-url") and netloc == urlparse(self.get_github_api_url()).netloc):
+            return "github"
+        if "gitlab.com" in netloc or (self.options.get("--gitlab-url") and netloc == urlparse(self.get_gitlab_url()).netloc):
+            return "gitlab"
+        return None
+
+    def get_package_for_url(self, url, package_name, package_path, previous_package=None, fetch_metadata=True):
+        """Returns the package information for the url. package_path may not exist yet.
+
+        If the API rate limit is exhausted and requests are being deferred, the
+        information from `previous_package` is kept (or left empty). With
+        `fetch_metadata` False, the API isn't contacted and the information is
+        left empty. `metadata_fetched_at` is when the information was last
+        fetched, or None if it never was.
+        """
         logger.debug(f"Getting package information for {package_name} ({package_path}, {url})")
         owner_name, repo_name = Base.get_owner_and_repo(url)
 
-        url_parts = urlparse(url)
-        if "gist.github.com" in url_parts.netloc:
-            gist = self.get_github_gist(url)
-            package = {
-                "name": package_name,
-                "path": package_path,
-                "owner": owner_name,
-                "repo": repo_name,
-                "url": url,
-                "description": gist.description,
+        provider = self.get_provider(url) if fetch_metadata else None
+        fetched_at = None
+        try:
+            with timings.span("get metadata", package=package_name):
+                if provider == "github-gist":
+                    metadata = self.get_github_gist_metadata(url)
+                elif provider == "github":
+                    metadata = self.get_github_repo_metadata(url)
+                elif provider == "gitlab":
+                    metadata = self.get_gitlab_repo_metadata(url)
+                elif not fetch_metadata:
+                    metadata = None
+                else:
+                    logger.warning(f"Full details are only supported for GitHub and GitLab repositories: {url}")
+                    metadata = None
+            if metadata is not None:
+                fetched_at = datetime.now(timezone.utc).replace(microsecond=0)
+        except RateLimitDeferred:
+            logger.debug(f"Deferring the information refresh for {package_name}")
+            metadata = {key: value for key, value in (previous_package or {}).items() if key not in ("name", "path", "owner", "repo", "url")} or None
+        if metadata is None:
+            metadata = {
+                "description": None,
                 "homepage": None,
                 "languages": [],
                 "size_kb": 0,
                 "stars": 0,
                 "watchers": 0,
-                "forks": len(gist.forks) if gist.forks is not None else 0,
+                "forks": 0,
                 "topics": [],
                 "license": None,
-                "created_at": gist.created_at,
-                "updated_at": gist.last_modified_datetime,
-                "last_commit_at": gist.updated_at,
-            }
-            return package
-        elif "github.com" in url_parts.netloc:
-            repo = self.get_github_repo(url)
-            license = repo.license
-            if license is not None:
-                license = {
-                    "name": license.name,
-                    "key": license.spdx_id,
-                    "url": license.url,
-                }
-            package = {
-                "name": package_name,
-                "path": package_path,
-                "owner": owner_name,
-                "repo": repo_name,
-                "url": url,
-                "description": repo.description,
-                "homepage": repo.homepage,
-                "languages": [repo.language] if repo.language is not None else [],
-                "size_kb": repo.size,
-                "stars": repo.stargazers_count,
-                "watchers": repo.subscribers_count,
-                "forks": repo.forks_count,
-                "topics": repo.get_topics(),
-                "license": license,
-                "created_at": repo.created_at,
-                "updated_at": repo.updated_at,
-                "last_commit_at": repo.pushed_at,
-            }
-            return package
-        elif "gitlab.com" in url_parts.netloc:
-            repo = self.get_gitlab_repo(url)
-            license = repo.license
-            if license is not None:
-                license = {
-                    "name": license['name'],
-                    "key": license['key'],
-                    "url": license['html_url'],
-                }
-            package = {
-                "name": package_name,
-                "path": package_path,
-                "owner": owner_name,
-                "repo": repo_name,
-                "url": url,
-                "description": repo.description,
-                "homepage": None,
-                "languages": list(repo.languages().keys()) if repo.languages() is not None else [],
-                "size_kb": 0,
-                "stars": repo.star_count,
-                "watchers": 0,
-                "forks": repo.forks_count,
-                "topics": repo.topics,
-                "license": license,
-                "created_at": Base.datetime_from_utc_iso_string(repo.created_at),
-                "updated_at": Base.datetime_from_utc_iso_string(repo.updated_at),
-                "last_commit_at": Base.datetime_from_utc_iso_string(repo.last_activity_at),
+                "created_at": None,
+                "updated_at": None,
+                "last_commit_at": None,
+                "metadata_fetched_at": None,
             }
-            return package
-        logger.warning(f"Full details are only supported for GitHub and GitLab repositories: {url}")
         package = {
             "name": package_name,
             "path": package_path,
             "owner": owner_name,
             "repo": repo_name,
             "url": url,
-            "description": None,
+        }
+        package.update(metadata)
+        if fetched_at is not None:
+            package["metadata_fetched_at"] = fetched_at
+        return package
+
+    def get_github_gist_metadata(self, url):
+        """Returns the metadata fields of the package information for a GitHub gist."""
+        owner, gist = Base.get_owner_and_repo(url)
+        key = f"gist:{gist}".lower()
+        metadata_cache = self.get_metadata_cache()
+        metadata = metadata_cache.get_fresh(key)
+        if metadata is not None:
+            return metadata
+        headers, data = self.get_github_json(f"/gists/{gist}", metadata_cache.get(key), "gist")
+        if data is None:
+            return metadata_cache.revalidate(key)
+        last_modified = headers.get("last-modified")
+        metadata = {
+            "description": data["description"],
             "homepage": None,
             "languages": [],
             "size_kb": 0,
             "stars": 0,
             "watchers": 0,
-            "forks": 0,
+            "forks": len(data["forks"]) if data.get("forks") is not None else 0,
             "topics": [],
             "license": None,
-            "created_at": None,
-            "updated_at": None,
-            "last_commit_at": None,
+            "created_at": Base.datetime_from_utc_iso_string(data["created_at"]),
+            "updated_at": parsedate_to_datetime(last_modified) if last_modified else None,
+            "last_commit_at": Base.datetime_from_utc_iso_string(data["updated_at"]),
+        }
+        metadata_cache.put(key, metadata, headers.get("etag"), last_modified)
+        return metadata
+
+    def get_github_repo_metadata(self, url):
+        """Returns the metadata fields of the package information for a GitHub repository."""
+        owner, repo = Base.get_owner_and_repo(url)
+        key = f"github:{owner}/{repo}".lower()
+        metadata = self.prefetched_metadata.get(key)
+        if metadata is not None:
+            logger.debug(f"Using prefetched GitHub repo for {url}")
+            return deepcopy(metadata)
+        metadata_cache = self.get_metadata_cache()
+        metadata = metadata_cache.get_fresh(key)
+        if metadata is not None:
+            return metadata
+        headers, data = self.get_github_json(f"/repos/{owner}/{repo}", metadata_cache.get(key), "repo")
+        if data is None:
+            return metadata_cache.revalidate(key)
+        license = data["license"]
+        if license is not None:
+            license = {
+                "name": license["name"],
+                "key": license["spdx_id"],
+                "url": license["url"],
+            }
+        metadata = {
+            "description": data["description"],
+            "homepage": data["homepage"],
+            "languages": [data["language"]] if data["language"] is not None else [],
+            "size_kb": data["size"],
+            "stars": data["stargazers_count"],
+            "watchers": data["subscribers_count"],
+            "forks": data["forks_count"],
+            "topics": data.get("topics", []),
+            "license": license,
+            "created_at": Base.datetime_from_utc_iso_string(data["created_at"]),
+            "updated_at": Base.datetime_from_utc_iso_string(data["updated_at"]),
+            "last_commit_at": Base.datetime_from_utc_iso_string(data["pushed_at"]) if data["pushed_at"] else None,
+        }
+        metadata_cache.put(key, metadata, headers.get("etag"), headers.get("last-modified"))
+        return metadata
+
+    def get_gitlab_repo_metadata(self, url):
+        """Returns the metadata fields of the package information for a GitLab repository."""
+        owner, repo = Base.get_owner_and_repo(url)
+        key = f"gitlab:{owner}/{repo}".lower()
+        metadata = self.prefetched_metadata.get(key)
+        if metadata is not None:
+            logger.debug(f"Using prefetched GitLab project for {url}")
+            return deepcopy(metadata)
+        metadata_cache = self.get_metadata_cache()
+        metadata = metadata_cache.get_fresh(key)
+        if metadata is not None:
+            return metadata
+        headers, data = self.get_gitlab_json(f"/projects/{quote(f'{owner}/{repo}', safe='')}", metadata_cache.get(key), {"license": True})
+        if data is None:
+            return metadata_cache.revalidate(key)
+        _, languages = self.get_gitlab_json(f"/projects/{data['id']}/languages")
+        license = data.get("license")
+        if license is not None:
+            license = {
+                "name": license['name'],
+                "key": license['key'],
+                "url": license['html_url'],
+            }
+        metadata = {
+            "description": data["description"],
+            "homepage": None,
+            "languages": list(languages.keys()) if languages is not None else [],
+            "size_kb": 0,
+            "stars": data["star_count"],
+            "watchers": 0,
+            "forks": data["forks_count"],
+            "topics": data["topics"],
+            "license": license,
+            "created_at": Base.datetime_from_utc_iso_string(data["created_at"]),
+            "updated_at": Base.datetime_from_utc_iso_string(data["updated_at"]),
+            "last_commit_at": Base.datetime_from_utc_iso_string(data["last_activity_at"]),
+        }
+        metadata_cache.put(key, metadata, headers.get("etag"), headers.get("last-modified"))
+        return metadata
+
+    def get_rate_limiter(self):
+        """Returns the rate limiter that schedules GitHub and GitLab API requests."""
+        if self.rate_limiter is None:
+            with self.client_lock:
+                if self.rate_limiter is None:
+                    policy = self.options.get("--rate-limit") or "wait"
+                    try:
+                        self.rate_limiter = RateLimiter(policy)
+                    except ValueError as ex:
+                        logger.error(ex)
+                        exit(1)
+        return self.rate_limiter
+
+    def get_reachability_checker(self):
+        """Returns the checker that probes (and remembers) whether repository hosts can be reached."""
+        if self.reachability_checker is None:
+            with self.client_lock:
+                if self.reachability_checker is None:
+                    self.reachability_checker = ReachabilityChecker()
+        return self.reachability_checker
+
+    def get_object_cache(self):
+        """Returns the shared object cache (`--object-cache`), or None if there isn't one."""
+        if not self.options.get("--object-cache"):
+            return None
+        if self.object_cache is None:
+            with self.client_lock:
+                if self.object_cache is None:
+                    from ._objectcache import ObjectCache
+
+                    self.object_cache = ObjectCache(self.options["--object-cache"])
+        return self.object_cache
+
+    def get_metadata_cache(self):
+        """Returns the metadata cache, loading it on first use."""
+        if self.metadata_cache is None:
+            with self.client_lock:
+                if self.metadata_cache is None:
+                    ttl = self.options.get("--metadata-ttl") or 0
+                    try:
+                        ttl = float(ttl)
+                    except ValueError:
+                        logger.error(f"Invalid metadata TTL: {ttl}")
+                        exit(1)
+                    filepath = path.join(Base.get_cache_dirpath(self.get_package_list_filepath()), "metadata.json")
+                    self.metadata_cache = MetadataCache(filepath, ttl)
+                    self.metadata_caches.append(self.metadata_cache)
+        return self.metadata_cache
+
+    def prefetch_packages_for_urls(self, urls):
+        """Fetches the information for many packages up front, so get_package_for_url doesn't need
+        an API call for each of them (see prefetch_workspace_packages).
+        """
+        self.prefetch_workspace_packages({self: urls})
+
+    @timed("prefetch metadata")
+    def prefetch_workspace_packages(self, urls_by_workspace):
+        """Fetches the information for the packages of several workspaces up front, in the same batches.
+
+        GitHub repositories are fetched 100 at a time through the GraphQL API, which requires an
+        auth token, and GitLab projects fetched before (from the REST API, for their license) 50 at
+        a time through GitLab's GraphQL API. Anything that isn't prefetched is fetched individually
+        as before. `urls_by_workspace` maps commands on workspaces sharing this command's clients
+        (or this command) to URLs; each one's metadata cache gets the information for its URLs.
+        """
+        # full name -> workspaces whose metadata cache wants it
+        full_names = {"github": {}, "gitlab": {}}
+        for workspace, urls in urls_by_workspace.items():
+            metadata_cache = workspace.get_metadata_cache()
+            for url in urls:
+                provider = workspace.get_provider(url)
+                if provider in full_names:
+                    try:
+                        owner, repo = Base.get_owner_and_repo(url)
+                    except IndexError:
+                        continue
+                    full_name = f"{owner}/{repo}".lower()
+                    key = f"{provider}:{full_name}"
+                    if key in self.prefetched_metadata or metadata_cache.is_fresh(key):
+                        continue
+                    # GitLab's GraphQL API has no licenses, a project's first comes from the REST API
+                    if provider == "gitlab" and metadata_cache.get(key) is None:
+                        continue
+                    workspaces = full_names[provider].setdefault(full_name, [])
+                    if workspace not in workspaces:
+                        workspaces.append(workspace)
+        if full_names["github"]:
+            self.prefetch_github_repos(full_names["github"])
+        if full_names["gitlab"]:
+            self.prefetch_gitlab_projects(full_names["gitlab"])
+
+    def prefetch_github_repos(self, full_names):
+        """Fetches the information for GitHub repositories through the GraphQL API.
+
+        `full_names` maps `owner/repo` (lower case) to the workspaces to cache the information in.
+        """
+        if not self.options.get("--github-auth-token"):
+            logger.debug("The GitHub GraphQL API requires an auth token, not prefetching GitHub repositories")
+            return
+        if self.github_graphql is None:
+            from ._githubgraphql import GithubGraphQL
+
+            self.github_graphql = GithubGraphQL(self.get_github_api_url(), self.options["--github-auth-token"], self.get_rate_limiter())
+        repositories = self.github_graphql.get_repositories(full_names)
+        for full_name, node in repositories.items():
+            metadata = self.get_metadata_for_github_node(node)
+            self.prefetched_metadata[f"github:{full_name}"] = metadata
+            for workspace in full_names[full_name]:
+                workspace.get_metadata_cache().put(f"github:{full_name}", metadata)
+        logger.debug(f"Prefetched {len(repositories)}/{len(full_names)} GitHub repositories")
+
+    def prefetch_gitlab_projects(self, full_names):
+        """Fetches the information for GitLab projects through the GraphQL API.
+
+        `full_names` maps `owner/repo` (lower case) to the workspaces to cache the information in.
+        """
+        if self.gitlab_graphql is None:
+            from ._gitlabgraphql import GitlabGraphQL
+
+            self.gitlab_graphql = GitlabGraphQL(self.get_gitlab_url(), self.options.get("--gitlab-auth-token"), self.get_rate_limiter())
+        projects = self.gitlab_graphql.get_projects(full_names)
+        for full_name, node in projects.items():
+            key = f"gitlab:{full_name}"
+            # the GraphQL API has no licenses, keep the one fetched before
+            workspaces = full_names[full_name]
+            license = workspaces[0].get_metadata_cache().get(key)["metadata"].get("license")
+            metadata = Base.get_metadata_for_gitlab_node(node, license)
+            self.prefetched_metadata[key] = metadata
+            for workspace in workspaces:
+                workspace.get_metadata_cache().put(key, metadata)
+        logger.debug(f"Prefetched {len(projects)}/{len(full_names)} GitLab projects")
+
+    def get_metadata_for_github_node(self, node):
+        """Returns the metadata fields of the package information for a repository node from the
+        GitHub GraphQL API."""
+        license = node["licenseInfo"]
+        if license is not None:
+            license = {
+                "name": license["name"],
+                "key": license["spdxId"],
+                # match the URL returned by the REST API
+                "url": f"{self.get_github_api_url()}/licenses/{license['key']}" if license["key"] != "other" else None,
+            }
+        language = node["primaryLanguage"]
+        metadata = {
+            "description": node["description"],
+            "homepage": node["homepageUrl"],
+            "languages": [language["name"]] if language is not None else [],
+            "size_kb": node["diskUsage"] or 0,
+            "stars": node["stargazerCount"],
+            "watchers": node["watchers"]["totalCount"],
+            "forks": node["forkCount"],
+            "topics": [topic["topic"]["name"] for topic in node["repositoryTopics"]["nodes"]],
+            "license": license,
+            "created_at": Base.datetime_from_utc_iso_string(node["createdAt"]),
+            "updated_at": Base.datetime_from_utc_iso_string(node["updatedAt"]),
+            "last_commit_at": Base.datetime_from_utc_iso_string(node["pushedAt"]) if node["pushedAt"] else None,
+        }
+        return metadata
+
+    @staticmethod
+    def get_metadata_for_gitlab_node(node, license=None):
+        """Returns the metadata fields of the package information for a project node from the
+        GitLab GraphQL API, which doesn't have the license."""
+        languages = sorted(node.get("languages") or [], key=lambda language: -language["share"])
+        return {
+            "description": node["description"],
+            "homepage": None,
+            "languages": [language["name"] for language in languages],
+            "size_kb": 0,
+            "stars": node["starCount"],
+            "watchers": 0,
+            "forks": node["forksCount"],
+            "topics": node["topics"] or [],
+            "license": license,
+            "created_at": Base.datetime_from_utc_iso_string(node["createdAt"]),
+            "updated_at": Base.datetime_from_utc_iso_string(node["updatedAt"]),
+            "last_commit_at": Base.datetime_from_utc_iso_string(node["lastActivityAt"]),
         }
-        return package
 
     @staticmethod
     def datetime_from_utc_iso_string(date_string):
@@ -330,26 +1079,47 @@ class Base(object):
             # repo
             return repo
 
+    def ensure_github_client(self):
+        """Initializes the GitHub client if it hasn't been already. Safe to call from worker threads."""
+        if self.github is None:
+            with self.client_lock:
+                if self.github is None:
+                    self.init_github_client()
+
+    def get_github_api_url(self):
+        """Returns the base URL of the GitHub API."""
+        return (self.options.get("--github-api-url") or "https://api.github.com").rstrip("/")
+
+    @timed("create github client")
     def init_github_client(self):
         """Initializes the GitHub client."""
         if self.github is not None:
             self.close_github_client()
         logger.debug("Creating GitHub client")
+        # PyGithub is slow to import, so it's only loaded once a command needs it
+        from github import Github, Auth
+
         try:
             if self.options["--github-auth-token"]:
                 logger.debug("Accessing the GitHub API with an auth token")
                 auth = Auth.Token(self.options["--github-auth-token"])
-                self.github = Github(auth=auth)
-                self.update_github_rate_limit()
+                # requests are paced by the rate limiter instead of PyGithub's throttling
+                self.github = Github(auth=auth, base_url=self.get_github_api_url(), seconds_between_requests=None)
             else:
                 logger.debug("Accessing the GitHub API anonymously")
-                self.github = Github()
-                self.update_github_rate_limit()
+                self.github = Github(base_url=self.get_github_api_url(), seconds_between_requests=None)
         except Exception as ex:
             logger.error("Could not create GitHub client:")
             logger.error(ex)
             exit(1)
 
+    def close_clients(self):
+        """Closes the API clients and logs how the metadata caches were used, once the command is done."""
+        for metadata_cache in self.metadata_caches:
+            metadata_cache.log_stats()
+        self.close_github_client()
+        self.close_gitlab_client()
+
     def close_github_client(self):
         """Closes the GitHub client."""
         if self.github is not None:
@@ -357,81 +1127,93 @@ class Base(object):
             try:
                 self.github.close()
                 self.github = None
+                if self.github_graphql is not None:
+                    self.github_graphql.close()
+                    self.github_graphql = None
             except Exception as ex:
                 logger.error("Could not close GitHub client:")
                 logger.error(ex)
                 exit(1)
 
-    def update_github_rate_limit(self):
-        """Updates the GitHub rate limit."""
-        if self.github is None:
-            self.init_github_client()
-        logger.debug("Updating GitHub rate limit")
-        try:
-            self.github_rate_limit = self.github.get_rate_limit()
-            core_rl = self.github_rate_limit.core.raw_data
-            core_rl["reset"] = self.github_rate_limit.core.reset
-            core_rl["reset_str"] = core_rl["reset"].strftime("%A, %d. %B %Y %I:%M%p %Z")
-            graphql_rl = self.github_rate_limit.graphql.raw_data
-            graphql_rl["reset"] = self.github_rate_limit.graphql.reset
-            graphql_rl["reset_str"] = graphql_rl["reset"].strftime("%A, %d. %B %Y %I:%M%p %Z")
-            self.github_rate_limit_core = core_rl
-            self.github_rate_limit_graphql = graphql_rl
-            logger.debug(f"GitHub core rate limit: {core_rl['used']}/{core_rl['limit']}, {core_rl['remaining']} remaining (reset: {core_rl['reset_str']})")
-            logger.debug(f"GitHub graphql rate limit: {graphql_rl['used']}/{graphql_rl['limit']}, {graphql_rl['remaining']} remaining (reset: {graphql_rl['reset_str']})")
-        except Exception as ex:
-            logger.error("Could not update GitHub rate limit:")
-            logger.error(ex)
-            exit(1)
+    def get_github_json(self, url_path, cache_entry=None, kind="repo"):
+        """Makes a (conditional) GET request to the GitHub API.
 
-    def get_github_repo(self, package_url):
-        """Returns the GitHub repository object."""
-        if self.github is None:
-            self.init_github_client()
-        logger.debug(f"Getting GitHub repo for {package_url}")
-        try:
-            owner, repo = Base.get_owner_and_repo(package_url)
-            repo = self.github.get_repo(f"{owner}/{repo}")
-            self.update_github_rate_limit()
-            return repo
-        except Exception as ex:
-            logger.error("Could not get GitHub repo:")
-            logger.error(ex)
-            exit(1)
+        Returns the response headers and the decoded JSON, which is None when
+        the server replied that `cache_entry` is still current (304).
+        """
+        from github import RateLimitExceededException
 
-    def get_github_gist(self, package_url):
-        """Returns the GitHub gist object."""
-        if self.github is None:
-            self.init_github_client()
-        logger.debug(f"Getting GitHub gist for {package_url}")
+        self.ensure_github_client()
+        rate_limiter = self.get_rate_limiter()
+        logger.debug(f"Getting GitHub {kind} {url_path}")
         try:
-            owner, gist = Base.get_owner_and_repo(package_url)
-            gist = self.github.get_gist(f"{gist}")
-            self.update_github_rate_limit()
-            return gist
+            attempt = 0
+            while True:
+                rate_limiter.acquire("github")
+                try:
+                    with timings.span("github request", url=url_path):
+                        headers, data = self.github.requester.requestJsonAndCheck("GET", url_path, headers=MetadataCache.conditional_headers(cache_entry))
+                    rate_limiter.record("github", headers)
+                    break
+                except RateLimitExceededException as ex:
+                    # another client used up the quota or a secondary limit was hit, wait for it or defer
+                    attempt += 1
+                    if not rate_limiter.record_refused("github", ex.headers or {}, attempt):
+                        logger.warning(f"GitHub refused {url_path} because of a rate limit {attempt} times, giving up")
+                        if rate_limiter.policy == "defer":
+                            raise RateLimitDeferred("github")
+                        raise
+        except RateLimitDeferred:
+            raise
         except Exception as ex:
-            logger.error("Could not get GitHub repo:")
+            logger.error(f"Could not get GitHub {kind}:")
             logger.error(ex)
             exit(1)
+        if data is None and cache_entry is None:
+            logger.error(f"Could not get GitHub {kind}: empty response for {url_path}")
+            exit(1)
+        return headers, data
+
+    def ensure_gitlab_client(self):
+        """Initializes the GitLab client if it hasn't been already. Safe to call from worker threads."""
+        if self.gitlab is None:
+            with self.client_lock:
+                if self.gitlab is None:
+                    self.init_gitlab_client()
+
+    def get_gitlab_url(self):
+        """Returns the base URL of the GitLab instance."""
+        return (self.options.get("--gitlab-url") or "https://gitlab.com").rstrip("/")
 
+    @timed("create gitlab client")
     def init_gitlab_client(self):
         """Initializes the GitLab client."""
         if self.gitlab is not None:
             self.close_gitlab_client()
         logger.debug("Creating GitLab client")
+        from gitlab import Gitlab
+
         try:
             if self.options["--gitlab-auth-token"]:
                 logger.debug("Accessing the GitLab API with an auth token")
-                self.gitlab = Gitlab("https://gitlab.com", private_token=self.options["--gitlab-auth-token"])
+                self.gitlab = Gitlab(self.get_gitlab_url(), private_token=self.options["--gitlab-auth-token"])
             else:
                 logger.debug("Accessing the GitLab API anonymously")
-                self.gitlab = Gitlab("https://gitlab.com")
-            self.gitlab.auth()
+                self.gitlab = Gitlab(self.get_gitlab_url())
+            self.gitlab.session.hooks["response"].append(Base.keep_gitlab_response)
+            if self.options["--gitlab-auth-token"]:
+                # checks the token; there's nothing to check (or fetch) without one
+                self.gitlab.auth()
         except Exception as ex:
             logger.error("Could not create GitLab client:")
             logger.error(ex)
             exit(1)
 
+    @staticmethod
+    def keep_gitlab_response(response, *args, **kwargs):
+        """Keeps the GitLab client's last response on this thread, for the headers of refused requests (GitlabHttpError doesn't have them)."""
+        Base.gitlab_responses.headers = response.headers
+
     def close_gitlab_client(self):
         """Closes the GitLab client."""
         if self.gitlab is not None:
@@ -439,28 +1221,70 @@ class Base(object):
             try:
                 # There is no close method for the GitLab client
                 self.gitlab = None
+                if self.gitlab_graphql is not None:
+                    self.gitlab_graphql.close()
+                    self.gitlab_graphql = None
             except Exception as ex:
                 logger.error("Could not close GitLab client:")
                 logger.error(ex)
                 exit(1)
 
-    def get_gitlab_repo(self, package_url):
-        """Returns the GitLab repository object."""
-        if self.gitlab is None:
-            self.init_gitlab_client()
-        logger.debug(f"Getting GitLab repo for {package_url}")
+    def get_gitlab_json(self, url_path, cache_entry=None, query_data=None):
+        """Makes a (conditional) GET request to the GitLab API.
+
+        Returns the response headers and the decoded JSON, which is None when
+        the server replied that `cache_entry` is still current (304).
+        """
+        from gitlab.exceptions import GitlabHttpError
+
+        self.ensure_gitlab_client()
+        rate_limiter = self.get_rate_limiter()
+        logger.debug(f"Getting GitLab {url_path}")
         try:
-            owner, repo = Base.get_owner_and_repo(package_url)
-            repo = self.gitlab.projects.get(f"{owner}/{repo}", license=True)
-            return repo
+            attempt = 0
+            while True:
+                rate_limiter.acquire("gitlab")
+                try:
+                    with timings.span("gitlab request", url=url_path):
+                        # refused requests are retried here, through the rate limiter, rather than by python-gitlab
+                        response = self.gitlab.http_request(
+                            "get", url_path, query_data=query_data, extra_headers=MetadataCache.conditional_headers(cache_entry),
+                            obey_rate_limit=False, max_retries=0,
+                        )
+                    break
+                except GitlabHttpError as ex:
+                    headers = getattr(Base.gitlab_responses, "headers", None) or {}
+                    if not rate_limiter.is_refusal("gitlab", ex.response_code, headers):
+                        raise
+                    # another client used up the quota or a secondary limit was hit, wait for it or defer
+                    attempt += 1
+                    if not rate_limiter.record_refused("gitlab", headers, attempt):
+                        logger.warning(f"GitLab refused {url_path} because of a rate limit {attempt} times, giving up")
+                        if rate_limiter.policy == "defer":
+                            raise RateLimitDeferred("gitlab")
+                        raise
+            headers = {key.lower(): value for key, value in response.headers.items()}
+            rate_limiter.record("gitlab", headers)
+            return headers, response.json()
+        except RateLimitDeferred:
+            raise
+        except GitlabHttpError as ex:
+            if ex.response_code == 304 and cache_entry is not None:
+                return {}, None
+            logger.error("Could not get GitLab repo:")
+            logger.error(ex)
+            exit(1)
         except Exception as ex:
             logger.error("Could not get GitLab repo:")
             logger.error(ex)
             exit(1)
 
+    @timed("read remote")
     def get_remote_url(self, package_path):
         """Returns the remote URL of the repository."""
         logger.debug(f"Getting remote URL for {package_path}")
+        from git import Repo
+
         try:
             repo = Repo(package_path)
             try:
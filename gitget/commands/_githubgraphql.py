@@ -0,0 +1,92 @@
+from loguru import logger
+import requests
+from ._ratelimiter import RateLimitDeferred
+from ._timings import timings
+
+
+REPOSITORY_FIELDS = """
+fragment RepositoryFields on Repository {
+    nameWithOwner
+    description
+    homepageUrl
+    primaryLanguage { name }
+    diskUsage
+    stargazerCount
+    watchers { totalCount }
+    forkCount
+    repositoryTopics(first: 100) { nodes { topic { name } } }
+    licenseInfo { key name spdxId }
+    createdAt
+    updatedAt
+    pushedAt
+}
+"""
+
+
+class GithubGraphQL(object):
+    """Fetches metadata for many GitHub repositories at once through the GraphQL API."""
+
+    # GitHub limits a single query to 100 top-level repository lookups
+    batch_size = 100
+
+    def __init__(self, api_url, auth_token, rate_limiter, timeout=30):
+        self.url = f"{api_url.rstrip('/')}/graphql"
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"bearer {auth_token}"
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def build_query(full_names):
+        """Builds a query that looks up every `owner/repo` in `full_names` using aliases.
+
+        Returns the query and its variables.
+        """
+        declarations = []
+        lookups = []
+        variables = {}
+        for i, full_name in enumerate(full_names):
+            owner, repo = full_name.split("/", 1)
+            declarations.append(f"$o{i}: String!, $n{i}: String!")
+            lookups.append(f"    r{i}: repository(owner: $o{i}, name: $n{i}) {{ ...RepositoryFields }}")
+            variables[f"o{i}"] = owner
+            variables[f"n{i}"] = repo
+        query = f"query({', '.join(declarations)}) {{\n" + "\n".join(lookups) + "\n}\n" + REPOSITORY_FIELDS
+        return query, variables
+
+    def get_repositories(self, full_names):
+        """Returns a dict of `owner/repo` -> repository node for every repository that could be fetched.
+
+        Repositories that don't exist (or couldn't be fetched) are left out,
+        so callers can fall back to the REST API for them.
+        """
+        full_names = list(dict.fromkeys(full_names))
+        repositories = {}
+        for start in range(0, len(full_names), self.batch_size):
+            batch = full_names[start:start + self.batch_size]
+            logger.debug(f"Fetching {len(batch)} GitHub repositories with GraphQL")
+            query, variables = GithubGraphQL.build_query(batch)
+            try:
+                self.rate_limiter.acquire("github-graphql")
+            except RateLimitDeferred:
+                break
+            try:
+                with timings.span("github graphql request", repositories=len(batch)):
+                    response = self.session.post(self.url, json={"query": query, "variables": variables}, timeout=self.timeout)
+                self.rate_limiter.record("github-graphql", response.headers)
+                response.raise_for_status()
+                document = response.json()
+            except Exception as ex:
+                logger.warning(f"Could not fetch GitHub repositories with GraphQL: {ex}")
+                continue
+            for error in document.get("errors") or []:
+                logger.debug(f"GitHub GraphQL error: {error.get('message')}")
+            data = document.get("data") or {}
+            for i, full_name in enumerate(batch):
+                node = data.get(f"r{i}")
+                if node is not None:
+                    repositories[full_name] = node
+        return repositories
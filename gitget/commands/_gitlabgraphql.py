@@ -0,0 +1,85 @@
+from loguru import logger
+import requests
+from ._ratelimiter import RateLimitDeferred
+from ._timings import timings
+
+
+PROJECTS_QUERY = """
+query($fullPaths: [String!], $first: Int) {
+    projects(fullPaths: $fullPaths, first: $first) {
+        nodes { ...ProjectFields }
+    }
+}
+
+fragment ProjectFields on Project {
+    fullPath
+    description
+    starCount
+    forksCount
+    topics
+    languages { name share }
+    createdAt
+    updatedAt
+    lastActivityAt
+}
+"""
+
+
+class GitlabGraphQL(object):
+    """Fetches metadata for many GitLab projects at once through the GraphQL API.
+
+    Unlike GitHub's, GitLab's GraphQL API can be used anonymously for public
+    projects. It doesn't have the projects' licenses.
+    """
+
+    # GitLab limits `projects(fullPaths:)` to 50 paths
+    batch_size = 50
+
+    def __init__(self, gitlab_url, auth_token, rate_limiter, timeout=30):
+        self.url = f"{gitlab_url.rstrip('/')}/api/graphql"
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.session = requests.Session()
+        if auth_token:
+            self.session.headers["Authorization"] = f"Bearer {auth_token}"
+
+    def close(self):
+        self.session.close()
+
+    def get_projects(self, full_paths):
+        """Returns a dict of `owner/repo` (lower case) -> project node for every project that could be fetched.
+
+        Projects that don't exist (or couldn't be fetched) are left out, so
+        callers can fall back to the REST API for them.
+        """
+        full_paths = list(dict.fromkeys(full_path.lower() for full_path in full_paths))
+        projects = {}
+        for start in range(0, len(full_paths), self.batch_size):
+            batch = full_paths[start:start + self.batch_size]
+            logger.debug(f"Fetching {len(batch)} GitLab projects with GraphQL")
+            try:
+                self.rate_limiter.acquire("gitlab")
+            except RateLimitDeferred:
+                break
+            try:
+                with timings.span("gitlab graphql request", projects=len(batch)):
+                    response = self.session.post(
+                        self.url,
+                        json={"query": PROJECTS_QUERY, "variables": {"fullPaths": batch, "first": len(batch)}},
+                        timeout=self.timeout,
+                    )
+                self.rate_limiter.record("gitlab", {key.lower(): value for key, value in response.headers.items()})
+                response.raise_for_status()
+                document = response.json()
+            except Exception as ex:
+                logger.warning(f"Could not fetch GitLab projects with GraphQL: {ex}")
+                continue
+            for error in document.get("errors") or []:
+                logger.debug(f"GitLab GraphQL error: {error.get('message')}")
+            data = document.get("data") or {}
+            for node in ((data.get("projects") or {}).get("nodes") or []):
+                # paths are matched case-insensitively, the node has the project's actual case
+                full_path = node["fullPath"].lower()
+                if full_path in batch:
+                    projects[full_path] = node
+        return projects
@@ -0,0 +1,109 @@
+from os import path, scandir
+from shutil import which
+from time import time
+from ._repositorycheck import RepositoryCache, get_common_dirpath
+from ._timings import timings
+
+# the `git maintenance` tasks run on each repository: pack loose objects, consolidate
+# small packs (through a multi-pack-index), update the commit-graph and pack the refs
+MAINTENANCE_TASKS = ("loose-objects", "incremental-repack", "commit-graph", "pack-refs")
+
+# how much lower the priority of maintenance processes is; on Linux their I/O
+# priority follows their CPU priority, unless an I/O class was set
+NICENESS = 10
+
+
+def get_object_store_size(git_dirpath):
+    """Returns the disk space in bytes used by the files in a repository's object directory."""
+    size = 0
+    directories = [path.join(get_common_dirpath(git_dirpath), "objects")]
+    while directories:
+        directory = directories.pop()
+        try:
+            with scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    else:
+                        stats = entry.stat(follow_symlinks=False)
+                        # the space used on disk, which is more than the size for small loose objects
+                        size += stats.st_blocks * 512 if hasattr(stats, "st_blocks") else stats.st_size
+        except OSError:
+            continue
+    return size
+
+
+def format_size(size):
+    """Formats a number of bytes for people, e.g. `12.3 MB`."""
+    value = float(abs(size))
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1000 or unit == "GB":
+            break
+        value /= 1000
+    sign = "-" if size < 0 else ""
+    return f"{sign}{value:.0f} {unit}" if unit == "B" else f"{sign}{value:.1f} {unit}"
+
+
+def maintain_repository(package_path, pack_threads=None):
+    """Runs the maintenance tasks on a package's repository.
+
+    Unreachable loose objects older than `gc.pruneExpire` (two weeks by
+    default) are pruned first, so they aren't packed, and loose objects are
+    deleted as soon as they're packed. Git runs at a lower
+    priority and, with `pack_threads`, repacks with that many threads at most.
+    """
+    from git import Repo
+
+    repo = Repo(package_path)
+    command = ["git"]
+    if pack_threads:
+        command += ["-c", f"pack.threads={pack_threads}"]
+    if which("nice"):
+        command = ["nice", "-n", str(NICENESS)] + command
+
+    prune_expire = repo.config_reader().get_value("gc", "pruneExpire", "2.weeks.ago")
+    if prune_expire != "never":
+        with timings.span("prune", package=package_path):
+            repo.git.execute(command + ["prune", f"--expire={prune_expire}"])
+    # one task at a time: in a single run, incremental-repack doesn't see the pack loose-objects just wrote
+    for task in MAINTENANCE_TASKS:
+        with timings.span(f"maintenance {task}", package=package_path):
+            repo.git.execute(command + ["maintenance", "run", "--quiet", f"--task={task}"])
+    # loose-objects only deletes the loose objects packed by its previous run
+    repo.git.execute(command + ["prune-packed", "--quiet"])
+
+
+class MaintenanceState(RepositoryCache):
+    """When the repository of each package was last maintained, by `maintain`.
+
+    Entries are keyed by package name and hold the package path, the state of
+    its git directory (see get_git_state) after the maintenance, when it ran,
+    how long it took and the size of the object store before and after.
+    """
+
+    description = "maintenance state"
+
+    def is_due(self, package_name, package, state, interval):
+        """Returns False if a package was maintained less than `interval` seconds ago, or its repository hasn't changed since.
+
+        Every package is due with an interval of 0.
+        """
+        if interval <= 0:
+            return True
+        with self.lock:
+            entry = self.entries.get(package_name)
+        if entry is None or entry["path"] != package["path"]:
+            return True
+        return entry["state"] != state and time() - entry["maintained_at"] >= interval
+
+    def put(self, package_name, package, state, duration, size_before, size_after):
+        with self.lock:
+            self.entries[package_name] = {
+                "path": package["path"],
+                "state": state,
+                "maintained_at": time(),
+                "duration": duration,
+                "size_before": size_before,
+                "size_after": size_after,
+            }
+            self.changed = True
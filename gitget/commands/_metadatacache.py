@@ -0,0 +1,113 @@
+from copy import deepcopy
+from os import path, makedirs, replace
+from threading import Lock
+from time import time
+from loguru import logger
+import json
+from ._packagestore import encode_package, decode_package
+
+
+class MetadataCache(object):
+    """Persistent cache of package metadata fetched from GitHub and GitLab.
+
+    Entries are keyed by `<provider>:<owner>/<repo>` and hold the metadata
+    fields of a package along with the ETag/Last-Modified validators of the
+    response they came from and the time they were fetched.
+    """
+
+    def __init__(self, filepath, ttl=0):
+        self.filepath = filepath
+        self.ttl = ttl
+        self.entries = None
+        self.changed = False
+        self.lock = Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def load(self):
+        """Loads the cache file, if there is one."""
+        with self.lock:
+            if self.entries is not None:
+                return
+            self.entries = {}
+            if not path.isfile(self.filepath):
+                return
+            try:
+                with open(self.filepath) as file:
+                    self.entries = json.load(file)
+                logger.debug(f"Loaded {len(self.entries)} cached metadata entries from {self.filepath}")
+            except Exception as ex:
+                logger.warning(f"Ignoring unreadable metadata cache {self.filepath}: {ex}")
+
+    def log_stats(self):
+        """Logs how many entries were used without a request, revalidated and fetched."""
+        logger.debug(f"Metadata cache {self.filepath}: {self.hits} fresh hits, {self.revalidated} revalidated (304), {self.misses} misses")
+
+    def save(self):
+        """Writes the cache file if anything changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                makedirs(path.dirname(self.filepath), exist_ok=True)
+                temp_filepath = f"{self.filepath}.tmp"
+                with open(temp_filepath, "w") as file:
+                    json.dump(self.entries, file)
+                replace(temp_filepath, self.filepath)
+                self.changed = False
+            except Exception as ex:
+                logger.warning(f"Could not write metadata cache {self.filepath}: {ex}")
+
+    def get(self, key):
+        """Returns the cache entry for a key, or None."""
+        self.load()
+        with self.lock:
+            return self.entries.get(key)
+
+    def is_fresh(self, key):
+        """Returns True if the entry for a key was fetched less than `ttl` seconds ago."""
+        entry = self.get(key)
+        return entry is not None and self.ttl > 0 and time() - entry["fetched_at"] < self.ttl
+
+    def get_fresh(self, key):
+        """Returns the cached metadata for a key if it is fresh, otherwise None."""
+        if not self.is_fresh(key):
+            return None
+        with self.lock:
+            self.hits += 1
+            return decode_package(deepcopy(self.entries[key]["metadata"]))
+
+    def put(self, key, metadata, etag=None, last_modified=None):
+        """Stores freshly fetched metadata for a key."""
+        self.load()
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time(),
+                "metadata": encode_package(metadata),
+            }
+            self.changed = True
+
+    def revalidate(self, key):
+        """Marks an entry as confirmed unchanged by the server and returns its metadata."""
+        self.load()
+        with self.lock:
+            self.revalidated += 1
+            entry = self.entries[key]
+            entry["fetched_at"] = time()
+            self.changed = True
+            return decode_package(deepcopy(entry["metadata"]))
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Returns the headers for a conditional request revalidating a cache entry."""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
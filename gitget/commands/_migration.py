@@ -0,0 +1,75 @@
+from os import path, makedirs, remove
+from threading import Lock
+from time import monotonic
+from loguru import logger
+import json
+from ._packagefile import write_file_atomically
+from ._packagestore import encode_package, decode_package
+
+
+class MigrationCheckpoint(object):
+    """The packages already upgraded by a migration of the package file, so an interrupted migration can resume.
+
+    Entries are keyed by package name and hold the entry of the package in
+    the old package file and the upgraded package. An entry is only reused
+    while the old entry is unchanged, and the whole checkpoint only for a
+    migration from the same version. It's written every `interval` seconds
+    (and when saved explicitly), and removed once the migration is done.
+    """
+
+    def __init__(self, filepath, from_version, interval=5):
+        self.filepath = filepath
+        self.from_version = from_version
+        self.interval = interval
+        self.entries = {}
+        self.changed = False
+        self.saved_at = monotonic()
+        self.lock = Lock()
+        if path.isfile(filepath):
+            try:
+                with open(filepath) as file:
+                    document = json.load(file)
+                if document["from_version"] == from_version:
+                    self.entries = document["packages"]
+                    logger.debug(f"Loaded {len(self.entries)} migrated packages from {filepath}")
+            except Exception as ex:
+                logger.warning(f"Ignoring the unreadable migration checkpoint {filepath}: {ex}")
+
+    def get(self, package_name, source):
+        """Returns the upgraded package for an entry of the old package file, or None if it wasn't upgraded yet."""
+        with self.lock:
+            entry = self.entries.get(package_name)
+        if entry is None or entry["source"] != source:
+            return None
+        return decode_package(dict(entry["package"]))
+
+    def put(self, package_name, source, package):
+        """Records an upgraded package, writing the checkpoint if it wasn't for `interval` seconds."""
+        with self.lock:
+            self.entries[package_name] = {"source": source, "package": encode_package(package)}
+            self.changed = True
+            due = monotonic() - self.saved_at >= self.interval
+        if due:
+            self.save()
+
+    def save(self):
+        """Writes the checkpoint if anything changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            document = {"from_version": self.from_version, "packages": self.entries}
+            try:
+                makedirs(path.dirname(self.filepath), exist_ok=True)
+                write_file_atomically(self.filepath, lambda file: json.dump(document, file))
+                self.changed = False
+                self.saved_at = monotonic()
+                logger.debug(f"Migration checkpoint written: {len(self.entries)} packages")
+            except Exception as ex:
+                logger.warning(f"Could not write the migration checkpoint {self.filepath}: {ex}")
+
+    def remove(self):
+        with self.lock:
+            self.entries = {}
+            self.changed = False
+            if path.exists(self.filepath):
+                remove(self.filepath)
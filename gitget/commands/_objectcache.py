@@ -0,0 +1,126 @@
+from hashlib import sha1
+from os import path, makedirs, remove
+from threading import Lock
+from urllib.parse import urlparse
+from loguru import logger
+import re
+from ._packagefile import PackageFileLock
+from ._repositorycheck import get_git_dirpath
+from ._timings import timings
+
+
+def get_alternates_filepath(package_path):
+    """Returns the file listing the object directories a repository borrows objects from, or None if it isn't a repository."""
+    git_dirpath = get_git_dirpath(package_path)
+    if git_dirpath is None:
+        return None
+    return path.join(git_dirpath, "objects", "info", "alternates")
+
+
+def get_alternates(package_path):
+    """Returns the object directories a repository borrows objects from."""
+    filepath = get_alternates_filepath(package_path)
+    if filepath is None or not path.isfile(filepath):
+        return []
+    with open(filepath) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+def dissociate(package_path):
+    """Copies the objects a repository borrows into it and stops it borrowing them, like `git clone --dissociate`."""
+    from git import Repo
+
+    repo = Repo(package_path)
+    with timings.span("repack", package=package_path):
+        # without -l, objects from the alternates are packed too
+        repo.git.repack("-a", "-d", "--quiet")
+    remove(get_alternates_filepath(package_path))
+
+
+class ObjectCache(object):
+    """A directory of bare mirrors that clones borrow objects from (`--object-cache`).
+
+    Repositories are mirrored by host and repository name, so forks of a
+    repository (which usually keep its name) share a mirror, each of them
+    being a remote of it. Packages are cloned with `--reference` to the
+    mirror: objects already in it aren't downloaded again or stored in the
+    package, whose `.git/objects/info/alternates` points at the mirror
+    instead. Mirrors are updated before the packages using them are
+    pulled. A mirror mustn't be deleted while packages use it, see
+    `gitget dissociate`.
+    """
+
+    def __init__(self, dirpath):
+        self.dirpath = path.abspath(path.expanduser(dirpath))
+        self.lock = Lock()
+        self.mirror_locks = {}
+
+    @staticmethod
+    def get_key(url):
+        """Returns (host, repository name) for a URL, including SSH URLs like `git@host:owner/repo.git`."""
+        parsed_url = urlparse(url)
+        if parsed_url.scheme == "file":
+            host, url_path = "local", parsed_url.path
+        elif parsed_url.scheme and parsed_url.netloc:
+            host, url_path = parsed_url.hostname or "local", parsed_url.path
+        elif re.match(r"^[^/:]+:", url):
+            host, url_path = url.split(":", 1)
+            host = host.split("@")[-1]
+        else:
+            host, url_path = "local", url
+        repo = url_path.rstrip("/").split("/")[-1]
+        if repo.endswith(".git"):
+            repo = repo[:-4]
+        sanitize = lambda name: re.sub(r"[^\w.-]", "_", name).strip(".").lower() or "_"
+        return sanitize(host), sanitize(repo)
+
+    def get_mirror_path(self, url):
+        host, repo = ObjectCache.get_key(url)
+        return path.join(self.dirpath, host, f"{repo}.git")
+
+    @staticmethod
+    def get_remote_name(url):
+        """Returns the name of the remote for a URL in its mirror (URLs can't be remote names)."""
+        return f"r{sha1(url.encode()).hexdigest()[:12]}"
+
+    def uses(self, package_path):
+        """Returns True if a repository borrows objects from a mirror in the cache."""
+        return any(path.abspath(alternate).startswith(self.dirpath + path.sep) for alternate in get_alternates(package_path))
+
+    def get_mirror_lock(self, mirror_path):
+        """Returns the lock on a mirror, shared by the threads of this process and with other gitget processes."""
+        with self.lock:
+            if mirror_path not in self.mirror_locks:
+                self.mirror_locks[mirror_path] = PackageFileLock(f"{mirror_path}.lock", f"the mirror {mirror_path}")
+            return self.mirror_locks[mirror_path]
+
+    def update(self, url):
+        """Fetches a repository into its mirror, creating the mirror if needed.
+
+        Returns the path of the mirror, or None if it couldn't be updated (the
+        package is then cloned or pulled without it).
+        """
+        from git import Repo
+
+        mirror_path = self.get_mirror_path(url)
+        remote_name = ObjectCache.get_remote_name(url)
+        try:
+            makedirs(path.dirname(mirror_path), exist_ok=True)
+            with self.get_mirror_lock(mirror_path), timings.span("update mirror", url=url):
+                if not path.isdir(mirror_path):
+                    logger.debug(f"Creating the mirror {mirror_path}")
+                    repo = Repo.init(mirror_path, bare=True)
+                    # packages may still use objects that are no longer reachable from the
+                    # mirror's branches (e.g. after a force push), gc mustn't delete them
+                    repo.git.config("gc.pruneExpire", "never")
+                repo = Repo(mirror_path)
+                if remote_name not in (remote.name for remote in repo.remotes):
+                    # tags of different forks would clash, only branches are mirrored
+                    repo.git.remote("add", "--no-tags", remote_name, url)
+                logger.debug(f"Fetching {url} into the mirror {mirror_path}")
+                # deleted branches are kept for the same reason
+                repo.git.fetch("--quiet", remote_name)
+            return mirror_path
+        except Exception as ex:
+            logger.warning(f"Could not update the mirror of {url} in the object cache, not using it: {ex}")
+            return None
@@ -0,0 +1,150 @@
+from os import path, fsync, replace
+from threading import RLock
+from loguru import logger
+import json
+from ._packagestore import encode_package, decode_package
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, the package file isn't locked there
+    fcntl = None
+
+
+class PackageFileLock(object):
+    """An advisory lock on the package file, shared by every gitget process.
+
+    The lock is held on a separate `<package file>.lock` file, so the package
+    file itself can be replaced while it's held. It is re-entrant within a
+    process. `name` is what the lock protects, for the message shown while
+    waiting for it (other files are locked the same way).
+    """
+
+    def __init__(self, filepath, name="the package file"):
+        self.filepath = filepath
+        self.name = name
+        self.lock = RLock()
+        self.file = None
+        self.depth = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0:
+            self.file = open(self.filepath, "a")
+            if fcntl is not None:
+                try:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    logger.info(f"Waiting for another gitget process to finish with {self.name}")
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.lock.release()
+
+
+class PackageJournal(object):
+    """Append-only journal of changes to the packages of a package file.
+
+    Each line is one write: a JSON object with the packages that were added
+    or updated (`put`) and the names of the ones that were removed
+    (`remove`). Replaying the journal over the package file gives the
+    current package list, and since every entry holds complete packages,
+    replaying it more than once gives the same result. Must only be
+    written while holding the PackageFileLock.
+    """
+
+    # compact once the journal is this big, or a quarter of the package file if that's bigger
+    compact_size = 64 * 1024
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    @staticmethod
+    def snapshot(package_list):
+        """Returns a copy of a package list to find out what changed in it later."""
+        return {package_name: dict(package) for package_name, package in package_list.items()}
+
+    @staticmethod
+    def diff(snapshot, package_list):
+        """Returns the packages added or changed since a snapshot, and the names of the removed ones."""
+        puts = {package_name: package for package_name, package in package_list.items() if snapshot.get(package_name) != package}
+        removes = [package_name for package_name in snapshot if package_name not in package_list]
+        return puts, removes
+
+    def replay(self, package_list):
+        """Applies every entry in the journal to a package list. Returns the number of entries applied."""
+        try:
+            with open(self.filepath) as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return 0
+        applied = 0
+        for line_number, line in enumerate(lines, 1):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if line_number == len(lines) and not line.endswith("\n"):
+                    # gitget stopped while writing this entry, so it was never completed
+                    logger.debug(f"Ignoring incomplete entry at the end of {self.filepath}")
+                else:
+                    logger.warning(f"Ignoring unreadable entry {line_number} in {self.filepath}")
+                continue
+            for package_name, package in entry.get("put", {}).items():
+                package_list[package_name] = decode_package(package)
+            for package_name in entry.get("remove", []):
+                package_list.pop(package_name, None)
+            applied += 1
+        if applied:
+            logger.debug(f"Replayed {applied} entries from {self.filepath}")
+        return applied
+
+    def append(self, puts, removes):
+        """Appends one entry with the given changes, synced to disk before returning."""
+        if not puts and not removes:
+            return
+        entry = {"put": {package_name: encode_package(package) for package_name, package in puts.items()}, "remove": removes}
+        line = json.dumps(entry, sort_keys=True) + "\n"
+        with open(self.filepath, "ab+") as file:
+            # drop an entry left incomplete by a crash, or this one would be lost with it
+            if file.seek(0, 2) > 0:
+                file.seek(-1, 2)
+                if file.read(1) != b"\n":
+                    file.seek(0)
+                    contents = file.read()
+                    file.truncate(contents.rfind(b"\n") + 1)
+            file.write(line.encode())
+            file.flush()
+            fsync(file.fileno())
+        logger.debug(f"Journaled {len(puts)} changed and {len(removes)} removed packages to {self.filepath}")
+
+    def needs_compaction(self, package_list_filepath):
+        """Returns True if the journal has grown big enough to be folded into the package file."""
+        try:
+            journal_size = path.getsize(self.filepath)
+        except OSError:
+            return False
+        return journal_size > max(self.compact_size, path.getsize(package_list_filepath) // 4)
+
+    def clear(self):
+        """Empties the journal, once its changes are in the package file."""
+        if path.exists(self.filepath):
+            with open(self.filepath, "w") as file:
+                fsync(file.fileno())
+
+
+def write_file_atomically(filepath, write):
+    """Writes a file through `write(file)` so that it's either completely written or unchanged."""
+    temp_filepath = f"{filepath}.tmp"
+    with open(temp_filepath, "w") as file:
+        write(file)
+        file.flush()
+        fsync(file.fileno())
+    replace(temp_filepath, filepath)
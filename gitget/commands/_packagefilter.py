@@ -0,0 +1,140 @@
+from datetime import datetime, timezone
+from heapq import nlargest, nsmallest
+from itertools import islice
+import re
+
+STRING_FIELDS = ("name", "path", "owner", "repo", "url", "description", "homepage", "license")
+LIST_FIELDS = ("languages", "topics")
+NUMBER_FIELDS = ("size_kb", "stars", "watchers", "forks")
+DATE_FIELDS = ("created_at", "updated_at", "last_commit_at", "metadata_fetched_at")
+# other names accepted for fields
+FIELD_ALIASES = {"language": "languages", "topic": "topics", "size": "size_kb", "last_commit": "last_commit_at"}
+
+EXPRESSION_PATTERN = re.compile(r"^\s*(\w+)\s*(!=|>=|<=|=|~|>|<)\s*(.*?)\s*$")
+
+
+def get_field(package_name, package, field):
+    """Returns the value of a field of a package, with the license reduced to its name and dates in UTC."""
+    if field == "name":
+        return package_name
+    value = package.get(field)
+    if field == "license" and value is not None:
+        return value.get("name")
+    if field in DATE_FIELDS and value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def parse_field(field):
+    field = FIELD_ALIASES.get(field, field)
+    if field not in STRING_FIELDS + LIST_FIELDS + NUMBER_FIELDS + DATE_FIELDS:
+        raise ValueError(f"Unknown field: {field}")
+    return field
+
+
+def parse_date(value):
+    """Parses an ISO date (or date and time), in UTC unless it says otherwise."""
+    date = datetime.fromisoformat(value)
+    return date if date.tzinfo is not None else date.replace(tzinfo=timezone.utc)
+
+
+class PackageFilter(object):
+    """A condition on a field of packages, parsed from an expression like `stars>=100`.
+
+    Operators are `=`, `!=`, `~` (contains), `<`, `<=`, `>` and `>=`. Text is
+    compared without case; the license matches on its name or key. For
+    lists (`topics`, `languages`), `=` and `~` match if any item does and
+    `!=` if none does. Numbers and dates (ISO, UTC by default) can be
+    compared with `<`, `<=`, `>` and `>=`.
+    """
+
+    def __init__(self, expression):
+        match = EXPRESSION_PATTERN.match(expression)
+        if match is None:
+            raise ValueError(f"Invalid filter expression: {expression}")
+        field, self.operator, value = match.groups()
+        self.field = parse_field(field)
+        ordering = self.operator in ("<", "<=", ">", ">=")
+        if self.field in NUMBER_FIELDS:
+            try:
+                self.value = float(value)
+            except ValueError:
+                raise ValueError(f"Invalid number in filter expression: {expression}")
+        elif self.field in DATE_FIELDS:
+            try:
+                self.value = parse_date(value)
+            except ValueError:
+                raise ValueError(f"Invalid date in filter expression: {expression}")
+        elif ordering:
+            raise ValueError(f"{self.operator} only works with numbers and dates: {expression}")
+        else:
+            self.value = value.lower()
+        if self.operator == "~" and self.field in NUMBER_FIELDS + DATE_FIELDS:
+            raise ValueError(f"~ only works with text: {expression}")
+
+    def matches(self, package_name, package):
+        if self.field == "license":
+            license = package.get("license") or {}
+            values = [value.lower() for value in (license.get("name"), license.get("key")) if value]
+        elif self.field in LIST_FIELDS:
+            values = [str(value).lower() for value in package.get(self.field) or []]
+        else:
+            value = get_field(package_name, package, self.field)
+            if value is None:
+                return self.operator == "!="
+            if self.field in NUMBER_FIELDS + DATE_FIELDS:
+                return self.compare(value)
+            values = [str(value).lower()]
+
+        if self.operator == "=":
+            return self.value in values
+        if self.operator == "!=":
+            return self.value not in values
+        return any(self.value in value for value in values)
+
+    def compare(self, value):
+        if self.operator == "=":
+            return value == self.value
+        if self.operator == "!=":
+            return value != self.value
+        if self.operator == "<":
+            return value < self.value
+        if self.operator == "<=":
+            return value <= self.value
+        if self.operator == ">":
+            return value > self.value
+        return value >= self.value
+
+
+def select_packages(package_list, filters=(), sort=None, limit=None):
+    """Returns an iterable of the (name, package) pairs that match every filter, sorted and limited.
+
+    The package list is gone through once. `sort` is a field name, prefixed
+    with `-` to sort in descending order; packages without a value come last
+    either way. With both `sort` and `limit`, only the `limit` first packages
+    are kept in memory along the way. Without `sort`, packages are streamed
+    in the package list's order.
+    """
+    filters = [PackageFilter(expression) for expression in filters]
+    descending = sort is not None and sort.startswith("-")
+    if sort is not None:
+        field = parse_field(sort.lstrip("-"))
+        if field in LIST_FIELDS:
+            raise ValueError(f"Can't sort on a list: {field}")
+    if limit is not None and limit < 0:
+        raise ValueError(f"Invalid limit: {limit}")
+
+    packages = ((package_name, package) for package_name, package in package_list.items() if all(condition.matches(package_name, package) for condition in filters))
+    if sort is None:
+        return packages if limit is None else islice(packages, limit)
+
+    def get_key(item):
+        value = get_field(item[0], item[1], field)
+        if value is None:
+            # missing values sort last, whatever the direction
+            return (not descending, 0)
+        return (descending, value.lower() if isinstance(value, str) else value)
+
+    if limit is not None:
+        return (nlargest if descending else nsmallest)(limit, packages, key=get_key)
+    return sorted(packages, key=get_key, reverse=descending)
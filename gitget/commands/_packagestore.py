@@ -0,0 +1,182 @@
+from collections.abc import MutableMapping
+from datetime import datetime
+from threading import Lock
+import json
+import sqlite3
+
+
+DATETIME_FIELDS = ("created_at", "updated_at", "last_commit_at", "metadata_fetched_at")
+
+
+def encode_package(package):
+    """Returns a JSON-serialisable copy of a package (datetimes become ISO strings)."""
+    package = dict(package)
+    for field in DATETIME_FIELDS:
+        if isinstance(package.get(field), datetime):
+            package[field] = package[field].isoformat()
+    return package
+
+
+def decode_package(package):
+    """Reverses encode_package."""
+    for field in DATETIME_FIELDS:
+        if isinstance(package.get(field), str):
+            package[field] = datetime.fromisoformat(package[field])
+    return package
+
+
+class SqlitePackageStore(object):
+    """Stores packages in an SQLite database, one row per package, indexed by name and path."""
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = Lock()
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS packages (name TEXT PRIMARY KEY, path TEXT, data TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS packages_path ON packages (path)")
+        self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def get(self, name):
+        """Returns the encoded package with a name, or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM packages WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else None
+
+    def contains(self, name):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM packages WHERE name = ?", (name,)).fetchone() is not None
+
+    def get_all(self):
+        """Returns a list of (name, encoded package) for every package."""
+        with self.lock:
+            return self.connection.execute("SELECT name, data FROM packages ORDER BY name").fetchall()
+
+    def find_names_by_paths(self, package_paths):
+        """Returns a dict of path -> package name for the paths that belong to a package."""
+        package_paths = list(package_paths)
+        names = {}
+        with self.lock:
+            # stay under SQLite's limit on the number of parameters
+            for start in range(0, len(package_paths), 500):
+                chunk = package_paths[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                for name, package_path in self.connection.execute(f"SELECT name, path FROM packages WHERE path IN ({placeholders})", chunk):
+                    names[package_path] = name
+        return names
+
+    def apply(self, upserts, deletes, replace=False):
+        """Writes changed packages and deletes removed ones in a single transaction.
+
+        `upserts` is a list of (name, path, encoded package). With `replace`,
+        every existing package is removed first.
+        """
+        with self.lock, self.connection:
+            if replace:
+                self.connection.execute("DELETE FROM packages")
+            self.connection.executemany("DELETE FROM packages WHERE name = ?", [(name,) for name in deletes])
+            self.connection.executemany(
+                "INSERT INTO packages (name, path, data) VALUES (?, ?, ?) ON CONFLICT(name) DO UPDATE SET path = excluded.path, data = excluded.data",
+                upserts,
+            )
+
+
+class SqlitePackageList(MutableMapping):
+    """The package list of an SQLite package store.
+
+    Behaves like the dict returned for YAML package files, but only loads
+    the packages that are used and keeps track of what changed, so writing
+    it back only touches the rows of changed or removed packages.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.packages = {}
+        self.originals = {}
+        self.deleted = set()
+        self.all_loaded = False
+
+    def __load(self, name, data):
+        package = decode_package(json.loads(data))
+        self.packages[name] = package
+        self.originals[name] = data
+
+    def __load_all(self):
+        if self.all_loaded:
+            return
+        for name, data in self.store.get_all():
+            if name not in self.originals and name not in self.deleted:
+                self.__load(name, data)
+        self.all_loaded = True
+
+    def __getitem__(self, name):
+        if name in self.packages:
+            return self.packages[name]
+        if name in self.deleted or self.all_loaded:
+            raise KeyError(name)
+        data = self.store.get(name)
+        if data is None:
+            raise KeyError(name)
+        self.__load(name, data)
+        return self.packages[name]
+
+    def __setitem__(self, name, package):
+        self.packages[name] = package
+        self.deleted.discard(name)
+
+    def __delitem__(self, name):
+        self[name]
+        del self.packages[name]
+        self.deleted.add(name)
+
+    def __contains__(self, name):
+        if name in self.packages:
+            return True
+        if name in self.deleted or self.all_loaded:
+            return False
+        return self.store.contains(name)
+
+    def __iter__(self):
+        self.__load_all()
+        return iter(sorted(self.packages))
+
+    def __len__(self):
+        self.__load_all()
+        return len(self.packages)
+
+    def find_names_by_paths(self, package_paths):
+        """Returns a dict of path -> package name, using the path index for packages that weren't loaded."""
+        package_paths = set(package_paths)
+        names = {}
+        for package_path, name in self.store.find_names_by_paths(package_paths).items():
+            if name not in self.deleted and name not in self.packages:
+                names[package_path] = name
+        for name, package in self.packages.items():
+            if package["path"] in package_paths:
+                names[package["path"]] = name
+        return names
+
+    def save(self):
+        """Writes the changed and removed packages to the store. Returns the names of the written and removed packages."""
+        upserts = []
+        for name, package in self.packages.items():
+            data = json.dumps(encode_package(package), sort_keys=True)
+            if self.originals.get(name) != data:
+                upserts.append((name, package["path"], data))
+                self.originals[name] = data
+        deletes = [name for name in self.deleted if name in self.originals]
+        self.store.apply(upserts, deletes)
+        for name in deletes:
+            self.originals.pop(name)
+        self.deleted = set()
+        return [name for name, _, _ in upserts], deletes
+
+    @staticmethod
+    def replace_store(store, package_list):
+        """Replaces everything in the store with the packages in a dict (used when importing)."""
+        upserts = [(name, package["path"], json.dumps(encode_package(package), sort_keys=True)) for name, package in package_list.items()]
+        store.apply(upserts, [], replace=True)
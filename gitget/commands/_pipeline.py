@@ -0,0 +1,129 @@
+from queue import Queue
+from threading import Lock, Thread
+from time import monotonic
+from loguru import logger
+
+
+class PipelineStage(object):
+    """A step of a Pipeline, run by `workers` threads.
+
+    `function` is called with each item and returns the item to pass on to
+    the next stage, or None if the item failed (it then skips the rest of
+    the pipeline).
+    """
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.queue = None
+        self.lock = Lock()
+        self.finished_workers = 0
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+
+class Pipeline(object):
+    """Streams items through stages that run at the same time.
+
+    Each stage has its own worker threads and reads from a bounded queue fed
+    by the stage before it, so a slow stage holds the earlier ones back
+    instead of letting work pile up. Items come out of `run` as soon as they
+    finish (or fail) on the thread iterating over it.
+    """
+
+    # how often the state of the stages is logged while the pipeline runs
+    stats_interval = 5
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.results = Queue()
+        self.started = None
+
+    def run(self, items):
+        """Runs every item through the pipeline.
+
+        Yields (item, failed stage name) for each item, with None as the
+        stage name for items that made it through every stage.
+        """
+        for stage in self.stages:
+            stage.queue = Queue(maxsize=self.queue_size)
+        self.started = monotonic()
+        threads = [Thread(target=self.feed, args=(items,), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                threads.append(Thread(target=self.work, args=(index,), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        last_stats = monotonic()
+        while True:
+            result = self.results.get()
+            if result is self.results:
+                break
+            yield result
+            if monotonic() - last_stats >= self.stats_interval:
+                self.log_stats()
+                last_stats = monotonic()
+        for thread in threads:
+            thread.join()
+        self.log_stats()
+
+    def feed(self, items):
+        first_stage = self.stages[0]
+        for item in items:
+            first_stage.queue.put((item, item))
+        for _ in range(first_stage.workers):
+            first_stage.queue.put(None)
+
+    def work(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            job = stage.queue.get()
+            if job is None:
+                break
+            original_item, item = job
+            started = monotonic()
+            try:
+                result = stage.function(item)
+            except SystemExit:
+                # Base reports errors itself before exiting
+                result = None
+            except Exception:
+                logger.exception(f"Pipeline stage {stage.name} failed")
+                result = None
+            with stage.lock:
+                stage.busy_seconds += monotonic() - started
+                stage.processed += 1
+                if result is None:
+                    stage.failed += 1
+            if result is None:
+                self.results.put((original_item, stage.name))
+            elif next_stage is None:
+                self.results.put((result, None))
+            else:
+                next_stage.queue.put((original_item, result))
+
+        # the last worker of a stage to finish tells the next stage (or `run`) there's nothing more
+        with stage.lock:
+            stage.finished_workers += 1
+            last_worker = stage.finished_workers == stage.workers
+        if last_worker:
+            if next_stage is None:
+                self.results.put(self.results)
+            else:
+                for _ in range(next_stage.workers):
+                    next_stage.queue.put(None)
+
+    def log_stats(self):
+        elapsed = max(monotonic() - self.started, 1e-9)
+        for stage in self.stages:
+            with stage.lock:
+                utilisation = stage.busy_seconds / (elapsed * stage.workers)
+                logger.debug(
+                    f"Pipeline stage {stage.name}: {stage.processed} done ({stage.failed} failed, {stage.processed / elapsed:.1f}/s), "
+                    f"queue {stage.queue.qsize()}/{self.queue_size}, {stage.workers} worker(s) {utilisation:.0%} busy"
+                )
@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from os import environ, get_terminal_size as get_stream_size
+from shutil import get_terminal_size
+from sys import stderr
+from threading import Lock
+from time import monotonic
+
+
+class ProgressTask(object):
+    """The progress of one package's git command, shown on its own line by a ProgressDisplay."""
+
+    def __init__(self, display, name):
+        self.display = display
+        self.name = name
+        self.phase = "starting"
+        self.cur_count = 0
+        self.max_count = None
+        self.throughput = None
+
+    def update(self, phase, cur_count, max_count=None, throughput=None):
+        """Records the progress of the task; the display is redrawn at most `ProgressDisplay.interval` seconds apart."""
+        if phase != self.phase or throughput is not None:
+            self.throughput = throughput
+        self.phase = phase
+        self.cur_count = cur_count
+        self.max_count = max_count
+        self.display.refresh()
+
+    def render(self, name_width):
+        line = f"  {self.name[:name_width]:<{name_width}}  {self.phase}"
+        if self.max_count:
+            line += f" {100 * self.cur_count / self.max_count:3.0f}% ({self.cur_count:.0f}/{self.max_count:.0f})"
+        elif self.cur_count:
+            line += f" {self.cur_count:.0f}"
+        if self.throughput:
+            line += f", {self.throughput}"
+        return line
+
+
+class ProgressDisplay(object):
+    """Shows the progress of git commands running on several packages at once.
+
+    On a terminal, there's a line for each package in progress, with the
+    phase of its git command, how far along it is and its throughput, under
+    a bar for all the packages. It's redrawn in place at most every
+    `interval` seconds, however often git reports progress, and log messages
+    are written above it (see write_log). Otherwise, a line with the number
+    of packages done is written every `line_interval` seconds.
+    """
+
+    # seconds between redraws on a terminal
+    interval = 0.1
+    # seconds between progress lines when not writing to a terminal
+    line_interval = 10
+    # the display that log messages are written above
+    active = None
+
+    def __init__(self, total, title, stream=stderr):
+        self.total = total
+        self.title = title
+        self.stream = stream
+        self.interactive = stream.isatty() and environ.get("TERM") != "dumb"
+        self.tasks = []
+        self.done = 0
+        self.started = monotonic()
+        self.next_draw = 0 if self.interactive else self.started + self.line_interval
+        self.drawn_lines = 0
+        self.lock = Lock()
+
+    def __enter__(self):
+        ProgressDisplay.active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            ProgressDisplay.active = None
+            self.erase()
+            self.stream.flush()
+
+    @contextmanager
+    def task(self, name):
+        """Shows the progress of a package's git command while in the context."""
+        task = ProgressTask(self, name)
+        with self.lock:
+            self.tasks.append(task)
+        try:
+            yield task
+        finally:
+            with self.lock:
+                self.tasks.remove(task)
+            self.refresh()
+
+    def advance(self):
+        """Counts a package as done."""
+        with self.lock:
+            self.done += 1
+        self.refresh()
+
+    def refresh(self):
+        """Redraws the display, unless it was redrawn less than `interval` seconds ago."""
+        now = monotonic()
+        if now < self.next_draw:
+            return
+        with self.lock:
+            if now < self.next_draw:
+                return
+            if self.interactive:
+                self.next_draw = now + self.interval
+                self.draw()
+            else:
+                self.next_draw = now + self.line_interval
+                self.stream.write(f"{self.title}: {self.done}/{self.total} packages done, {len(self.tasks)} in progress\n")
+            self.stream.flush()
+
+    def write(self, message):
+        """Writes a message above the display."""
+        with self.lock:
+            if self.interactive:
+                self.erase()
+                self.stream.write(message)
+                self.draw()
+            else:
+                self.stream.write(message)
+            self.stream.flush()
+
+    def render(self):
+        """Returns the lines of the display, which fit in the terminal."""
+        try:
+            width, height = get_stream_size(self.stream.fileno())
+        except (AttributeError, ValueError, OSError):
+            width = height = 0
+        if not width or not height:
+            # unknown (e.g. a pseudo-terminal without a size), the environment's or 80x24
+            width, height = get_terminal_size()
+        lines = []
+        tasks = self.tasks
+        # the bar and a line for hidden tasks stay on screen
+        shown = tasks if len(tasks) <= height - 2 else tasks[:max(0, height - 3)]
+        if shown:
+            name_width = min(max(len(task.name) for task in shown), 40)
+            lines.extend(task.render(name_width) for task in shown)
+        if len(shown) < len(tasks):
+            lines.append(f"  ... and {len(tasks) - len(shown)} more")
+        counts = f" {self.done}/{self.total}  {monotonic() - self.started:.0f}s"
+        bar_width = max(10, min(40, width - len(self.title) - len(counts) - 4))
+        filled = bar_width * self.done // self.total if self.total else bar_width
+        lines.append(f"{self.title} [{'#' * filled}{'-' * (bar_width - filled)}]{counts}")
+        # lines that wrap would throw off the redraws
+        return [line[:width - 1] for line in lines]
+
+    def draw(self):
+        """Draws the display over its previous drawing. The lock must be held."""
+        lines = self.render()
+        output = f"\x1b[{self.drawn_lines}F" if self.drawn_lines else ""
+        output += "".join(f"{line}\x1b[K\n" for line in lines) + "\x1b[J"
+        self.stream.write(output)
+        self.drawn_lines = len(lines)
+
+    def erase(self):
+        """Removes the display from the terminal. The lock must be held."""
+        if self.drawn_lines:
+            self.stream.write(f"\x1b[{self.drawn_lines}F\x1b[J")
+            self.drawn_lines = 0
+
+
+def write_log(message):
+    """A log sink writing to standard error, above the progress display if one is shown."""
+    display = ProgressDisplay.active
+    if display is not None and display.stream is stderr:
+        display.write(message)
+    else:
+        stderr.write(message)
+        stderr.flush()
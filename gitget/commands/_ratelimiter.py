@@ -0,0 +1,166 @@
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from time import monotonic, sleep, time
+from loguru import logger
+from ._timings import timings
+
+
+class RateLimitDeferred(Exception):
+    """Raised instead of waiting when an API quota is exhausted and requests are being deferred."""
+
+
+class RateLimiter(object):
+    """Schedules API requests for GitHub and GitLab.
+
+    Requests to each API are paced with a token bucket. The remaining quota
+    is tracked from the rate limit headers of every response, so the quota
+    never needs to be polled. Once it runs out, `acquire` either sleeps until
+    the quota resets (policy `wait`) or raises RateLimitDeferred so callers
+    can skip the request (policy `defer`).
+
+    A request refused because of a rate limit waits for the time the response
+    gives (`retry-after`, or the quota's reset), or else for a backoff that
+    doubles with each attempt, and is retried at most `max_retries` times.
+    """
+
+    # header names (lower case) for the remaining quota, the quota and the reset time
+    headers = {
+        "github": ("x-ratelimit-remaining", "x-ratelimit-limit", "x-ratelimit-reset"),
+        "github-graphql": ("x-ratelimit-remaining", "x-ratelimit-limit", "x-ratelimit-reset"),
+        "gitlab": ("ratelimit-remaining", "ratelimit-limit", "ratelimit-reset"),
+    }
+    # times a request refused because of a rate limit is retried before giving up on it
+    max_retries = 5
+    # seconds to wait after the first refused request without a usable reset time, and at most
+    backoff = 60
+    max_backoff = 900
+
+    def __init__(self, policy="wait", requests_per_second=10, burst=10):
+        if policy not in ("wait", "defer"):
+            raise ValueError(f"Unknown rate limit policy: {policy}")
+        self.policy = policy
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.lock = Lock()
+        self.buckets = {}
+        self.quotas = {}
+        self.deferring = set()
+
+    def acquire(self, api):
+        """Blocks until a request to `api` may be made.
+
+        Raises RateLimitDeferred if the quota is exhausted and the policy is `defer`.
+        """
+        while True:
+            with self.lock:
+                quota = self.quotas.get(api)
+                if quota is not None and quota["remaining"] <= 0:
+                    wait = quota["reset"] - time()
+                    if wait > 0:
+                        if self.policy == "defer":
+                            if api not in self.deferring:
+                                self.deferring.add(api)
+                                logger.warning(f"The {api} API rate limit has been reached, deferring further requests until it resets")
+                            raise RateLimitDeferred(api)
+                    else:
+                        # the quota has reset, the next response will say by how much
+                        self.quotas.pop(api)
+                        self.deferring.discard(api)
+                        quota = None
+
+                if quota is None or quota["remaining"] > 0:
+                    if quota is not None:
+                        # claim the request now so concurrent callers don't overshoot the quota
+                        quota["remaining"] -= 1
+                    tokens, updated = self.buckets.get(api, (self.burst, monotonic()))
+                    now = monotonic()
+                    tokens = min(self.burst, tokens + (now - updated) * self.requests_per_second) - 1
+                    self.buckets[api] = (tokens, now)
+                    wait = -tokens / self.requests_per_second if tokens < 0 else 0
+                    break
+
+            logger.warning(f"The {api} API rate limit has been reached, waiting {int(wait)}s until it resets")
+            with timings.span("rate limit wait", api=api):
+                sleep(wait)
+        if wait > 0:
+            with timings.span("rate limit wait", api=api):
+                sleep(wait)
+
+    def record(self, api, response_headers):
+        """Updates the quota for `api` from the headers of a response."""
+        remaining_header, limit_header, reset_header = self.headers[api]
+        response_headers = {key.lower(): value for key, value in response_headers.items()}
+        retry_after = RateLimiter.get_retry_after(response_headers)
+        if retry_after is not None:
+            # a secondary limit (too many requests at once) can be hit with quota remaining
+            self.exhaust(api, time() + retry_after)
+            logger.debug(f"{api} rate limit: retry after {retry_after}s")
+            return
+        if remaining_header not in response_headers or reset_header not in response_headers:
+            return
+        try:
+            remaining = int(float(response_headers[remaining_header]))
+            limit = int(float(response_headers.get(limit_header, 0)))
+            reset = int(float(response_headers[reset_header]))
+        except ValueError:
+            return
+        with self.lock:
+            quota = self.quotas.get(api)
+            if quota is not None and quota["reset"] == reset:
+                # responses can arrive out of order, the lowest count is the most recent
+                remaining = min(remaining, quota["remaining"])
+            self.quotas[api] = {"remaining": remaining, "limit": limit, "reset": reset}
+        logger.debug(f"{api} rate limit: {limit - remaining}/{limit}, {remaining} remaining (reset: {reset - int(time())}s)")
+
+    def record_refused(self, api, response_headers, attempt):
+        """Updates the quota for `api` from a response refusing a request because of a rate limit.
+
+        `attempt` is how many times the request was refused. Returns False once
+        it was refused more than `max_retries` times and should be given up,
+        otherwise the next `acquire` waits (or defers) until it may be retried.
+        """
+        if attempt > self.max_retries:
+            return False
+        self.record(api, response_headers)
+        with self.lock:
+            quota = self.quotas.get(api)
+            usable = quota is not None and quota["remaining"] <= 0 and quota["reset"] > time()
+        if not usable:
+            backoff = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+            logger.debug(f"{api} rate limit: no reset time given, backing off for {backoff}s")
+            self.exhaust(api, time() + backoff)
+        return True
+
+    def is_refusal(self, api, status_code, response_headers):
+        """Returns whether a response refused its request because of a rate limit: a 429, or a 403 with no quota remaining."""
+        if status_code == 429:
+            return True
+        if status_code != 403:
+            return False
+        response_headers = {key.lower(): value for key, value in response_headers.items()}
+        try:
+            return int(float(response_headers.get(self.headers[api][0], 1))) <= 0
+        except ValueError:
+            return False
+
+    def exhaust(self, api, reset):
+        """Considers the quota for `api` used up until `reset` (a timestamp)."""
+        with self.lock:
+            quota = self.quotas.get(api)
+            self.quotas[api] = {"remaining": 0, "limit": quota["limit"] if quota is not None else 0, "reset": reset}
+
+    @staticmethod
+    def get_retry_after(response_headers):
+        """Returns the seconds to wait from a `retry-after` header (lower case names), or None if there's none."""
+        retry_after = response_headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return max(0, int(float(retry_after)))
+        except ValueError:
+            pass
+        try:
+            # it can also be an HTTP date
+            return max(0, int(parsedate_to_datetime(retry_after).timestamp() - time()))
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,101 @@
+from threading import Lock
+from time import monotonic
+from urllib.parse import urlparse
+from loguru import logger
+import http.client as httplib
+
+
+class ReachabilityChecker(object):
+    """Checks that the hosts of repositories can be reached, once per host.
+
+    The result of probing a host (a HEAD request to `/`) is cached for `ttl`
+    seconds, or `failure_ttl` seconds if the host couldn't be reached, so a
+    batch of packages on the same host is covered by a single probe and a
+    dead host fails every package straight away. Connections are kept open
+    and reused when a host is probed again. Concurrent checks of the same
+    host wait for the one probe.
+    """
+
+    def __init__(self, ttl=300, failure_ttl=60, timeout=5):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.timeout = timeout
+        self.lock = Lock()
+        # (scheme, host, port) -> lock, connection, (reachable, checked at)
+        self.host_locks = {}
+        self.connections = {}
+        self.results = {}
+        self.probes = 0
+        self.hits = 0
+
+    @staticmethod
+    def get_host(url):
+        """Returns (scheme, host, port) for http(s) URLs, or None for other URLs (SSH, local paths...)."""
+        parsed_url = urlparse(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.hostname:
+            return None
+        try:
+            port = parsed_url.port
+        except ValueError:
+            port = None
+        return parsed_url.scheme, parsed_url.hostname, port
+
+    @staticmethod
+    def describe(host):
+        scheme, hostname, port = host
+        return f"{scheme}://{hostname}" + (f":{port}" if port else "")
+
+    def is_reachable(self, url):
+        """Returns True if the host of a URL answers (or the URL isn't an http(s) URL)."""
+        host = ReachabilityChecker.get_host(url)
+        if host is None:
+            logger.debug(f"Not probing {url}, it isn't an http(s) URL")
+            return True
+        with self.lock:
+            host_lock = self.host_locks.setdefault(host, Lock())
+        with host_lock:
+            result = self.results.get(host)
+            if result is not None:
+                reachable, checked_at = result
+                if monotonic() - checked_at < (self.ttl if reachable else self.failure_ttl):
+                    with self.lock:
+                        self.hits += 1
+                    logger.debug(f"{ReachabilityChecker.describe(host)} was {'reachable' if reachable else 'unreachable'} when last checked")
+                    return reachable
+            reachable = self.probe(host)
+            self.results[host] = (reachable, monotonic())
+            return reachable
+
+    def probe(self, host):
+        """Sends a HEAD request to a host, reusing the open connection to it if there is one."""
+        scheme, hostname, port = host
+        with self.lock:
+            self.probes += 1
+        connection = self.connections.pop(host, None)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection_class = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+                connection = connection_class(hostname, port, timeout=self.timeout)
+            try:
+                connection.request("HEAD", "/")
+                connection.getresponse().read()
+                self.connections[host] = connection
+                logger.debug(f"Connection to {ReachabilityChecker.describe(host)} made succesfully")
+                return True
+            except Exception as ex:
+                connection.close()
+                connection = None
+                if reused:
+                    # the server may have closed the kept-alive connection, try a new one
+                    reused = False
+                    continue
+                logger.error(f"Could not connect to {ReachabilityChecker.describe(host)}, check the URL and your internet: {ex}")
+                return False
+
+    def close(self):
+        logger.debug(f"Reachability checks: {self.probes} probes, {self.hits} cached")
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections = {}
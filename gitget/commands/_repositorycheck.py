@@ -0,0 +1,195 @@
+from os import path, makedirs, replace, scandir, stat
+from threading import Lock
+from time import time
+from loguru import logger
+import json
+
+
+def get_git_dirpath(package_path):
+    """Returns the git directory of a repository (following a `.git` file), or None if there isn't one."""
+    git_path = path.join(package_path, ".git")
+    if path.isdir(git_path):
+        return git_path
+    if path.isfile(git_path):
+        try:
+            with open(git_path) as file:
+                line = file.readline().strip()
+        except OSError:
+            return None
+        if line.startswith("gitdir:"):
+            return path.normpath(path.join(package_path, line[len("gitdir:"):].strip()))
+    return None
+
+
+def get_common_dirpath(git_dirpath):
+    """Returns the directory with the objects and most refs of a repository, which is another one for worktrees."""
+    try:
+        with open(path.join(git_dirpath, "commondir")) as file:
+            return path.normpath(path.join(git_dirpath, file.read().strip()))
+    except OSError:
+        return git_dirpath
+
+
+def get_git_state(git_dirpath):
+    """Returns a summary of the state of a git directory, which changes whenever the repository does.
+
+    It's made of the modification times (and sizes) of HEAD, the config
+    (where the remote URL lives), packed-refs, the refs directories, and the
+    object and pack directories. Updating a ref, fetching, gc, repacking or
+    adding and removing objects touch at least one of them; a file that gets
+    corrupted in place doesn't.
+    """
+    common_dirpath = get_common_dirpath(git_dirpath)
+    state = []
+    filepaths = [path.join(git_dirpath, "HEAD")] + [
+        path.join(common_dirpath, name)
+        for name in ("config", "packed-refs", "objects", path.join("objects", "pack"), path.join("objects", "info", "alternates"))
+    ]
+    for filepath in filepaths:
+        try:
+            stats = stat(filepath)
+            state.append([filepath, stats.st_mtime_ns, stats.st_size])
+        except OSError:
+            state.append([filepath, None, None])
+    # loose objects are added to (and removed from) the two-character directories of objects
+    try:
+        with scandir(path.join(common_dirpath, "objects")) as entries:
+            for entry in entries:
+                if len(entry.name) == 2 and entry.is_dir(follow_symlinks=False):
+                    state.append([entry.path, entry.stat(follow_symlinks=False).st_mtime_ns, None])
+    except OSError:
+        pass
+    # refs are rewritten through a rename, which changes the directory's mtime
+    directories = list({path.join(git_dirpath, "refs"), path.join(common_dirpath, "refs")})
+    while directories:
+        directory = directories.pop()
+        try:
+            state.append([directory, stat(directory).st_mtime_ns, None])
+            with scandir(directory) as entries:
+                directories.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+        except OSError:
+            continue
+    return sorted(state, key=lambda item: item[0])
+
+
+def check_repository(package):
+    """Runs the deep checks on a package's repository.
+
+    Checks that every object reachable from the refs is there (`git fsck
+    --connectivity-only`), that HEAD points at a commit and isn't detached,
+    and that the remote URL is still the package's `url`. Returns a list of
+    (level, message) problems, where level is `error` or `warning`.
+    """
+    import git
+
+    problems = []
+    package_path = package["path"]
+    try:
+        repo = git.Repo(package_path)
+    except Exception as ex:
+        return [("error", f"is not a valid git repository: {ex}")]
+
+    try:
+        repo.git.fsck("--connectivity-only", "--no-progress")
+    except git.GitCommandError as ex:
+        # GitPython wraps stderr as "stderr: '<output>'", the first line is enough
+        output = (ex.stderr or "").strip()
+        if output.startswith("stderr: '"):
+            output = output[len("stderr: '"):].rstrip("'")
+        problems.append(("error", f"has a broken object store: {output.splitlines()[0] if output else ex}"))
+
+    try:
+        repo.head.commit
+        if repo.head.is_detached:
+            problems.append(("warning", f"has a detached HEAD ({repo.head.commit.hexsha[:12]})"))
+    except Exception as ex:
+        problems.append(("error", f"has a broken HEAD: {ex}"))
+
+    try:
+        try:
+            remote = repo.remotes.origin
+        except AttributeError:
+            # Named something other than origin?
+            remote = repo.remotes[0]
+        remote_url = remote.url
+        if package.get("url") and remote_url != package["url"]:
+            problems.append(("warning", f"has the remote URL {remote_url} instead of {package['url']}"))
+    except Exception:
+        problems.append(("error", "has no remote"))
+    return problems
+
+
+class RepositoryCache(object):
+    """A JSON file in `.gitget-cache` with an entry per package, about its repository."""
+
+    # what the entries are, for messages
+    description = "repository cache"
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.entries = {}
+        self.changed = False
+        self.lock = Lock()
+        if path.isfile(filepath):
+            try:
+                with open(filepath) as file:
+                    self.entries = json.load(file)
+                logger.debug(f"Loaded {len(self.entries)} entries of the {self.description} {filepath}")
+            except Exception as ex:
+                logger.warning(f"Ignoring the unreadable {self.description} {filepath}: {ex}")
+
+    def prune(self, package_names):
+        """Drops the entries of packages that are no longer in the package list."""
+        with self.lock:
+            for package_name in set(self.entries) - set(package_names):
+                del self.entries[package_name]
+                self.changed = True
+
+    def save(self):
+        """Writes the cache file if anything changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            try:
+                makedirs(path.dirname(self.filepath), exist_ok=True)
+                temp_filepath = f"{self.filepath}.tmp"
+                with open(temp_filepath, "w") as file:
+                    json.dump(self.entries, file)
+                replace(temp_filepath, self.filepath)
+                self.changed = False
+            except Exception as ex:
+                logger.warning(f"Could not write the {self.description} {self.filepath}: {ex}")
+
+
+class RepositoryCheckCache(RepositoryCache):
+    """Persistent results of the deep checks of `doctor`.
+
+    Entries are keyed by package name and hold the package path and URL,
+    the state of its git directory (see get_git_state) when it was checked,
+    and the warnings found. Packages with errors aren't cached, so they're
+    checked again until they're fixed.
+    """
+
+    description = "check cache"
+
+    def get(self, package_name, package, state):
+        """Returns the cached problems of a package if its repository hasn't changed, otherwise None."""
+        with self.lock:
+            entry = self.entries.get(package_name)
+        if entry is None or entry["path"] != package["path"] or entry["url"] != package.get("url") or entry["state"] != state:
+            return None
+        return [tuple(problem) for problem in entry["problems"]]
+
+    def put(self, package_name, package, state, problems):
+        with self.lock:
+            if any(level == "error" for level, _ in problems):
+                self.entries.pop(package_name, None)
+            else:
+                self.entries[package_name] = {
+                    "path": package["path"],
+                    "url": package.get("url"),
+                    "state": state,
+                    "problems": problems,
+                    "checked_at": time(),
+                }
+            self.changed = True
@@ -0,0 +1,184 @@
+from collections import Counter
+from math import log
+from threading import Lock
+import json
+import re
+import sqlite3
+
+# how much a match in each field counts towards a package's score
+FIELD_WEIGHTS = {"name": 3.0, "topics": 2.5, "owner": 2.0, "languages": 1.5, "description": 1.0}
+# other names accepted for fields in queries
+FIELD_ALIASES = {"topic": "topics", "language": "languages", "tag": "topics"}
+
+TERM_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Splits text into lowercase terms (runs of letters and digits)."""
+    return TERM_PATTERN.findall(text.lower()) if text else []
+
+
+def get_document(package_name, package):
+    """Returns the fields of a package the index keeps: the ones searched and the ones shown in results."""
+    return {
+        "name": package_name,
+        "owner": package.get("owner"),
+        "description": package.get("description"),
+        "topics": package.get("topics") or [],
+        "languages": package.get("languages") or [],
+        "path": package.get("path"),
+        "url": package.get("url"),
+        "stars": package.get("stars") or 0,
+    }
+
+
+def get_postings(document):
+    """Returns a Counter of (term, field) for a document."""
+    postings = Counter()
+    for field in FIELD_WEIGHTS:
+        values = document[field]
+        for value in values if isinstance(values, list) else [values]:
+            for term in tokenize(value):
+                postings[(term, field)] += 1
+    return postings
+
+
+class SearchIndex(object):
+    """Inverted index of the packages' names, descriptions, topics, languages and owners.
+
+    Stored in an SQLite database next to the package file, with a row per
+    (term, field, package) and the indexed fields of each package. It's
+    kept up to date with the changes made by write_package_list; `signature`
+    records the state of the package file it matches, so changes made
+    outside of gitget (e.g. `gitget edit`) can be noticed and synced.
+    """
+
+    version = 1
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = Lock()
+        self.connection = sqlite3.connect(filepath, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+            row = self.connection.execute("SELECT value FROM state WHERE key = 'version'").fetchone()
+            if row is None or int(row[0]) != SearchIndex.version:
+                self.connection.execute("DROP TABLE IF EXISTS documents")
+                self.connection.execute("DROP TABLE IF EXISTS postings")
+                self.connection.execute("DELETE FROM state")
+                self.connection.execute("INSERT INTO state (key, value) VALUES ('version', ?)", (str(SearchIndex.version),))
+            self.connection.execute("CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, stars INTEGER, data TEXT NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS postings (term TEXT, field TEXT, name TEXT, count INTEGER, PRIMARY KEY (term, field, name)) WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS postings_name ON postings (name)")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def get_signature(self):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM state WHERE key = 'signature'").fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set_signature(self, signature):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('signature', ?)", (json.dumps(signature),))
+
+    def update(self, puts, removes):
+        """Indexes added or changed packages and drops removed ones. Returns the number of packages (re)indexed or removed."""
+        documents = {package_name: json.dumps(get_document(package_name, package), sort_keys=True) for package_name, package in puts.items()}
+        with self.lock, self.connection:
+            # packages whose indexed fields didn't change are left alone
+            for package_name, data in list(documents.items()):
+                row = self.connection.execute("SELECT data FROM documents WHERE name = ?", (package_name,)).fetchone()
+                if row is not None and row[0] == data:
+                    del documents[package_name]
+            self.remove(list(documents) + list(removes))
+            self.connection.executemany(
+                "INSERT INTO documents (name, stars, data) VALUES (?, ?, ?)",
+                ((package_name, puts[package_name].get("stars") or 0, data) for package_name, data in documents.items()),
+            )
+            self.connection.executemany(
+                "INSERT INTO postings (term, field, name, count) VALUES (?, ?, ?, ?)",
+                (
+                    (term, field, package_name, count)
+                    for package_name, data in documents.items()
+                    for (term, field), count in get_postings(json.loads(data)).items()
+                ),
+            )
+        return len(documents) + len(removes)
+
+    def sync(self, package_list):
+        """Brings the index in line with a whole package list. Returns the number of packages (re)indexed or removed."""
+        with self.lock:
+            documents = dict(self.connection.execute("SELECT name, data FROM documents"))
+        puts = {}
+        for package_name, package in package_list.items():
+            if documents.pop(package_name, None) != json.dumps(get_document(package_name, package), sort_keys=True):
+                puts[package_name] = package
+        return self.update(puts, list(documents))
+
+    def remove(self, package_names):
+        # called with the lock held, in a transaction
+        self.connection.executemany("DELETE FROM postings WHERE name = ?", ((package_name,) for package_name in package_names))
+        self.connection.executemany("DELETE FROM documents WHERE name = ?", ((package_name,) for package_name in package_names))
+
+    def search(self, query, limit=None):
+        """Returns the documents of the packages matching every term of a query, best matches first.
+
+        Terms can be limited to a field (`topic:rust`) and end with `*` to
+        match as a prefix (`pars*`). Packages are ranked by the sum, over the
+        terms, of how often each term appears in each field, weighted by the
+        field and by how rare the term is, then by stars. Each document has
+        its `score`.
+        """
+        conditions = []
+        for word in query.split():
+            field = None
+            if ":" in word:
+                field, word = word.split(":", 1)
+                field = FIELD_ALIASES.get(field.lower(), field.lower())
+                if field not in FIELD_WEIGHTS:
+                    raise ValueError(f"Unknown field: {field} (fields are {', '.join(FIELD_WEIGHTS)})")
+            terms = tokenize(word)
+            for index, term in enumerate(terms):
+                conditions.append((term, field, index == len(terms) - 1 and word.endswith("*")))
+        if not conditions:
+            raise ValueError("Nothing to search for")
+
+        with self.lock:
+            number_of_documents = self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            scores = None
+            stars = {}
+            for term, field, prefix in conditions:
+                sql = "SELECT postings.name, field, count, stars FROM postings JOIN documents ON documents.name = postings.name"
+                if prefix:
+                    sql += " WHERE term >= ? AND term < ?"
+                    parameters = [term, term[:-1] + chr(ord(term[-1]) + 1)]
+                else:
+                    sql += " WHERE term = ?"
+                    parameters = [term]
+                if field is not None:
+                    sql += " AND field = ?"
+                    parameters.append(field)
+                term_scores = Counter()
+                for package_name, posting_field, count, package_stars in self.connection.execute(sql, parameters):
+                    term_scores[package_name] += count * FIELD_WEIGHTS[posting_field]
+                    stars[package_name] = package_stars
+                if scores is not None:
+                    term_scores = Counter({package_name: score for package_name, score in term_scores.items() if package_name in scores})
+                if not term_scores:
+                    return []
+                rarity = log(1 + number_of_documents / len(term_scores))
+                scores = Counter({package_name: score * rarity + (scores[package_name] if scores else 0) for package_name, score in term_scores.items()})
+
+            ranking = sorted(scores, key=lambda package_name: (-scores[package_name], -stars[package_name], package_name))
+            results = []
+            # only the documents that are returned are read
+            for package_name in ranking[:limit] if limit is not None else ranking:
+                document = json.loads(self.connection.execute("SELECT data FROM documents WHERE name = ?", (package_name,)).fetchone()[0])
+                document["score"] = round(scores[package_name], 3)
+                results.append(document)
+        return results
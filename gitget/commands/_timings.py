@@ -0,0 +1,123 @@
+from contextlib import nullcontext
+from functools import wraps
+from threading import Lock, current_thread
+from time import perf_counter
+from os import getpid
+import json
+
+
+class Span(object):
+    """Times a block of code and records it in Timings when the block ends."""
+
+    def __init__(self, timings, name, args):
+        self.timings = timings
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.record(self.name, self.start, perf_counter() - self.start, self.args)
+
+
+class Timings(object):
+    """Records how long the phases of a command take (`--timings`, `--trace`).
+
+    Phases are timed with `timings.span(name, **args)` blocks, which can be
+    nested and used on any thread; a span inside another on the same thread
+    shows up as its child in the trace. Until `enable` is called, spans
+    don't record anything.
+    """
+
+    # the slowest spans about a single package listed in the summary
+    slowest_packages = 5
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.started = perf_counter()
+        # (name, start, duration, thread id, thread name, args)
+        self.spans = []
+
+    def enable(self):
+        self.enabled = True
+        self.started = perf_counter()
+
+    def span(self, name, **args):
+        """Returns a context manager timing a phase. `args` are shown with the span in the trace."""
+        if not self.enabled:
+            return nullcontext()
+        return Span(self, name, args)
+
+    def record(self, name, start, duration, args):
+        thread = current_thread()
+        with self.lock:
+            self.spans.append((name, start - self.started, duration, thread.ident, thread.name, args))
+
+    def get_summary(self):
+        """Returns the lines of a summary of the spans, the phases taking the most time first.
+
+        Times of spans running at the same time on different threads are
+        added up, so a phase can take longer than the whole command.
+        """
+        totals = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, _, duration, _, _, _ in spans:
+            count, total, longest = totals.get(name, (0, 0.0, 0.0))
+            totals[name] = (count + 1, total + duration, max(longest, duration))
+
+        lines = [f"{'Phase':<32} {'Count':>7} {'Total':>10} {'Mean':>10} {'Max':>10}"]
+        for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<32} {count:>7} {total:>9.3f}s {total / count:>9.3f}s {longest:>9.3f}s")
+
+        package_spans = sorted((span for span in spans if "package" in span[5]), key=lambda span: -span[2])
+        if package_spans:
+            lines.append("Slowest packages:")
+            for name, _, duration, _, _, args in package_spans[:self.slowest_packages]:
+                lines.append(f"  {args['package']:<30} {name:<20} {duration:>9.3f}s")
+        return lines
+
+    def write_trace(self, filepath):
+        """Writes the spans as a Chrome trace (loads in chrome://tracing and Perfetto)."""
+        pid = getpid()
+        events = []
+        thread_names = {}
+        with self.lock:
+            spans = list(self.spans)
+        for name, start, duration, thread_id, thread_name, args in spans:
+            thread_names[thread_id] = thread_name
+            events.append({
+                "name": name,
+                "cat": "gitget",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": duration * 1e6,
+                "pid": pid,
+                "tid": thread_id,
+                "args": {key: str(value) for key, value in args.items()},
+            })
+        for thread_id, thread_name in thread_names.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+        with open(filepath, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+# shared by every command (and thread) of the process
+timings = Timings()
+
+
+def timed(name):
+    """Decorates a function so every call to it is recorded as a span."""
+    def decorator(function):
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            if not timings.enabled:
+                return function(*args, **kwargs)
+            with timings.span(name):
+                return function(*args, **kwargs)
+        return timed_function
+    return decorator
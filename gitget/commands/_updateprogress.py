@@ -1,14 +1,24 @@
 import git
-from sys import stdout
 
 
 class UpdateProgress(git.remote.RemoteProgress):
-    """Shows the progress of a git command."""
+    """Reports the progress of a git command to a task of a ProgressDisplay."""
 
-    def update(self, op_code, cur_count, max_count=None, message=""):
-        stdout.write(f"{self._cur_line} \r")
-        stdout.flush()
+    phases = {
+        git.remote.RemoteProgress.COUNTING: "counting objects",
+        git.remote.RemoteProgress.COMPRESSING: "compressing objects",
+        git.remote.RemoteProgress.WRITING: "writing objects",
+        git.remote.RemoteProgress.RECEIVING: "receiving objects",
+        git.remote.RemoteProgress.RESOLVING: "resolving deltas",
+        git.remote.RemoteProgress.FINDING_SOURCES: "finding sources",
+        git.remote.RemoteProgress.CHECKING_OUT: "checking out files",
+    }
+
+    def __init__(self, task):
+        super().__init__()
+        self.task = task
 
-    def clear_line():
-        stdout.write(" " * 80 + "\r")
-        stdout.flush()
+    def update(self, op_code, cur_count, max_count=None, message=""):
+        # git only reports the throughput with the received objects, e.g. ", 1.20 MiB | 2.40 MiB/s"
+        throughput = message.strip(", ") if "/s" in message else None
+        self.task.update(self.phases.get(op_code & self.OP_MASK, "working"), cur_count, max_count, throughput)
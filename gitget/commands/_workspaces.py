@@ -0,0 +1,101 @@
+from os import path
+from threading import RLock
+from loguru import logger
+import yaml
+from ._packagefile import PackageFileLock, write_file_atomically
+
+
+class WorkspaceRegistry(object):
+    """The package files gitget knows about, so commands can run on all of them with `--all-workspaces`.
+
+    The registry is a YAML list of paths to package files. A package file is
+    added when it's created or loaded, and dropped once it no longer exists.
+    Other processes may add to the registry at the same time, so it's read
+    again before each write, while holding a lock on `<registry>.lock`.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.lock = PackageFileLock(f"{filepath}.lock", "the workspace registry")
+        self.package_list_filepaths = self.load()
+
+    def load(self):
+        """Returns the package files in the registry file (none if there isn't one)."""
+        try:
+            with open(self.filepath) as file:
+                package_list_filepaths = yaml.safe_load(file)
+        except FileNotFoundError:
+            return []
+        except Exception as ex:
+            logger.warning(f"Ignoring the unreadable workspace registry {self.filepath}: {ex}")
+            return []
+        return [package_list_filepath for package_list_filepath in package_list_filepaths or [] if isinstance(package_list_filepath, str)]
+
+    def save(self):
+        """Writes the registry file. The lock must be held."""
+        try:
+            write_file_atomically(
+                self.filepath,
+                lambda file: yaml.safe_dump(self.package_list_filepaths, file, default_flow_style=False),
+            )
+        except Exception as ex:
+            logger.warning(f"Could not write the workspace registry {self.filepath}: {ex}")
+
+    def add(self, package_list_filepath):
+        """Registers a package file, if it isn't already."""
+        package_list_filepath = path.realpath(package_list_filepath)
+        if package_list_filepath in self.package_list_filepaths:
+            return
+        try:
+            with self.lock:
+                self.package_list_filepaths = self.load()
+                if package_list_filepath not in self.package_list_filepaths:
+                    logger.debug(f"Registering the workspace {package_list_filepath}")
+                    self.package_list_filepaths.append(package_list_filepath)
+                    self.save()
+        except OSError as ex:
+            logger.warning(f"Could not register the workspace {package_list_filepath}: {ex}")
+
+    def get_package_list_filepaths(self):
+        """Returns the registered package files, after dropping the ones that no longer exist."""
+        with self.lock:
+            self.package_list_filepaths = self.load()
+            existing = [package_list_filepath for package_list_filepath in self.package_list_filepaths if path.isfile(package_list_filepath)]
+            for package_list_filepath in set(self.package_list_filepaths) - set(existing):
+                logger.info(f"Forgetting the workspace {package_list_filepath}, its package file no longer exists")
+            if len(existing) != len(self.package_list_filepaths):
+                self.package_list_filepaths = existing
+                self.save()
+            return list(existing)
+
+
+class SharedClients(object):
+    """The API clients, rate limits and prefetched information of a command.
+
+    Commands that a command runs on other workspaces (see
+    Base.get_workspace_commands) use the same ones, so the whole fleet is
+    handled with one set of clients and one budget of API requests.
+    """
+
+    def __init__(self):
+        self.github = None
+        self.github_graphql = None
+        self.gitlab = None
+        self.gitlab_graphql = None
+        # metadata fetched in batches by prefetch_packages_for_urls, by metadata cache key
+        self.prefetched_metadata = {}
+        self.rate_limiter = None
+        self.reachability_checker = None
+        self.object_cache = None
+        self.workspace_registry = None
+        # the metadata cache of each workspace used, for their stats
+        self.metadata_caches = []
+        self.lock = RLock()
+
+
+def shared(name):
+    """A command attribute that's kept in the command's SharedClients."""
+    return property(
+        lambda self: getattr(self.shared_clients, name),
+        lambda self, value: setattr(self.shared_clients, name, value),
+    )
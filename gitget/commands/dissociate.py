@@ -0,0 +1,67 @@
+from ._base import Base
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from os import path
+from ._objectcache import dissociate, get_alternates
+
+
+class Dissociate(Base):
+    """Dissociate.
+
+    Makes packages stop borrowing objects from the object cache (or any
+    other repository), by copying the objects they use into them and
+    removing their `.git/objects/info/alternates`. Run it on every package
+    installed with `--object-cache` before deleting (part of) the cache.
+    With `--all`, every package borrowing objects is dissociated, `--jobs`
+    at a time.
+
+    Usage: gitget [global options] [--jobs=<n>] [--all] dissociate [<package_names>...]
+
+    Examples:
+        gitget dissociate awesmubarak_git-get
+        gitget --all --jobs 4 dissociate
+    """
+
+    def run(self):
+        package_list = self.get_package_list()
+        package_names = self.options["<package_names>"]
+
+        if self.options.get("--all"):
+            package_names = [package_name for package_name in package_list if get_alternates(package_list[package_name]["path"])]
+            if not package_names:
+                logger.info("No packages borrow objects from another repository")
+                return
+        elif not package_names:
+            logger.error("Give the packages to dissociate, or --all")
+            exit(1)
+        else:
+            for package_name in package_names:
+                if package_name not in package_list:
+                    logger.error(f"Package {package_name} not in package list")
+                    exit(1)
+
+        with ThreadPoolExecutor(max_workers=self.get_jobs()) as executor:
+            results = executor.map(lambda package_name: Dissociate.dissociate_package(package_name, package_list[package_name]["path"]), package_names)
+            failed = sum(not dissociated for dissociated in results)
+        if failed:
+            logger.error(f"{failed} package{'s' if failed > 1 else ''} could not be dissociated")
+            exit(1)
+
+    @staticmethod
+    def dissociate_package(package_name, package_path):
+        """Dissociates one package. Returns False if it failed."""
+        if not path.isdir(package_path):
+            logger.error(f"The path for the package {package_name} was not found")
+            return False
+        alternates = get_alternates(package_path)
+        if not alternates:
+            logger.info(f"Package {package_name} doesn't borrow objects from another repository")
+            return True
+        logger.info(f"Dissociating {package_name} from {', '.join(alternates)}")
+        try:
+            dissociate(package_path)
+        except Exception:
+            logger.exception(f"Could not dissociate {package_name}")
+            return False
+        logger.debug(f"Package {package_name} dissociated")
+        return True
@@ -1,5 +1,11 @@
 from ._base import Base
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
+from loguru import logger
+from os import cpu_count, path
+from yaml import safe_load
+from ._repositorycheck import RepositoryCheckCache, check_repository, get_git_dirpath, get_git_state
+from ._timings import timings
 
 
 class Doctor(Base):
@@ -8,10 +14,23 @@ class Doctor(Base):
     Verifies integrity of files and packages. Any errors are then reported
     and need to be fixed.
 
-    Usage: gitget [global options] doctor
+    With `--deep`, the repositories themselves are checked too, `--jobs` at a
+    time (by default, one per CPU): their object store must be complete
+    (`git fsck --connectivity-only`), HEAD must point at a commit rather than
+    be detached, and the remote URL must still be the package's. The results
+    are cached in `.gitget-cache`, keyed on the state of each `.git`
+    directory, so a rerun only checks the repositories that changed.
+
+    With `--all-workspaces`, every registered workspace is checked, and the
+    repositories of all of them share the `--jobs`.
+
+    Usage: gitget [global options] [--deep] [--jobs=<n>] [--all-workspaces] doctor
 
     Examples:
         gitget doctor
+        gitget --deep doctor
+        gitget --deep --jobs 4 doctor
+        gitget --all-workspaces --deep doctor
     """
 
     def run(self):
@@ -37,9 +56,34 @@ class Doctor(Base):
                 f"Could not import the following modules: {failed_modules_str}"
             )
 
+        workspaces = self.get_workspace_commands() if self.options.get("--all-workspaces") else [self]
+        jobs = self.get_jobs(default=cpu_count() or 1)
+        invalid_packages = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            repository_checks = []
+            for workspace in workspaces:
+                package_list, existing_packages, invalid = workspace.check_packages()
+                invalid_packages += invalid
+                if self.options.get("--deep"):
+                    # the checks of every workspace are queued before waiting for any, so they share the jobs
+                    repository_checks.append(workspace.check_repositories(executor, package_list, existing_packages))
+            for wait_for_checks in repository_checks:
+                invalid_packages += wait_for_checks()
+
+        if not invalid_packages:
+            logger.info("All packages are valid")
+        else:
+            logger.info(f"{invalid_packages} invalid package{'s' if invalid_packages > 1 else ''} found")
+
+    def check_packages(self):
+        """Checks the package file and that every package's path exists.
+
+        Returns the package list, the names of the packages whose path
+        exists and how many packages are invalid.
+        """
         # Check if package file exists
         logger.debug("Checking if package file exists")
-        package_list_path = Base.get_package_list_filepath()
+        package_list_path = self.get_package_list_filepath()
         package_list_file_valid = Base.check_package_list_file(package_list_path)
         if package_list_file_valid == 1:
             logger.error("Package file missing, please run `gitget setup`")
@@ -71,21 +115,70 @@ class Doctor(Base):
         logger.debug("Checking each package")
         package_list = self.get_package_list()
         invalid_packages = 0
+        existing_packages = []
         for package_name in package_list:
             package = package_list[package_name]
             package_path = package["path"]
             package_path_exists = path.exists(package_path)
             package_path_is_dir = path.isdir(package_path)
             if not package_path_exists:
-                logger.warning(f"The path for the package {package_name} was not found")
+                logger.warning(f"The path for the package {self.get_package_label(package_name)} was not found")
                 invalid_packages = invalid_packages + 1
             elif package_path_exists and not package_path_is_dir:
-                logger.warning(f"The path for the package {package_name} is a file")
+                logger.warning(f"The path for the package {self.get_package_label(package_name)} is a file")
                 invalid_packages = invalid_packages + 1
             else:
                 logger.debug(f"Package {package_name} found")
+                existing_packages.append(package_name)
+        return package_list, existing_packages, invalid_packages
 
-        if not invalid_packages:
-            logger.info("All packages are valid")
-        else:
-            logger.info(f"{invalid_packages} invalid package{'s' if invalid_packages > 1 else ''} found")
+    def check_repositories(self, executor, package_list, package_names):
+        """Queues the deep checks on the repositories of packages on `executor`.
+
+        Returns a function that waits for the checks, reports them and
+        returns how many repositories have errors.
+        """
+        cache = RepositoryCheckCache(path.join(Base.get_cache_dirpath(self.get_package_list_filepath()), "doctor.json"))
+        logger.debug(f"Checking {len(package_names)} repositories")
+        results = executor.map(lambda package_name: Doctor.check_repository(package_name, package_list[package_name], cache), package_names)
+
+        def wait_for_checks():
+            invalid_packages = 0
+            warned_packages = 0
+            cached_packages = 0
+            with timings.span("check repositories"):
+                for package_name, (problems, cached) in zip(package_names, results):
+                    cached_packages += cached
+                    for level, message in problems:
+                        if level == "error":
+                            logger.error(f"The repository of the package {self.get_package_label(package_name)} {message}")
+                        else:
+                            logger.warning(f"The repository of the package {self.get_package_label(package_name)} {message}")
+                    if any(level == "error" for level, _ in problems):
+                        invalid_packages += 1
+                    elif problems:
+                        warned_packages += 1
+            cache.prune(package_list)
+            cache.save()
+            logger.info(
+                f"Checked {len(package_names)} repositories{f' in {self.workspace}' if self.workspace is not None else ''} "
+                f"({cached_packages} unchanged since the last check): {invalid_packages} with errors, {warned_packages} with warnings"
+            )
+            return invalid_packages
+
+        return wait_for_checks
+
+    @staticmethod
+    def check_repository(package_name, package, cache):
+        """Returns (problems, cached) for a package's repository, checking it only if it changed since it was last checked."""
+        git_dirpath = get_git_dirpath(package["path"])
+        if git_dirpath is None:
+            return [("error", "is not a git repository")], False
+        state = get_git_state(git_dirpath)
+        problems = cache.get(package_name, package, state)
+        if problems is not None:
+            return problems, True
+        with timings.span("check repository", package=package_name):
+            problems = check_repository(package)
+        cache.put(package_name, package, state, problems)
+        return problems, False
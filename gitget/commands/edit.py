@@ -18,7 +18,9 @@ class Edit(Base):
     def run(self):
         # The package list isn't used here, but we want it created it if doesn't exist
         package_list = self.get_package_list()
-        filepath = Base.get_package_list_filepath()
+        filepath = self.get_package_list_filepath()
+        # Fold any journaled changes into the file, so it has every package in it
+        self.compact_package_file()
 
         editor = self.configuration.get("editor", None)
         if editor is not None:
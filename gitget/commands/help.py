@@ -1,8 +1,6 @@
 from ._base import Base
 from loguru import logger
-from gitget import commands
-from docopt import docopt
-from inspect import getmembers, isclass
+from gitget.commands import COMMANDS, get_command_class
 
 
 class Help(Base):
@@ -22,19 +20,13 @@ class Help(Base):
 
         # check if command is valid
         logger.debug("Checking if the command is valid")
-        if hasattr(commands, called_command) and called_command != "base":
+        if called_command in COMMANDS:
             logger.debug("Command is valid")
         else:
-            called_command = f"{called_command}Cmd"
-            if hasattr(commands, called_command):
-                logger.debug("Command is valid")
-            else:
-                logger.error("Command is not valid")
-                exit(1)
-
-        # display the docstring
+            logger.error("Command is not valid")
+            exit(1)
+
+        # display the docstring (only the requested command's module is imported)
         logger.debug("Displaying the docstring for the command")
-        module = getattr(commands, called_command)
-        module_commands = getmembers(module, isclass)
-        command = [command[1] for command in module_commands if command[0] != "Base"][0]
+        command = get_command_class(called_command)
         print(command.__doc__)
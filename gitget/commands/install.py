@@ -2,9 +2,10 @@ from ._base import Base
 from git import Repo
 from loguru import logger
 from os import path, makedirs
-import shlex
-from pprint import pformat
-import http.client as httplib
+from time import monotonic
+from ._pipeline import Pipeline, PipelineStage
+from ._progress import ProgressDisplay
+from ._timings import timings
 from ._updateprogress import UpdateProgress
 
 class Install(Base):
@@ -15,54 +16,49 @@ class Install(Base):
     be used as the directory name. Otherwise, the package name is set to
     `username/repository`.
 
-    Usage: gitget [global options] [--git-clone-args=<additional-arguments>] install (batch <file_name> | <package_url> [<package_name>])
+    In batch mode, packages go through a pipeline: their host is checked,
+    then their information is fetched, then they're cloned, and each one is
+    recorded as soon as its clone finishes. The stages run at the same time,
+    with `--probe-jobs` hosts checked, `--metadata-jobs` packages looked up
+    and `--jobs` repositories cloned at once.
+
+    With `--all-workspaces`, a batch is installed in the registered
+    workspaces, each package in the directory of the workspace's package
+    file. Lines after a `[<workspace directory>]` header are only installed
+    in that workspace, the others in every workspace that doesn't already
+    have a package with their URL.
+
+    With `--object-cache`, repositories are first fetched into a shared
+    mirror in that directory and cloned with `--reference` to it, so forks
+    and reinstalls only download what the mirror doesn't have yet.
+
+    Usage: gitget [global options] [--git-clone-args=<additional-arguments>] [--jobs=<n>] [--probe-jobs=<n>] [--metadata-jobs=<n>] [--object-cache=<directory>] [--all-workspaces] install (batch <file_name> | <package_url> [<package_name>])
 
     Examples:
         gitget install 'https://github.com/awesmubarak/gitget'
         gitget install 'https://github.com/awesmubarak/gitget' 'gitget-download'
         gitget --git-clone-args="--recurse-submodules --jobs 8" install 'https://github.com/awesmubarak/gitget'
         gitget install batch some_packages.txt
+        gitget --jobs 8 install batch some_packages.txt
+        gitget --jobs 8 --metadata-jobs 2 install batch some_packages.txt
+        gitget --object-cache ~/.cache/gitget-objects install batch some_packages.txt
+        gitget --all-workspaces --object-cache ~/.cache/gitget-objects install batch some_packages.txt
         gitget --git-clone-args="--filter=tree:0 --also-filter-submodules --recurse-submodules --jobs 8" install batch some_packages.txt
     """
 
+    # Finished packages are merged into the package file at most this often
+    # (or every `batch_write_count` packages, whichever comes first)
+    batch_write_interval = 10
+    batch_write_count = 50
+
+    # packages waiting between two stages of the batch pipeline
+    pipeline_queue_size = 16
+
     def run(self):
         if self.options["batch"]:
             logger.debug("Batch mode")
-            
-            package_urls = []
-            file_name = self.options["<file_name>"]
-            with open(file_name, "r") as f:
-                for line in f:
-                    package_url = line.strip()
-                    package_urls.append(package_url)
-
-            num_packages = len(package_urls)
-            packages_installed = 0
-            failed_packages = []
-            while len(package_urls) > 0:
-                package_line = package_urls.pop(0)
-                package_name = None
-                if "=" in package_line:
-                    package_name, package_url = package_line.split("=")
-                else:
-                    package_url = package_line
-
-                logger.info(f"Batch install: Installing package {package_url} [{packages_installed+len(failed_packages)+1}/{num_packages}]")
-                if self.install_package(package_url, package_name):
-                    packages_installed = packages_installed + 1
-                else:
-                    logger.error(f"Batch install: Failed to install package {packages_installed+len(failed_packages)+1} ({package_url})")
-                    failed_packages.append(package_line)
-
-                with open(f"{file_name}.remaining", "w") as f:
-                    f.write('\n'.join(package_urls) + '\n')
-            with open(f"{file_name}.failed", "w") as f:
-                f.write('\n'.join(failed_packages) + '\n')
-            if len(failed_packages) > 0:
-                logger.error(f"Failed to install {len(failed_packages)} packages (see {file_name}.failed). {packages_installed} packages installed successfully")
+            if not self.install_batch(self.options["<file_name>"]):
                 exit(1)
-            else:
-                logger.info(f"{packages_installed} packages installed successfully")
         else:
             package_url = self.options["<package_url>"]
             package_name = self.options["<package_name>"]
@@ -70,7 +66,233 @@ class Install(Base):
             if not self.install_package(package_url, package_name):
                 exit(1)
 
+    def install_batch(self, file_name):
+        """Installs every package listed in a file through a pipeline of stages.
+
+        Each line is either a URL or `name=url`. The package list is loaded
+        once and finished packages are merged into it, with the package file
+        and `<file_name>.remaining` written together in coalesced writes.
+        Lines that could not be installed are written to `<file_name>.failed`.
+
+        With `--all-workspaces`, the packages of every workspace go through
+        the same pipeline. A line is installed in the workspace of the
+        `[<workspace directory>]` header above it, or else in every workspace
+        not tracking its URL yet, and is only done once it's done in each.
+        """
+        all_workspaces = self.options.get("--all-workspaces")
+        # (workspace directory from the last header or None, line) pairs
+        package_lines = []
+        section = None
+        with open(file_name, "r") as f:
+            for line in f:
+                package_line = line.strip()
+                if package_line.startswith("[") and package_line.endswith("]"):
+                    section = package_line[1:-1].strip()
+                elif package_line:
+                    package_lines.append((section, package_line))
+
+        workspaces = self.get_workspace_commands() if all_workspaces else [self]
+        sections = {section for section, package_line in package_lines if section is not None}
+        if sections and not all_workspaces:
+            logger.error(f"Workspace headers ([<workspace directory>]) in {file_name} need --all-workspaces")
+            exit(1)
+        workspaces_by_directory = {path.dirname(workspace.get_package_list_filepath()): workspace for workspace in workspaces}
+        section_workspaces = {}
+        for section in sections:
+            directory = path.realpath(path.expanduser(section))
+            if directory not in workspaces_by_directory:
+                logger.error(f"{section} in {file_name} isn't a registered workspace")
+                exit(1)
+            section_workspaces[section] = workspaces_by_directory[directory]
+
+        package_lists = {workspace: workspace.get_package_list() for workspace in workspaces}
+        # the URLs each workspace has packages for, which lines without a header skip
+        tracked_urls = {
+            workspace: {package["url"] for package in package_list.values()} if all_workspaces else set()
+            for workspace, package_list in package_lists.items()
+        }
+        git_args = {workspace: Base.parse_git_args(workspace.options["--git-clone-args"]) for workspace in workspaces}
+        jobs = self.get_jobs()
+        probe_jobs = self.get_jobs("--probe-jobs", default=4)
+        metadata_jobs = self.get_jobs("--metadata-jobs", default=4)
+        logger.debug(f"Installing with {probe_jobs} probe, {metadata_jobs} metadata and {jobs} clone job(s)")
+
+        num_packages = len(package_lines)
+        remaining_lines = dict(enumerate(package_lines))
+        # how many workspaces each line still has to be installed in
+        unfinished_workspaces = {}
+        failed_packages = {}
+        packages_installed = 0
+        reserved = {workspace: set() for workspace in workspaces}
+
+        # finished package numbers, merged into the files on the next write
+        unwritten_packages = []
+        changed_workspaces = set()
+        last_write = monotonic()
+
+        def finish_package(package_number, failed):
+            if failed:
+                failed_packages[package_number] = package_lines[package_number]
+            unfinished_workspaces[package_number] -= 1
+            if unfinished_workspaces[package_number] == 0:
+                unwritten_packages.append(package_number)
+
+        def write_batch_progress():
+            nonlocal unwritten_packages, last_write
+            for workspace in changed_workspaces:
+                workspace.write_package_list(package_lists[workspace])
+            changed_workspaces.clear()
+            for package_number in unwritten_packages:
+                remaining_lines.pop(package_number)
+            unwritten_packages = []
+            last_write = monotonic()
+            with open(f"{file_name}.remaining", "w") as f:
+                f.write(Install.format_batch_lines(remaining_lines.values()))
+
+        # names and locations are decided up front, so packages can't claim the same ones
+        batch_packages = []
+        with timings.span("resolve packages"):
+            for package_number, (section, package_line) in enumerate(package_lines):
+                requested_name = None
+                if "=" in package_line:
+                    requested_name, package_url = package_line.split("=")
+                else:
+                    package_url = package_line
+
+                logger.info(f"Batch install: Installing package {package_url} [{package_number+1}/{num_packages}]")
+                if section is not None:
+                    targets = [section_workspaces[section]]
+                else:
+                    targets = [workspace for workspace in workspaces if package_url not in tracked_urls[workspace]]
+                    for workspace in workspaces:
+                        if workspace not in targets:
+                            logger.info(f"Batch install: {package_url} is already installed{Install.in_workspace(workspace)}")
+                unfinished_workspaces[package_number] = len(targets)
+                if not targets:
+                    unwritten_packages.append(package_number)
+                for workspace in targets:
+                    # in the workspace's directory, rather than the current one, when there are several
+                    root = path.dirname(workspace.get_package_list_filepath()) if all_workspaces else None
+                    resolved = workspace.resolve_package(package_url, requested_name, package_lists[workspace], reserved[workspace], root)
+                    if resolved is None:
+                        logger.error(f"Batch install: Failed to install package {package_number+1} ({package_url}){Install.in_workspace(workspace)}")
+                        finish_package(package_number, True)
+                        continue
+                    package_name, package_location = resolved
+                    reserved[workspace].add(package_name)
+                    reserved[workspace].add(package_location)
+                    batch_packages.append({
+                        "number": package_number,
+                        "url": package_url,
+                        "name": package_name,
+                        "location": package_location,
+                        "workspace": workspace,
+                        "package": None,
+                    })
+
+        logger.debug("Prefetching package information")
+        urls_by_workspace = {workspace: [] for workspace in workspaces}
+        for batch_package in batch_packages:
+            urls_by_workspace[batch_package["workspace"]].append(batch_package["url"])
+        # through a workspace, for the API options of its configuration
+        workspaces[0].prefetch_workspace_packages(urls_by_workspace)
+
+        progress = ProgressDisplay(len(batch_packages), "Installing")
+
+        def probe(batch_package):
+            with timings.span("probe", package=batch_package["name"]):
+                reachable = self.get_reachability_checker().is_reachable(batch_package["url"])
+            return batch_package if reachable else None
+
+        def get_metadata(batch_package):
+            workspace = batch_package["workspace"]
+            batch_package["package"] = workspace.get_package_for_url(batch_package["url"], batch_package["name"], batch_package["location"])
+            return batch_package
+
+        def clone(batch_package):
+            workspace = batch_package["workspace"]
+            reference = self.update_object_cache(batch_package["url"])
+            if not Install.clone_package(batch_package["url"], workspace.get_package_label(batch_package["name"]), batch_package["location"], git_args[workspace], progress, reference):
+                return None
+            return batch_package
+
+        pipeline = Pipeline([
+            PipelineStage("probe", probe, probe_jobs),
+            PipelineStage("metadata", get_metadata, metadata_jobs),
+            PipelineStage("clone", clone, jobs),
+        ], queue_size=self.pipeline_queue_size)
+
+        # record packages as their clones finish
+        with progress:
+            for batch_package, failed_stage in pipeline.run(batch_packages):
+                progress.advance()
+                workspace = batch_package["workspace"]
+                if failed_stage is None:
+                    package_lists[workspace][batch_package["name"]] = batch_package["package"]
+                    changed_workspaces.add(workspace)
+                    packages_installed = packages_installed + 1
+                else:
+                    logger.error(f"Batch install: Failed to install package {batch_package['number']+1} ({batch_package['url']}){Install.in_workspace(workspace)} at the {failed_stage} stage")
+                finish_package(batch_package["number"], failed_stage is not None)
+
+                if len(unwritten_packages) >= self.batch_write_count or monotonic() - last_write >= self.batch_write_interval:
+                    write_batch_progress()
+        write_batch_progress()
+        self.get_reachability_checker().close()
+
+        with open(f"{file_name}.failed", "w") as f:
+            f.write(Install.format_batch_lines(failed_packages[package_number] for package_number in sorted(failed_packages)))
+        if len(failed_packages) > 0:
+            logger.error(f"Failed to install {len(failed_packages)} packages (see {file_name}.failed). {packages_installed} packages installed successfully")
+            return False
+        logger.info(f"{packages_installed} packages installed successfully")
+        return True
+
+    @staticmethod
+    def in_workspace(workspace):
+        """Returns ` in <workspace>` for messages, when the command runs on several workspaces."""
+        return f" in {workspace.workspace}" if workspace.workspace is not None else ""
+
+    @staticmethod
+    def format_batch_lines(package_lines):
+        """Returns the text of a batch file with (workspace directory or None, line) pairs, in order, under their headers."""
+        text = ""
+        section = None
+        for line_section, package_line in package_lines:
+            if line_section != section:
+                text += f"[{line_section}]\n"
+                section = line_section
+            text += package_line + "\n"
+        return text
+
     def install_package(self, package_url, package_name=None):
+        package_list = self.get_package_list()
+        resolved = self.resolve_package(package_url, package_name, package_list)
+        if resolved is None:
+            return False
+        package_name, package_location = resolved
+
+        git_args = Base.parse_git_args(self.options["--git-clone-args"])
+        with ProgressDisplay(1, "Installing") as progress:
+            package = self.fetch_package(package_url, package_name, package_location, git_args, progress)
+        if package is None:
+            return False
+
+        # add package to package list
+        logger.debug("Adding package to package list")
+        package_list[package_name] = package
+        self.write_package_list(package_list)
+        logger.info("Saved package information")
+        
+        return True
+
+    def resolve_package(self, package_url, package_name, package_list, reserved=(), root=None):
+        """Decides on the name and location of a package and prepares its parent directory.
+
+        Returns (package_name, package_location), or None if the package can't be installed.
+        `reserved` holds names and locations already claimed by other packages in a batch.
+        The package goes in the `root` directory, or the current one.
+        """
         # sort out package name
         logger.debug("Deciding on package name")
         if package_name is not None:
@@ -83,89 +305,79 @@ class Install(Base):
 
         # check if the package is in the package list already
         logger.debug("Checking if the package name already exists")
-        package_list = self.get_package_list()
-        if package_name in package_list:
-            logger.error(f"Package name {package_name} already exists")
-            return False
+        if package_name in package_list or package_name in reserved:
+            logger.error(f"Package name {self.get_package_label(package_name)} already exists")
+            return None
 
         # figure out the package location
         logger.debug("Deciding package location")
-        package_location = path.abspath(package_name)
+        package_location = path.abspath(package_name if root is None else path.join(root, package_name))
 
         # check if directory already exists
         logger.debug("Checking if the directory name already exists")
-        if path.isdir(package_location):
+        if path.isdir(package_location) or package_location in reserved:
             logger.error(f"Directory already exists: {package_location}")
-            return False
+            return None
 
-        logger.info(f"Package {package_name} ({package_location})")
+        logger.info(f"Package {self.get_package_label(package_name)} ({package_location})")
 
         # make any required parent directories
         parent_dir = path.dirname(package_location)
         logger.debug(f"Creating parent directories: {parent_dir}")
         if not path.exists(parent_dir):
-            makedirs(parent_dir)
+            makedirs(parent_dir, exist_ok=True)
         elif not path.isdir(parent_dir):
             logger.error(f"Path already exists but isn't a directory: {parent_dir}")
-            return False
+            return None
+
+        return package_name, package_location
 
-        # check if the repository can be reached
+    def fetch_package(self, package_url, package_name, package_location, git_args, progress=None):
+        """Checks the repository can be reached, gets its information and clones it, showing the clone's progress on `progress` if given.
+
+        Returns the package information, or None if the package couldn't be installed.
+        """
         logger.debug("Checking if repository can be reached")
-        trimmed_package_url = package_url.replace("https://", "").replace("http://", "")
-        trimmed_package_url = trimmed_package_url.split("/")[0]
-        connection = httplib.HTTPConnection(trimmed_package_url, timeout=5)
+        with timings.span("probe", package=package_name):
+            reachable = self.get_reachability_checker().is_reachable(package_url)
+        if not reachable:
+            return None
         try:
-            connection.request("HEAD", "/")
-            connection.close()
-            logger.debug("Connection made succesfully")
-        except:
-            connection.close()
-            logger.exception(
-                "Could not connect to the URL, check the URL and your internet"
-            )
-            return False
+            package = self.get_package_for_url(package_url, package_name, package_location)
+        except SystemExit:
+            # Base reports the error itself before exiting
+            return None
+        reference = self.update_object_cache(package_url)
+        if not Install.clone_package(package_url, package_name, package_location, git_args, progress, reference):
+            return None
+        return package
 
-        package = self.get_package_for_url(package_url, package_name, package_location)
-
-        git_args = {}
-        if self.options["--git-clone-args"] is not None:
-            args = shlex.split(self.options["--git-clone-args"])
-            for i, arg in enumerate(args):
-                if arg.startswith("-"):
-                    if arg.startswith("--"):
-                        arg = arg[2:]
-                    elif arg.startswith("-"):
-                        arg = arg[1:]
-                    if "=" in arg:
-                        # --foo=bar
-                        git_arg = arg.split("=")
-                        git_args[git_arg[0]] = git_arg[1]
-                    else:
-                        if i+1 < len(args) and not args[i+1].startswith("-"):
-                            # --foo bar
-                            git_args[arg] = args[i+1]
-                        else:
-                            # --foo
-                            git_args[arg] = True
-                else:
-                    # item is a parameter to the previous argument, not an argument itself
-                    pass
-            logger.debug(f"Git arguments: {pformat(git_args)}")
+    def update_object_cache(self, package_url):
+        """Brings the object cache's mirror of a repository up to date, if there's a cache. Returns the mirror's path or None."""
+        object_cache = self.get_object_cache()
+        if object_cache is None:
+            return None
+        return object_cache.update(package_url)
 
-        # clone repository
+    @staticmethod
+    def clone_package(package_url, package_name, package_location, git_args, progress=None, reference=None):
+        """Clones a repository, borrowing objects from the `reference` repository if there is one. Returns True if the clone succeeded.
+
+        The clone's progress is shown on `progress` (a ProgressDisplay) if given.
+        """
         logger.info(f"Cloning repository {package_name}")
+        if reference is not None:
+            logger.debug(f"Borrowing objects from {reference}")
+            git_args = dict(git_args, reference=reference)
         try:
-            Repo.clone_from(package_url, package_location, progress=UpdateProgress(), **git_args)
+            with timings.span("clone", package=package_name):
+                if progress is None:
+                    Repo.clone_from(package_url, package_location, **git_args)
+                else:
+                    with progress.task(package_name) as task:
+                        Repo.clone_from(package_url, package_location, progress=UpdateProgress(task), **git_args)
         except:
-            logger.exception("Could not clone the repository")
+            logger.exception(f"Could not clone the repository {package_name}")
             return False
-        UpdateProgress.clear_line()
-        logger.debug("Clone successful")
-
-        # add package to package list
-        logger.debug("Adding package to package list")
-        package_list[package_name] = package
-        self.write_package_list(package_list)
-        logger.info("Saved package information")
-        
+        logger.debug(f"Clone of {package_name} successful")
         return True
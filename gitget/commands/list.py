@@ -1,6 +1,12 @@
 from ._base import Base
 from loguru import logger
-from tabulate import tabulate
+from ._packagefilter import select_packages
+from ._packagestore import encode_package
+from ._timings import timings
+from os import devnull, dup2, open as os_open, O_WRONLY
+import csv
+import json
+import sys
 
 
 class List(Base):
@@ -8,33 +14,109 @@ class List(Base):
 
     Lists all packages and install locations.
 
+    The `jsonl`, `tsv-stream` and `csv` formats are written to standard
+    output one package at a time, as the package list is read, rather than as
+    a table. `jsonl` has every field of each package. (tabulate's `tsv` is a
+    table like the others.)
+
+    Packages can be narrowed down with `--filter` expressions, `<field><op><value>`
+    with `=`, `!=`, `~` (contains), `<`, `<=`, `>` or `>=`, on fields like
+    name, owner, url, description, license, topics, language, stars, forks
+    and last_commit_at (dates in ISO format). `--sort` orders them by a
+    field (descending with a `-` prefix) and `--limit` keeps the first ones.
+
+    With `--all-workspaces`, the packages of every registered workspace are
+    listed, one table per workspace (the filters, sort and limit apply to
+    each one). The `jsonl`, `tsv-stream` and `csv` formats get a `workspace` field.
+
     Usage: gitget [global options] [options] list
 
     Options:
-        --format   Table format to pass to tabulate (default: mixed_grid)
+        --format   Table format to pass to tabulate (default: mixed_grid), or jsonl, tsv-stream or csv
         --no-wrap  Do not wrap lines in the table
         --width    Width of the table (default: 188)
+        --filter   Only lists the packages matching an expression (can be repeated)
+        --sort     Field to sort the packages by, prefixed with `-` for descending order
+        --limit    Maximum number of packages to list
+        --all-workspaces  Lists the packages of every registered workspace
 
     Examples:
         gitget list
-        gitget --format tsv --no-wrap list
+        gitget --format tsv list
         gitget --format html list
+        gitget --format jsonl list
+        gitget --format tsv-stream list
+        gitget --filter topics=cli --filter 'stars>=100' --sort=-stars --limit 20 list
+        gitget --format csv --filter license~mit --filter 'last_commit_at<2023-01-01' list
+        gitget --all-workspaces --format jsonl --filter topics=cli list
     """
 
+    # formats written row by row instead of through tabulate
+    streaming_formats = ("jsonl", "tsv-stream", "csv")
+
+    headers = ["Package Name", "Path", "Last Commit", "URL", "Description", "Topics", "License"]
+    # the same columns, as the header of `tsv-stream` and `csv` output
+    fields = ["name", "path", "last_commit_at", "url", "description", "topics", "license"]
+
     def run(self):
+        all_workspaces = self.options.get("--all-workspaces")
+        if all_workspaces:
+            # each workspace's package list is loaded as it's reached
+            package_lists = ((workspace, workspace.get_package_list()) for workspace in self.get_workspace_commands())
+        else:
+            package_list = self.get_package_list()
 
-        package_list = self.get_package_list()
+            # print message if no content in package List
+            logger.debug("Checking if package list is empty")
+            if not package_list:
+                logger.info("Package list is empty")
+                return 0
+            package_lists = [(self, package_list)]
 
-        # print message if no content in package List
-        logger.debug("Checking if package list is empty")
-        if not package_list:
-            logger.info("Package list is empty")
+        table_format = self.options["--format"]
+        if not table_format:
+            table_format = "mixed_grid"
+
+        if table_format in List.streaming_formats:
+            rows = (
+                row
+                for workspace, package_list in package_lists
+                for row in List.get_rows(workspace.select_packages(package_list), table_format, workspace.workspace)
+            )
+            with timings.span("write rows"):
+                List.write_records(rows, table_format, ["workspace"] + List.fields if all_workspaces else List.fields)
             return 0
 
+        for workspace, package_list in package_lists:
+            workspace.print_table(package_list, table_format)
+
+    def select_packages(self, package_list):
+        """Returns the (name, package) pairs of the packages to list, per `--filter`, `--sort` and `--limit`."""
+        limit = self.options.get("--limit")
+        try:
+            return select_packages(
+                package_list,
+                self.options.get("--filter") or [],
+                self.options.get("--sort"),
+                int(limit) if limit is not None else None,
+            )
+        except ValueError as ex:
+            logger.error(ex)
+            exit(1)
+
+    def print_table(self, package_list, table_format):
+        """Prints the packages of a package list as a table."""
+        in_workspace = f" in {self.workspace}" if self.workspace is not None else ""
+        if not package_list:
+            logger.info(f"Package list{in_workspace} is empty")
+            return
+
+        packages = self.select_packages(package_list)
+
         # create the table, trimming each section
         logger.debug("Creating table for printing")
         table = []
-        for package_name, package in package_list.items():
+        for package_name, package in packages:
             path = package["path"]
             url = package["url"] if package["url"] else ""
             description = package["description"] if package["description"] else ""
@@ -43,10 +125,6 @@ class List(Base):
             license = package["license"]["name"] if package["license"] else ""
             table.append([package_name, path, last_commit, url, description, topics, license])
 
-        table_format = self.options["--format"]
-        if not table_format:
-            table_format = "mixed_grid"
-
         width = 188
         if self.options["--width"]:
             width = int(self.options["--width"])
@@ -56,9 +134,65 @@ class List(Base):
             maxcolwidths = [None] * 7
 
         logger.debug("Printing table")
-        number_str = f"{len(package_list)} packages:"
-        table = tabulate(table,
-                         headers=["Package Name", "Path", "Last Commit", "URL", "Description", "Topics", "License"],
-                         maxcolwidths=maxcolwidths,
-                         tablefmt=table_format)
+        if len(table) == len(package_list):
+            number_str = f"{len(table)} packages{in_workspace}:"
+        else:
+            number_str = f"{len(table)} of {len(package_list)} packages{in_workspace}:"
+        # tabulate is slow to import, and not needed for the streaming formats
+        from tabulate import tabulate
+
+        with timings.span("render table"):
+            table = tabulate(table,
+                             headers=List.headers,
+                             maxcolwidths=maxcolwidths,
+                             tablefmt=table_format)
         logger.info(f"{number_str}\n\n{table}\n")
+
+    @staticmethod
+    def get_rows(packages, row_format, workspace=None):
+        """Returns the rows for packages in `jsonl`, `tsv-stream` or `csv` format, with their workspace first if there is one."""
+        if row_format == "jsonl":
+            if workspace is not None:
+                return (dict(encode_package(package), name=package_name, workspace=workspace) for package_name, package in packages)
+            return (dict(encode_package(package), name=package_name) for package_name, package in packages)
+        return (
+            ([workspace] if workspace is not None else []) + [
+                package_name,
+                package["path"],
+                package["last_commit_at"].isoformat() if package["last_commit_at"] else "",
+                package["url"] or "",
+                package["description"] or "",
+                ",".join(package["topics"]) if package["topics"] else "",
+                package["license"]["name"] if package["license"] else "",
+            ]
+            for package_name, package in packages
+        )
+
+    @staticmethod
+    def write_records(rows, row_format, fields):
+        """Writes rows to standard output as they come.
+
+        For `jsonl`, rows are dicts written as JSON; for `tsv-stream` and `csv`,
+        they're lists of values, after a header with the names of the fields.
+        """
+        output = sys.stdout
+        try:
+            if row_format == "jsonl":
+                for row in rows:
+                    output.write(json.dumps(row) + "\n")
+                return
+
+            if row_format == "csv":
+                writer = csv.writer(output)
+                write_row = writer.writerow
+            else:
+                # tabs and line breaks can't appear in TSV values
+                def write_row(row):
+                    output.write("\t".join(" ".join(str(value).split()) for value in row) + "\n")
+
+            write_row(fields)
+            for row in rows:
+                write_row(row)
+        except BrokenPipeError:
+            # the reader (e.g. `head`) went away, stop quietly rather than failing again when stdout is flushed at exit
+            dup2(os_open(devnull, O_WRONLY), output.fileno())
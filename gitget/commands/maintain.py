@@ -0,0 +1,116 @@
+from ._base import Base
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from os import cpu_count, path
+from time import perf_counter
+from ._maintenance import MaintenanceState, format_size, get_object_store_size, maintain_repository
+from ._repositorycheck import get_git_dirpath, get_git_state
+from ._timings import timings
+
+
+class Maintain(Base):
+    """Maintain.
+
+    Runs incremental maintenance on the repositories of the packages, `--jobs`
+    at a time (by default, one per two CPUs): unreachable loose objects are
+    pruned, the others are packed, small packs are consolidated behind a
+    multi-pack-index, and the commit-graph and packed refs are updated. Git
+    runs at a lower priority, and the CPUs are shared between the jobs for
+    repacking.
+
+    Packages maintained less than `--interval` hours ago (24 by default), or
+    whose repository hasn't changed since, are skipped; `--interval 0`
+    maintains every package. When each package was maintained is kept in
+    `.gitget-cache`. The time spent on each package, and how much smaller
+    its objects got, are reported.
+
+    Usage: gitget [global options] [--jobs=<n>] [--interval=<hours>] maintain [<package_names>...]
+
+    Examples:
+        gitget maintain
+        gitget --jobs 2 maintain
+        gitget --interval 0 maintain awesmubarak_git-get
+    """
+
+    # hours since a package was last maintained before it's maintained again
+    default_interval = 24
+
+    def run(self):
+        package_list = self.get_package_list()
+        package_names = self.options.get("<package_names>") or list(package_list)
+        for package_name in package_names:
+            if package_name not in package_list:
+                logger.error(f"Package {package_name} not in package list")
+                exit(1)
+        if not package_names:
+            logger.info("Package list is empty")
+            return 0
+
+        interval = self.options.get("--interval")
+        try:
+            interval = float(interval) if interval is not None else Maintain.default_interval
+        except ValueError:
+            logger.error(f"Invalid interval: {interval}")
+            exit(1)
+
+        cpus = cpu_count() or 1
+        jobs = self.get_jobs(default=max(1, cpus // 2))
+        pack_threads = max(1, cpus // jobs)
+        state = MaintenanceState(path.join(Base.get_cache_dirpath(self.get_package_list_filepath()), "maintain.json"))
+        logger.debug(f"Maintaining {len(package_names)} repositories with {jobs} job(s) of {pack_threads} thread(s)")
+
+        started = perf_counter()
+        maintained = skipped = failed = reclaimed = 0
+        with timings.span("maintain repositories"), ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(
+                lambda package_name: Maintain.maintain_package(package_name, package_list[package_name], state, interval * 3600, pack_threads),
+                package_names,
+            )
+            for package_name, result in zip(package_names, results):
+                if result is None:
+                    skipped += 1
+                elif result is False:
+                    failed += 1
+                else:
+                    duration, size_before, size_after = result
+                    maintained += 1
+                    reclaimed += size_before - size_after
+                    logger.info(f"Maintained {package_name} in {duration:.1f}s: {format_size(size_before)} -> {format_size(size_after)}")
+        state.prune(package_list)
+        state.save()
+
+        logger.info(
+            f"{maintained}/{len(package_names)} packages maintained in {perf_counter() - started:.1f}s, "
+            f"{skipped} maintained recently or unchanged (skipped), {failed} failed. "
+            + (f"{format_size(reclaimed)} reclaimed." if reclaimed >= 0 else f"Objects grew by {format_size(-reclaimed)}.")
+        )
+        if failed:
+            exit(1)
+
+    @staticmethod
+    def maintain_package(package_name, package, state, interval, pack_threads):
+        """Maintains one package's repository if it's due.
+
+        Returns (duration, size before, size after), None if it was skipped,
+        or False if it failed.
+        """
+        git_dirpath = get_git_dirpath(package["path"])
+        if git_dirpath is None:
+            logger.error(f"The path for the package {package_name} is not a git repository")
+            return False
+        if not state.is_due(package_name, package, get_git_state(git_dirpath), interval):
+            logger.debug(f"Package {package_name} maintained recently, skipping")
+            return None
+
+        size_before = get_object_store_size(git_dirpath)
+        started = perf_counter()
+        try:
+            with timings.span("maintain repository", package=package_name):
+                maintain_repository(package["path"], pack_threads)
+        except Exception as ex:
+            logger.error(f"Could not maintain {package_name}: {ex}")
+            return False
+        duration = perf_counter() - started
+        size_after = get_object_store_size(git_dirpath)
+        state.put(package_name, package, get_git_state(git_dirpath), duration, size_before, size_after)
+        return duration, size_before, size_after
@@ -31,7 +31,6 @@ class Remove(Base):
 
     def run(self):
         package_list = self.get_package_list()
-        inv_package_list = { package["path"]: package for package_name, package in package_list.items() }
         package_name = self.options["<package_name>"]
         soft_remove = self.options["--soft"]
 
@@ -39,8 +38,9 @@ class Remove(Base):
         logger.debug("Checking if package in package list")
         if not package_name in package_list:
             package_path = os.path.abspath(package_name)
-            if package_path in inv_package_list:
-                package_name = inv_package_list[package_path]["name"]
+            package_names = Base.find_package_names_by_paths(package_list, [package_path])
+            if package_path in package_names:
+                package_name = package_names[package_path]
             else:
                 logger.error("Package name not in package list")
                 exit(1)
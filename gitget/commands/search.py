@@ -0,0 +1,99 @@
+from ._base import Base
+from loguru import logger
+from os import path, makedirs
+from .list import List
+from ._searchindex import SearchIndex
+from ._timings import timings
+
+
+class Search(Base):
+    """Search.
+
+    Searches the names, descriptions, topics, languages and owners of the
+    packages. Every word must match; a word can be limited to one field
+    (`topic:rust`, `language:go`, `owner:`, `name:`, `description:`) and end
+    with `*` to match the start of words. The best matches come first.
+
+    Searches go through an index in `.gitget-cache`, which is built the
+    first time and then kept up to date whenever packages change, so the
+    package file isn't read unless it was changed outside of gitget.
+
+    Usage: gitget [global options] [--format=<tabulate-format>] [--limit=<n>] search <query>...
+
+    Examples:
+        gitget search parser
+        gitget search topic:rust parser
+        gitget --format jsonl --limit 100 search 'pars*' language:python
+    """
+
+    # results shown without --limit
+    default_limit = 20
+
+    headers = ["Package Name", "Score", "Stars", "URL", "Description"]
+    # the columns of `tsv-stream` and `csv` output
+    fields = ["name", "score", "stars", "path", "url", "description"]
+
+    def run(self):
+        query = " ".join(self.options["<query>"])
+        package_list_filepath = self.get_package_list_filepath()
+        if Base.check_package_list_file(package_list_filepath) != 0:
+            # get_package_list reports what's wrong with the package file
+            self.get_package_list()
+
+        limit = self.options.get("--limit")
+        try:
+            limit = int(limit) if limit is not None else Search.default_limit
+        except ValueError:
+            logger.error(f"Invalid limit: {limit}")
+            exit(1)
+
+        filepath = Base.get_search_index_filepath(package_list_filepath)
+        try:
+            makedirs(path.dirname(filepath), exist_ok=True)
+            index = SearchIndex(filepath)
+        except Exception as ex:
+            logger.error(f"Could not open the search index {filepath}:")
+            logger.error(ex)
+            exit(1)
+
+        try:
+            self.update_index(index)
+            with timings.span("search"):
+                results = index.search(query, limit)
+        except ValueError as ex:
+            logger.error(ex)
+            exit(1)
+        finally:
+            index.close()
+
+        table_format = self.options["--format"] or "mixed_grid"
+        if table_format in List.streaming_formats:
+            if table_format == "jsonl":
+                rows = results
+            else:
+                rows = ([result[field] if result[field] is not None else "" for field in Search.fields] for result in results)
+            List.write_records(rows, table_format, Search.fields)
+            return 0
+
+        if not results:
+            logger.info(f"No packages match '{query}'")
+            return 0
+        from tabulate import tabulate
+
+        table = [[result["name"], result["score"], result["stars"], result["url"] or "", result["description"] or ""] for result in results]
+        table = tabulate(table, headers=Search.headers, maxcolwidths=[30, None, None, 40, 60], tablefmt=table_format)
+        logger.info(f"{len(results)} matching packages:\n\n{table}\n")
+
+    def update_index(self, index):
+        """Brings the index up to date with the package list, if the package files changed since it was."""
+        if index.get_signature() == Base.get_package_files_signature(self.get_package_list_filepath()):
+            logger.debug("The search index is up to date")
+            return
+        with timings.span("sync search index"), self.get_package_file_lock():
+            package_list = self.get_package_list()
+            # nothing can write to the package files while the lock is held
+            signature = Base.get_package_files_signature(self.get_package_list_filepath())
+            logger.info("Updating the search index")
+            indexed = index.sync(package_list)
+            index.set_signature(signature)
+        logger.debug(f"Search index updated: {indexed} packages")
@@ -7,7 +7,8 @@ class Setup(Base):
     """Setup.
 
     Creates the files gitget needs to function. Only `.gitget.yaml` is needed in
-    the home directory.
+    the home directory. The new package file is registered as a workspace, for
+    `--all-workspaces`.
 
     Usage: gitget [global options] setup
 
@@ -38,3 +39,4 @@ class Setup(Base):
         with open(package_list_path, "w") as file:
             file.write("")
         logger.info(f"Created package file: {package_list_path}")
+        self.get_workspace_registry().add(package_list_path)
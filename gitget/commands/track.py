@@ -1,22 +1,33 @@
 from ._base import Base
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from loguru import logger
-from os import path
+from os import path, scandir
 from glob import glob
+from ._timings import timings, timed
 
 class Track(Base):
     """Track.
 
     Tracks an exsiting package so it can be managed by gitget.
 
-    Usage: gitget [global options] track <package_path>
+    With `--recursive`, every repository under the path is tracked. The tree
+    is walked without descending into repositories (or into directories
+    matching an `--exclude` pattern), the repositories found are looked up
+    `--jobs` at a time and the package file is written once at the end.
+    `--defer-metadata` skips the API entirely; the information about the
+    packages is then fetched by the next `update`.
+
+    Usage: gitget [global options] [--jobs=<n>] [--recursive] [--exclude=<pattern>]... [--defer-metadata] track <package_path>
 
     Examples:
         gitget track 'dev/git-get'
+        gitget --recursive --jobs 8 track ~/src
+        gitget --recursive --exclude=node_modules --exclude='archive/*' --defer-metadata track ~/src
     """
 
     def run(self):
         package_list = self.get_package_list()
-        inv_package_list = { package["path"]: package for package_name, package in package_list.items() }
         package_path = self.options["<package_path>"]
 
         # verify the package path
@@ -24,7 +35,16 @@ class Track(Base):
         package_path = path.abspath(package_path)
         path_exists = path.exists(package_path)
         path_is_dir = path.isdir(package_path)
-        if path_exists and path_is_dir:
+        if self.options.get("--recursive"):
+            if not (path_exists and path_is_dir):
+                logger.error(f"Package path '{package_path}' is not a directory")
+                exit(1)
+            package_paths = Track.find_repositories(package_path, self.options.get("--exclude") or [])
+            if not package_paths:
+                logger.error(f"No repositories found under '{package_path}'")
+                exit(1)
+            logger.info(f"Found {len(package_paths)} repositories under {package_path}")
+        elif path_exists and path_is_dir:
             logger.debug("Package path is valid")
             package_paths = [package_path]
         else:
@@ -38,24 +58,54 @@ class Track(Base):
                 logger.error(f"No packages found matching '{package_path}'")
                 exit(1)
 
-        modified = False
+        tracked_package_names = Base.find_package_names_by_paths(package_list, package_paths)
+        new_package_paths = []
         for package_path in package_paths:
             package_name = path.basename(package_path)
             # verify that the package doesn't already exist in the package list
-            logger.debug("Checking if {package_name} ({package_path}) exists in package list")
+            logger.debug(f"Checking if {package_name} ({package_path}) exists in package list")
             if package_name in package_list:
                 existing_path = package_list[package_name]["path"]
                 logger.warning(f"Package {package_name} ({package_path}) already exists: ({existing_path})")
                 continue
-            if package_path in inv_package_list:
-                existing_name = inv_package_list[package_path]["name"]
+            if package_path in tracked_package_names:
+                existing_name = tracked_package_names[package_path]
                 logger.warning(f"Package {package_name} ({package_path}) already exists as: ({existing_name})")
                 continue
-            package = self.get_package_for_path(package_name, package_path)
-            package_list[package_name] = package
-            inv_package_list[package_path] = package
-            modified = True
-            logger.info(f"Tracked package {package_name} ({package_path})")
+            new_package_paths.append(package_path)
+
+        jobs = self.get_jobs()
+        fetch_metadata = not self.options.get("--defer-metadata")
+        with timings.span("read remotes"), ThreadPoolExecutor(max_workers=jobs) as executor:
+            package_urls = dict(zip(new_package_paths, executor.map(self.read_remote_url, new_package_paths)))
+        if fetch_metadata:
+            logger.debug("Prefetching package information")
+            self.prefetch_packages_for_urls(url for url in package_urls.values() if url is not None)
+
+        new_packages = {}
+        for package_path in new_package_paths:
+            if package_urls[package_path] is None:
+                continue
+            package_name = path.basename(package_path)
+            # several matching paths can share the same name
+            if package_name in package_list or package_name in new_packages:
+                existing_path = package_list[package_name]["path"] if package_name in package_list else new_packages[package_name]
+                logger.warning(f"Package {package_name} ({package_path}) already exists: ({existing_path})")
+                continue
+            new_packages[package_name] = package_path
+
+        modified = False
+        with timings.span("get packages"), ThreadPoolExecutor(max_workers=jobs) as executor:
+            packages = executor.map(
+                lambda item: self.get_new_package(package_urls[item[1]], item[0], item[1], fetch_metadata),
+                new_packages.items(),
+            )
+            for package_name, package in zip(new_packages, packages):
+                if package is None:
+                    continue
+                package_list[package_name] = package
+                modified = True
+                logger.info(f"Tracked package {package_name} ({package['path']})")
 
         # update package list
         if modified:
@@ -64,3 +114,59 @@ class Track(Base):
             logger.info("Saved package information")
         else:
             logger.warning("No new packages were tracked")
+
+    @staticmethod
+    @timed("find repositories")
+    def find_repositories(root, exclude_patterns):
+        """Returns the paths of the repositories under root (root included), in sorted order.
+
+        Directories containing `.git` are repositories and aren't descended
+        into. Directories matching an exclude pattern, by name or by path
+        relative to root, are skipped. Symbolic links aren't followed.
+        """
+        repositories = []
+        directories = [root]
+        while directories:
+            directory = directories.pop()
+            try:
+                with scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError as ex:
+                logger.warning(f"Could not read {directory}: {ex}")
+                continue
+            if any(entry.name == ".git" for entry in entries):
+                repositories.append(directory)
+                continue
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                relative_path = path.relpath(entry.path, root).replace(path.sep, "/")
+                if any(fnmatch(entry.name, pattern) or fnmatch(relative_path, pattern) for pattern in exclude_patterns):
+                    logger.debug(f"Excluding {entry.path}")
+                    continue
+                directories.append(entry.path)
+        return sorted(repositories)
+
+    def read_remote_url(self, package_path):
+        """Returns the remote URL of a repository, or None (with a warning) if it can't be read."""
+        try:
+            return self.get_remote_url(package_path)
+        except SystemExit:
+            # Base reports the error itself before exiting
+            logger.warning(f"Not tracking {package_path}, its remote URL could not be read")
+            return None
+
+    def get_new_package(self, url, package_name, package_path, fetch_metadata):
+        """Returns the package information for a repository, or None if it can't be fetched.
+
+        Runs on a worker thread, so failures are reported by returning None
+        rather than exiting the whole command.
+        """
+        try:
+            return self.get_package_for_url(url, package_name, package_path, fetch_metadata=fetch_metadata)
+        except SystemExit:
+            # Base reports the error itself before exiting
+            logger.error(f"Package {package_name} ({package_path}) could not be tracked")
+        except Exception:
+            logger.exception(f"Package {package_name} ({package_path}) could not be tracked")
+        return None
@@ -19,7 +19,6 @@ class Untrack(Base):
 
     def run(self):
         package_list = self.get_package_list()
-        inv_package_list = { package["path"]: package for package_name, package in package_list.items() }
         package_name = self.options["<package_name>"]
 
         # check if package exists
@@ -27,8 +26,9 @@ class Untrack(Base):
         if not package_name in package_list:
             # The user may have provided the path instead of the name
             package_path = os.path.abspath(package_name)
-            if package_path in inv_package_list:
-                package_name = inv_package_list[package_path]["name"]
+            package_names = Base.find_package_names_by_paths(package_list, [package_path])
+            if package_path in package_names:
+                package_name = package_names[package_path]
             else:
                 logger.error("Package name not in package list")
                 exit(1)
@@ -1,9 +1,10 @@
 from ._base import Base
 from loguru import logger
-from os import getcwd
-import shlex
-from pprint import pformat
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 import git
+from ._progress import ProgressDisplay
+from ._timings import timings, timed
 from ._updateprogress import UpdateProgress
 
 
@@ -11,70 +12,242 @@ class Update(Base):
     """Update.
 
     Runs `git-pull` on all packages in the package list to update them.
+    With `--jobs`, several packages are updated at the same time. The
+    progress of each pull is shown on its own line, under a bar for all
+    the packages.
 
-    Usage: gitget [global options] [--git-pull-args=<additional-arguments>] update
+    Packages are first checked with `git ls-remote`, and those that already
+    have the remote's latest commit are not pulled. `--always-pull` pulls
+    every package regardless.
+
+    Packages installed with `--object-cache` have their mirror updated
+    before they're pulled, when the same `--object-cache` is given.
+
+    The package information is refreshed from the GitHub and GitLab APIs
+    once every package was pulled, in a batch (`--metadata-jobs` at a time),
+    according to `--metadata`: `never`, `stale` (the default) for packages
+    whose information was fetched more than `--metadata-max-age` hours ago
+    (24 by default) or never was, or `always`.
+
+    With `--all-workspaces`, the packages of every registered workspace are
+    updated together: they share the `--jobs` and the API clients, and their
+    information is prefetched in the same batches.
+
+    Usage: gitget [global options] [--git-pull-args=<additional-arguments>] [--jobs=<n>] [--always-pull] [--object-cache=<directory>] [--metadata=<policy>] [--metadata-max-age=<hours>] [--metadata-jobs=<n>] [--all-workspaces] update
 
     Examples:
         gitget update
+        gitget --jobs 8 update
+        gitget --always-pull update
+        gitget --metadata never update
+        gitget --metadata always --metadata-jobs 8 update
+        gitget --all-workspaces --jobs 16 update
     """
 
+    # ls-remote checks are cheap, so they run with at least this many workers
+    precheck_jobs = 16
+
+    # when package information is refreshed (`--metadata`)
+    metadata_policies = ("never", "stale", "always")
+    # hours after which package information is stale
+    default_metadata_max_age = 24
+
     def run(self):
-        package_list = self.get_package_list()
-        number_of_packages = len(package_list)
+        workspaces = self.get_workspace_commands() if self.options.get("--all-workspaces") else [self]
+        package_lists = [(workspace, workspace.get_package_list()) for workspace in workspaces]
+        # (workspace, package list, package name) for every package of every workspace
+        packages = [(workspace, package_list, package_name) for workspace, package_list in package_lists for package_name in package_list]
+        number_of_packages = len(packages)
 
         logger.debug("Making sure there are some packages to update")
         if number_of_packages == 0:
             logger.info("No packages to update")
             exit(0)
 
-        git_args = {}
-        if self.options["--git-pull-args"] is not None:
-            args = shlex.split(self.options["--git-pull-args"])
-            for i, arg in enumerate(args):
-                if arg.startswith("-"):
-                    if arg.startswith("--"):
-                        arg = arg[2:]
-                    elif arg.startswith("-"):
-                        arg = arg[1:]
-                    if "=" in arg:
-                        # --foo=bar
-                        git_arg = arg.split("=")
-                        git_args[git_arg[0]] = git_arg[1]
-                    else:
-                        if i+1 < len(args) and not args[i+1].startswith("-"):
-                            # --foo bar
-                            git_args[arg] = args[i+1]
-                        else:
-                            # --foo
-                            git_args[arg] = True
-                else:
-                    # item is a parameter to the previous argument, not an argument itself
-                    pass
-            logger.debug(f"Git arguments: {pformat(git_args)}")
+        metadata_policies = {workspace: workspace.get_metadata_policy() for workspace in workspaces}
+        git_args = {workspace: Base.parse_git_args(workspace.options["--git-pull-args"]) for workspace in workspaces}
+        jobs = self.get_jobs()
+        logger.debug(f"Updating with {jobs} job(s)")
+
+        up_to_date_packages = set()
+        if not self.options.get("--always-pull"):
+            logger.debug("Checking which packages have new commits")
+            with timings.span("check for new commits"), ThreadPoolExecutor(max_workers=max(jobs, self.precheck_jobs)) as executor:
+                futures = {
+                    executor.submit(Update.is_up_to_date, package_list[package_name]["path"]): (workspace, package_name)
+                    for workspace, package_list, package_name in packages
+                }
+                for future in as_completed(futures):
+                    if future.result():
+                        up_to_date_packages.add(futures[future])
+            logger.debug(f"{len(up_to_date_packages)} packages are already up to date")
 
         logger.debug("Going through each package")
-        packages_succeeded = 0
+        packages_updated = 0
+        packages_skipped = 0
         packages_failed = 0
-        for package_number, package_name in enumerate(package_list):
-            package = package_list[package_name]
-            package_path = package["path"]
+        with timings.span("update packages"), ProgressDisplay(number_of_packages, "Updating") as progress, ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    workspace.update_package, package_number, package_name, package_list[package_name], number_of_packages,
+                    git_args[workspace], progress, (workspace, package_name) not in up_to_date_packages,
+                ): (workspace, package_name)
+                for package_number, (workspace, package_list, package_name) in enumerate(packages)
+            }
+            for future in as_completed(futures):
+                progress.advance()
+                if not future.result():
+                    packages_failed += 1
+                elif futures[future] in up_to_date_packages:
+                    packages_skipped += 1
+                else:
+                    packages_updated += 1
+        in_workspaces = f" in {len(workspaces)} workspaces" if len(workspaces) > 1 else ""
+        logger.info(f"{packages_updated}/{number_of_packages} packages updated{in_workspaces}, {packages_skipped} up to date (skipped), {packages_failed} failed.")
 
-            progress = f"[{package_number+1}/{number_of_packages}]"
-            logger.info(f"Updating {package_name}  {progress}")
+        workspace_packages = []
+        for workspace, package_list in package_lists:
+            package_names = workspace.get_packages_to_refresh(package_list, *metadata_policies[workspace])
+            if package_names:
+                workspace_packages.append((workspace, package_list, package_names))
+        if workspace_packages:
+            # through a workspace, for the API options of its configuration
+            workspace_packages[0][0].refresh_packages(workspace_packages)
+            for workspace, package_list, _ in workspace_packages:
+                workspace.write_package_list(package_list)
 
-            try:
-                package = self.get_package_for_path(package_name, package_path)
-                package_list[package_name] = package
+    def get_metadata_policy(self):
+        """Returns the `--metadata` policy and `--metadata-max-age` (in hours) of the command."""
+        metadata_policy = self.options.get("--metadata") or "stale"
+        if metadata_policy not in Update.metadata_policies:
+            logger.error(f"Invalid metadata policy: {metadata_policy} (use {', '.join(Update.metadata_policies)})")
+            exit(1)
+        metadata_max_age = self.options.get("--metadata-max-age")
+        try:
+            metadata_max_age = float(metadata_max_age) if metadata_max_age is not None else Update.default_metadata_max_age
+        except ValueError:
+            logger.error(f"Invalid metadata max age: {metadata_max_age}")
+            exit(1)
+        return metadata_policy, metadata_max_age
+
+    def get_packages_to_refresh(self, package_list, metadata_policy, metadata_max_age):
+        """Returns the names of the packages whose information should be refreshed under a `--metadata` policy."""
+        if metadata_policy == "never":
+            return []
+        if metadata_policy == "always":
+            return list(package_list)
+        stale_before = datetime.now(timezone.utc) - timedelta(hours=metadata_max_age)
+        package_names = []
+        for package_name, package in package_list.items():
+            # the information of other hosts can't be fetched, it's never stale
+            if not package.get("url") or self.get_provider(package["url"]) is None:
+                continue
+            fetched_at = package.get("metadata_fetched_at")
+            if fetched_at is not None and fetched_at.tzinfo is None:
+                fetched_at = fetched_at.replace(tzinfo=timezone.utc)
+            if fetched_at is None or fetched_at < stale_before:
+                package_names.append(package_name)
+        logger.debug(f"{len(package_names)} packages have stale information")
+        return package_names
 
+    @timed("refresh package information")
+    def refresh_packages(self, workspace_packages):
+        """Refreshes the information of packages, `--metadata-jobs` at a time, after prefetching it in batches where possible.
+
+        `workspace_packages` are (workspace, package list, names of the
+        packages to refresh), where the workspace is this command or one
+        sharing its clients. Packages whose information can't be refreshed
+        keep the information they had.
+        """
+        packages = [
+            (workspace, package_list, package_name)
+            for workspace, package_list, package_names in workspace_packages
+            for package_name in package_names
+        ]
+        logger.info(f"Refreshing the information of {len(packages)} packages")
+        self.prefetch_workspace_packages({
+            workspace: [package_list[package_name]["url"] for package_name in package_names if package_list[package_name].get("url")]
+            for workspace, package_list, package_names in workspace_packages
+        })
+        with ThreadPoolExecutor(max_workers=self.get_jobs("--metadata-jobs", default=4)) as executor:
+            results = executor.map(
+                lambda entry: entry[0].refresh_package(entry[2], entry[1][entry[2]]),
+                packages,
+            )
+            for (workspace, package_list, package_name), package in zip(packages, results):
+                if package is not None:
+                    package_list[package_name] = package
+
+    def refresh_package(self, package_name, package):
+        """Returns the refreshed information of a package, or None if it couldn't be refreshed."""
+        try:
+            return self.get_package_for_path(package_name, package["path"], package)
+        except Exception:
+            logger.exception(f"Could not refresh the information of {self.get_package_label(package_name)}")
+        except SystemExit:
+            # Base reports the error itself before exiting
+            logger.error(f"Could not refresh the information of {self.get_package_label(package_name)}")
+        return None
+
+    @staticmethod
+    def is_up_to_date(package_path):
+        """Checks whether the remote tip of the current branch is already merged locally.
+
+        Asks the remote for a single ref with `git ls-remote`, which is much
+        cheaper than a pull. Returns False whenever this can't be determined.
+        """
+        try:
+            with timings.span("ls-remote", package=package_path):
                 repo = git.Repo(package_path)
-                origins = repo.remotes.origin
-                origins.pull(progress=UpdateProgress(), **git_args)
-                UpdateProgress.clear_line()
-                packages_succeeded += 1
-                logger.debug("Package updated successfully")
+                origin = repo.remotes.origin
+                remote_ref = "HEAD"
+                if not repo.head.is_detached:
+                    tracking_branch = repo.active_branch.tracking_branch()
+                    if tracking_branch is not None and tracking_branch.remote_name == origin.name:
+                        remote_ref = f"refs/heads/{tracking_branch.remote_head}"
+                output = repo.git.ls_remote(origin.name, remote_ref)
+                if not output:
+                    return False
+                remote_commit = output.split()[0]
+                # fails if the commit isn't in HEAD's history (or isn't known locally at all)
+                repo.git.merge_base("--is-ancestor", remote_commit, "HEAD")
+            logger.debug(f"{package_path} already has {remote_ref} ({remote_commit})")
+            return True
+        except Exception as ex:
+            logger.debug(f"{package_path} needs to be pulled: {ex}")
+            return False
+
+    def update_package(self, package_number, package_name, package, number_of_packages, git_args, progress=None, pull=True):
+        """Pulls the package (unless `pull` is False), showing the pull's progress on `progress` (a ProgressDisplay) if given.
+
+        Runs on a worker thread, so failures are logged and reported by
+        returning False rather than exiting the whole command.
+        """
+        package_path = package["path"]
+
+        logger.info(f"Updating {self.get_package_label(package_name)}  [{package_number+1}/{number_of_packages}]")
+
+        with timings.span("update package", package=package_name):
+            try:
+                if not pull:
+                    logger.debug(f"Package {package_name} is already up to date")
+                    return True
+
+                object_cache = self.get_object_cache()
+                if object_cache is not None and object_cache.uses(package_path):
+                    # objects the mirror already has (from other forks too) aren't downloaded again
+                    object_cache.update(package["url"])
+
+                with timings.span("pull", package=package_name):
+                    repo = git.Repo(package_path)
+                    origins = repo.remotes.origin
+                    if progress is None:
+                        origins.pull(**git_args)
+                    else:
+                        with progress.task(self.get_package_label(package_name)) as task:
+                            origins.pull(progress=UpdateProgress(task), **git_args)
+                logger.debug(f"Package {package_name} updated successfully")
+                return True
             except Exception:
-                UpdateProgress.clear_line()
-                packages_failed += 1
-                logger.exception(f"Package {package_name} could not be updated")
-        logger.info(f"{packages_succeeded}/{number_of_packages} packages updated, {packages_failed} failed.")
-        self.write_package_list(package_list)
+                logger.exception(f"Package {self.get_package_label(package_name)} could not be updated")
+            return False
@@ -32,5 +32,5 @@ setup(
     keywords="git github gitlab package manager packages package-manager packman repo repository repository-manager clone pull manage update doctor install import move remove rename track untrack list edit setup",
     packages=["gitget", "gitget.commands"],
     entry_points={"console_scripts": ["gitget=gitget:main"]},
-    install_requires=["docopt", "loguru", "gitpython", "pygithub", "python-gitlab", "pyyaml", "tabulate", "semver"],
+    install_requires=["docopt", "loguru", "gitpython", "pygithub", "python-gitlab", "pyyaml", "requests", "tabulate", "semver"],
 )